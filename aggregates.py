@@ -0,0 +1,91 @@
+from datetime import date
+from decimal import Decimal
+from typing import Dict, List, Optional
+from sqlalchemy import select, func, case
+from sqlalchemy.orm import Session
+from models import Bucket, MovementRollup
+from money import ZERO
+
+# Tipos que contam como saída nas métricas do Dashboard
+OUTFLOW_KINDS = ("expense", "transfer")
+
+def monthly_totals(db: Session, user_id: int) -> List[Dict]:
+    # Uma linha por (ano, mês, tipo), lida de movement_rollups: O(meses) linhas
+    stmt = (
+        select(MovementRollup.year, MovementRollup.month, MovementRollup.kind,
+               func.sum(MovementRollup.total).label("total"))
+        .where(MovementRollup.user_id == user_id)
+        .group_by(MovementRollup.year, MovementRollup.month, MovementRollup.kind)
+    )
+    return [
+        {"year": r.year, "month": r.month, "kind": r.kind, "total": r.total or ZERO}
+        for r in db.execute(stmt)
+    ]
+
+def bucket_history(db: Session, user_id: int) -> List[Dict]:
+    # Variação líquida mensal de cada balde (entradas - saídas)
+    net = func.sum(
+        case((MovementRollup.kind == "income", MovementRollup.total), else_=-MovementRollup.total)
+    ).label("net")
+    stmt = (
+        select(MovementRollup.bucket_id, Bucket.name, MovementRollup.year, MovementRollup.month, net)
+        .join(Bucket, Bucket.id == MovementRollup.bucket_id)
+        .where(MovementRollup.user_id == user_id, MovementRollup.kind.in_(("income",) + OUTFLOW_KINDS))
+        .group_by(MovementRollup.bucket_id, Bucket.name, MovementRollup.year, MovementRollup.month)
+        .order_by(MovementRollup.year, MovementRollup.month)
+    )
+    return [
+        {"bucket_id": r.bucket_id, "name": r.name, "year": r.year, "month": r.month, "net": r.net or ZERO}
+        for r in db.execute(stmt)
+    ]
+
+def total_balance(db: Session, user_id: int) -> Decimal:
+    stmt = select(func.coalesce(func.sum(Bucket.balance), ZERO)).where(Bucket.user_id == user_id)
+    return db.execute(stmt).scalar_one()
+
+def dashboard_totals(db: Session, user_id: int, today: Optional[date] = None) -> Dict:
+    today = today or date.today()
+    out = {
+        "total_balance": total_balance(db, user_id),
+        "month_income": ZERO,
+        "month_expense": ZERO,
+        "total_income": ZERO,
+        "total_expense": ZERO,
+    }
+    for r in monthly_totals(db, user_id):
+        if r["kind"] == "income":
+            key = "income"
+        elif r["kind"] in OUTFLOW_KINDS:
+            key = "expense"
+        else:
+            continue
+        out[f"total_{key}"] += r["total"]
+        if r["year"] == today.year and r["month"] == today.month:
+            out[f"month_{key}"] += r["total"]
+    return out
+
+# Baldes cujas entradas alimentam o pagamento dos gigantes
+DEBT_BUCKET_TYPES = ("emprestimo", "cartao", "ataque")
+
+def debt_budget(db: Session, user_id: int, months: int = 3, today: Optional[date] = None) -> Decimal:
+    # Média mensal das entradas nos baldes de dívida nos últimos "months" meses fechados
+    today = today or date.today()
+    y, m = today.year, today.month
+    keys = []
+    for _ in range(months):
+        m -= 1
+        if m == 0:
+            y, m = y - 1, 12
+        keys.append(y * 12 + m)
+    stmt = (
+        select(func.coalesce(func.sum(MovementRollup.total), ZERO))
+        .join(Bucket, Bucket.id == MovementRollup.bucket_id)
+        .where(
+            MovementRollup.user_id == user_id,
+            MovementRollup.kind == "income",
+            Bucket.type.in_(DEBT_BUCKET_TYPES),
+            (MovementRollup.year * 12 + MovementRollup.month).between(min(keys), max(keys)),
+        )
+    )
+    total = db.execute(stmt).scalar_one()
+    return (Decimal(total) / months).quantize(Decimal("0.01"))
@@ -0,0 +1,197 @@
+import os
+from contextlib import asynccontextmanager
+from datetime import date
+from decimal import Decimal
+from typing import Annotated, List, Optional
+from fastapi import Depends, FastAPI, Header, HTTPException, Response
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from db import router, UnknownUser
+from models import Bucket, Movement
+from logic import compute_bucket_splits
+import migrations
+import services
+
+# API HTTP sem Streamlit sobre services.py (ex.: webhooks do processador de pagamentos).
+# Rodar: uvicorn api:app --port 8000   (API_TOKEN no ambiente exige "Authorization: Bearer <token>")
+
+API_TOKEN = os.environ.get("API_TOKEN")
+MAX_BATCH = 1000
+
+Money = Annotated[Decimal, Field(gt=0, max_digits=14, decimal_places=2)]
+
+class IncomeIn(BaseModel):
+    total: Money
+    date: date
+    description: Optional[str] = None
+    ref: Optional[str] = Field(None, max_length=64, description="ID externo; reenvio com o mesmo ref é ignorado")
+
+class IncomeBatchIn(BaseModel):
+    items: List[IncomeIn] = Field(min_length=1, max_length=MAX_BATCH)
+
+class IncomeBatchOut(BaseModel):
+    posted: int
+    duplicates: int
+    movements: int
+
+class SplitOut(BaseModel):
+    bucket_id: int
+    name: str
+    percent_effective: float
+    value: Decimal
+
+class TransferIn(BaseModel):
+    orig: int
+    dest: int
+    amount: Money
+    date: date
+    description: str = "Transferência entre baldes"
+    allow_negative: bool = False
+
+class MovementIn(BaseModel):
+    bucket_id: int
+    kind: str = Field(pattern="^(expense|transfer)$")
+    amount: Money
+    date: date
+    description: str = ""
+    allow_negative: bool = False
+
+class BillIn(BaseModel):
+    title: str = Field(min_length=1)
+    amount: Money
+    due_date: date
+    is_critical: bool = False
+    bucket_id: Optional[int] = None
+
+class BillPatch(BaseModel):
+    # Só o que veio no corpo é gravado (exclude_unset); null explícito só vale para bucket_id (os demais dão 422)
+    title: str = Field(None, min_length=1)
+    amount: Money = None
+    due_date: date = None
+    is_critical: bool = None
+    paid: bool = None
+    bucket_id: Optional[int] = None
+
+class BillOut(BaseModel):
+    id: int
+    title: str
+    amount: Decimal
+    due_date: date
+    is_critical: bool
+    paid: bool
+    bucket_id: Optional[int]
+
+class BucketOut(BaseModel):
+    id: int
+    name: str
+    percent: float
+    type: Optional[str]
+    balance: Decimal
+
+class GiantOut(BaseModel):
+    id: int
+    name: str
+    status: str
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    migrations.upgrade(router.catalog)
+    yield
+    router.dispose()
+
+app = FastAPI(title="APP DAVI", lifespan=lifespan)
+
+def check_token(authorization: Optional[str] = Header(None)) -> None:
+    if API_TOKEN and authorization != f"Bearer {API_TOKEN}":
+        raise HTTPException(401, "Token inválido.")
+
+def _call(user_id: int, fn, *args, **kwargs):
+    # Roda a operação síncrona (SQLAlchemy) numa thread, com sessão própria no banco do usuário
+    # (shard ou banco único, conforme STORAGE_MODE), e traduz os erros do domínio
+    def work():
+        try:
+            with router.session(user_id) as db:
+                return fn(db, *args, **kwargs)
+        except (services.BucketNotFound, services.BillNotFound, services.GiantNotFound, UnknownUser) as e:
+            raise HTTPException(404, str(e))
+        except services.InsufficientFunds as e:
+            raise HTTPException(409, str(e))
+        except ValueError as e:
+            raise HTTPException(422, str(e))
+    return run_in_threadpool(work)
+
+def _buckets(db: Session, user_id: int) -> List[Bucket]:
+    return list(db.execute(select(Bucket).where(Bucket.user_id == user_id).order_by(Bucket.id)).scalars())
+
+auth = [Depends(check_token)]
+
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
+
+@app.get("/users/{user_id}/buckets", response_model=List[BucketOut], dependencies=auth)
+async def list_buckets(user_id: int):
+    return await _call(user_id, lambda db: [BucketOut.model_validate(b, from_attributes=True) for b in _buckets(db, user_id)])
+
+def _posted_splits(db: Session, user_id: int, ref: str) -> List[dict]:
+    # Divisão gravada no primeiro envio de "ref" (fingerprints api:<ref>:<j>), com os baldes de hoje
+    rows = db.execute(
+        select(Movement.bucket_id, Bucket.name, Movement.amount)
+        .join(Bucket, Bucket.id == Movement.bucket_id)
+        .where(Movement.user_id == user_id, Movement.fingerprint.startswith(f"api:{ref}:", autoescape=True))
+        .order_by(Movement.bucket_id)
+    ).all()
+    total = sum((r.amount for r in rows), Decimal(0))
+    return [{"bucket_id": r.bucket_id, "name": r.name, "value": r.amount,
+             "percent_effective": round(float(r.amount / total * 100), 2) if total else 0.0} for r in rows]
+
+@app.post("/users/{user_id}/incomes", response_model=List[SplitOut], dependencies=auth)
+async def post_income(user_id: int, body: IncomeIn, response: Response):
+    def op(db: Session):
+        # Mesmo caminho do lote (idempotente com "ref"); a divisão devolvida é a mesma do app.
+        # Reenvio de um ref já lançado: nada é gravado e volta a divisão original (cabeçalho Idempotent-Replayed)
+        buckets = _buckets(db, user_id)
+        report = services.post_incomes(db, user_id, buckets, [body.model_dump()])
+        if report["duplicates"]:
+            response.headers["Idempotent-Replayed"] = "true"
+            return _posted_splits(db, user_id, body.ref)
+        return compute_bucket_splits(buckets, body.total)
+    return await _call(user_id, op)
+
+@app.post("/users/{user_id}/incomes/batch", response_model=IncomeBatchOut, dependencies=auth)
+async def post_income_batch(user_id: int, body: IncomeBatchIn):
+    items = [i.model_dump() for i in body.items]
+    return await _call(user_id, lambda db: services.post_incomes(db, user_id, _buckets(db, user_id), items))
+
+@app.post("/users/{user_id}/transfers", status_code=204, dependencies=auth)
+async def post_transfer(user_id: int, body: TransferIn):
+    await _call(user_id, services.transfer, user_id, body.orig, body.dest, body.amount, body.date,
+                body.description, allow_negative=body.allow_negative)
+
+@app.post("/users/{user_id}/movements", status_code=204, dependencies=auth)
+async def post_movement(user_id: int, body: MovementIn):
+    await _call(user_id, services.post_movement, user_id, body.bucket_id, body.kind, body.amount, body.date,
+                body.description, allow_negative=body.allow_negative)
+
+@app.post("/users/{user_id}/bills", response_model=BillOut, status_code=201, dependencies=auth)
+async def create_bill(user_id: int, body: BillIn):
+    def op(db: Session):
+        b = services.create_bill(db, user_id, **body.model_dump())
+        return BillOut.model_validate(b, from_attributes=True)
+    return await _call(user_id, op)
+
+@app.patch("/users/{user_id}/bills/{bill_id}", response_model=BillOut, dependencies=auth)
+async def update_bill(user_id: int, bill_id: int, body: BillPatch):
+    def op(db: Session):
+        b = services.update_bill(db, user_id, bill_id, **body.model_dump(exclude_unset=True))
+        return BillOut.model_validate(b, from_attributes=True)
+    return await _call(user_id, op)
+
+@app.post("/users/{user_id}/giants/{giant_id}/victory", response_model=GiantOut, dependencies=auth)
+async def giant_victory(user_id: int, giant_id: int):
+    def op(db: Session):
+        g = services.defeat_giant(db, user_id, giant_id)
+        return GiantOut.model_validate(g, from_attributes=True)
+    return await _call(user_id, op)
@@ -1,47 +1,103 @@
-import streamlit as st
-import pandas as pd
+from __future__ import annotations  # anotações não avaliadas: Session/User/Forecast só são importados depois
+
+import os
+import subprocess
+import sys
+import time
 from datetime import date, timedelta
-from sqlalchemy.orm import Session
-from sqlalchemy import select
-from db import engine, SessionLocal, Base
-from models import User, Bucket, Giant, Movement, Bill
-from logic import compute_bucket_splits, payoff_efficiency, normalize_percents
-
-from babel.numbers import format_currency
-from babel.dates import format_date
-
-# ---- Helpers BR ----
-def money_br(v: float) -> str:
-    try:
-        return format_currency(v, 'BRL', locale='pt_BR')
-    except Exception:
-        # fallback
-        s = f"{v:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-        return f"R$ {s}"
-
-def date_br(d) -> str:
-    try:
-        return format_date(d, format='short', locale='pt_BR')  # dd/mm/aa
-    except Exception:
-        return d.strftime('%d/%m/%y')
-
-def parse_money_br(s: str) -> float:
-    if s is None:
-        return 0.0
-    s = s.strip().replace('.', '').replace(',', '.')
-    try:
-        return float(s)
-    except Exception:
-        return 0.0
+from typing import TYPE_CHECKING
+import streamlit as st
+
+if TYPE_CHECKING:
+    from sqlalchemy.orm import Session
+    from models import User
+    import forecast
+
+# Partida a frio: o Streamlit reexecuta este arquivo a cada rerun, mas cada import só custa na primeira vez do processo.
+# Até o login só o streamlit; a camada de dados (SQLAlchemy, models, services) entra com o usuário logado;
+# pandas, Altair e os módulos NumPy (simulador, previsão) só quando a página que usa abre.
+# Esquema/migrações: uma vez por processo em get_router (banco já na última versão = uma leitura de PRAGMA).
 
 # ---- App config ----
 st.set_page_config(page_title="APP DAVI", layout="wide")
-Base.metadata.create_all(bind=engine)
+
+@st.cache_resource
+def get_router():
+    # Uma vez por processo (compartilhado entre reruns e sessões): esquema do banco principal + roteador.
+    # Shards de usuário (STORAGE_MODE=sharded) são migrados e instrumentados quando abertos.
+    from db import router
+    import instrument
+    import migrations
+    migrations.upgrade(router.catalog)
+    router.add_hook(instrument.install)
+    return router
+
+@st.cache_resource
+def get_workers():
+    # Pool de jobs.py subido junto com o app (sai sozinho quando este processo morre).
+    # JOBS_WORKERS=0: os workers rodam à parte (python jobs.py worker), p.ex. em outra máquina com o mesmo banco.
+    if jobs.JOBS_WORKERS <= 0:
+        return None
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "jobs.py")
+    return subprocess.Popen([sys.executable, script, "worker", "--processes", str(jobs.JOBS_WORKERS),
+                             "--parent", str(os.getpid())])
+
+def submit_job(user_id: int, kind: str, params=None) -> None:
+    # Só enfileira: quem executa é o pool de workers, fora da thread do rerun
+    get_workers()
+    with get_router().session() as db:
+        jobs.submit(db, user_id, kind, params)
+    st.toast(f"Tarefa enfileirada: {jobs.LABELS[kind]}")
+
+@st.fragment(run_every=2)
+def jobs_panel(user_id: int, kinds) -> None:
+    # Progresso das tarefas do usuário; só este trecho é reexecutado a cada 2s
+    with get_router().session() as db:
+        items = [j for j in jobs.recent(db, user_id) if j["kind"] in kinds]
+    for j in items[:3]:
+        label = f"{jobs.LABELS[j['kind']]} · #{j['id']}"
+        if j["status"] in jobs.ACTIVE:
+            st.progress(j["progress"], text=f"{label}: {j['message']}")
+        elif j["status"] == "failed":
+            st.error(f"{label}: {j['error'] or j['message']}")
+        else:
+            st.caption(f"{label}: {j['message']}")
+            if j["result_path"] and os.path.exists(j["result_path"]):
+                with open(j["result_path"], "rb") as f:
+                    st.download_button("Baixar arquivo", data=f, file_name=j["result_name"], key=f"job_dl_{j['id']}")
 
 def get_db() -> Session:
-    return SessionLocal()
+    # Sessão no banco do usuário logado (sem usuário: banco principal)
+    return get_router().session(st.session_state.get("user_id"))
+
+FORECAST_DAYS = 90
+
+def get_forecast(db: Session, user_id: int) -> forecast.Forecast:
+    # Projeção guardada na sessão, atrelada à versão dos dados do usuário
+    import forecast
+    key = (user_id, cache.read_cache.version(user_id), date.today())
+    entry = st.session_state.get("forecast")
+    if not entry or entry[0] != key:
+        entry = (key, forecast.build(db, user_id, days=FORECAST_DAYS, buckets=load_buckets(db, user_id)))
+        st.session_state["forecast"] = entry
+    return entry[1]
+
+def save_bill(db: Session, user_id: int, bill_id, **fields) -> None:
+    # Cria/atualiza a conta; se a projeção estava em dia, recalcula só o trecho a partir do vencimento
+    before = cache.read_cache.version(user_id)
+    if bill_id is None:
+        bill = services.create_bill(db, user_id, **fields)
+    else:
+        bill = services.update_bill(db, user_id, bill_id, **fields)
+    cache.invalidate(user_id)
+    entry = st.session_state.get("forecast")
+    if entry and entry[0] == (user_id, before, date.today()):
+        entry[1].put_bill(bill)
+        st.session_state["forecast"] = ((user_id, cache.read_cache.version(user_id), date.today()), entry[1])
 
 def get_or_create_user(db: Session, name: str) -> User:
+    from sqlalchemy import select
+    from models import User
     u = db.execute(select(User).where(User.name == name)).scalar_one_or_none()
     if u:
         return u
@@ -52,380 +108,688 @@ def get_or_create_user(db: Session, name: str) -> User:
     return u
 
 # ---- Sidebar ----
+PAGES = ["Dashboard", "Plano de Ataque", "Baldes", "Entrada Diária", "Livro Caixa", "Análises", "Calendário", "Atrasos & Riscos", "Configurações"]
+if st.query_params.get("diag") == "1":
+    PAGES.append("Diagnóstico")  # página escondida: ?diag=1 na URL
+
 with st.sidebar:
     st.header("Usuário")
     name = st.text_input("Seu nome", value=st.session_state.get("user_name", "Gustavo"))
     if st.button("Entrar / Criar"):
-        with get_db() as db:
+        with get_router().session() as db:  # cadastro de usuários fica no banco principal
             user = get_or_create_user(db, name.strip() or "Usuário")
             st.session_state["user_id"] = user.id
             st.session_state["user_name"] = user.name
     st.markdown("---")
-    page = st.radio("Navegação", ["Dashboard", "Plano de Ataque", "Baldes", "Entrada Diária", "Livro Caixa", "Calendário", "Atrasos & Riscos", "Configurações"])
+    page = st.radio("Navegação", PAGES)
 
 user_id = st.session_state.get("user_id", None)
 if not user_id:
     st.info("👈 Informe o seu **nome** e clique em **Entrar / Criar** para começar.")
     st.stop()
 
-# ---- Load helpers ----
-def load_buckets(db: Session, user_id: int):
-    return db.execute(select(Bucket).where(Bucket.user_id == user_id)).scalars().all()
-
-def load_giants(db: Session, user_id: int):
-    return db.execute(select(Giant).where(Giant.user_id == user_id)).scalars().all()
-
-def load_movements(db: Session, user_id: int):
-    return db.execute(select(Movement).where(Movement.user_id == user_id).order_by(Movement.date.desc())).scalars().all()
-
-def load_bills(db: Session, user_id: int):
-    return db.execute(select(Bill).where(Bill.user_id == user_id).order_by(Bill.due_date.asc())).scalars().all()
-
-# ---- Pages ----
-if page == "Dashboard":
-    st.title("📊 Dashboard")
+# ---- Camada de dados (todas as páginas) ----
+import cache
+import categories
+import events
+import importer
+import instrument
+import jobs
+import ledger
+import services
+from aggregates import dashboard_totals, bucket_history, debt_budget
+from cache import load_buckets, load_giants, load_bills, load_unpaid_bills  # cacheados por usuário; escritas chamam cache.invalidate
+from formatting import money_br, parse_money_br, br_table  # pandas só é importado por br_table, na primeira tabela
+from money import ZERO
+
+get_workers()
+
+# Cada rerun é medido (queries, linhas, tempo); o perfil cProfile é opcional e vale para um rerun só
+profile_rerun = st.session_state.get("diag_profile") == page
+if profile_rerun:
+    st.session_state.pop("diag_profile")
+with instrument.track(page, profile=profile_rerun):
+    # Escritas feitas fora deste processo (API) mudam users.revision: descarta o cache do usuário
     with get_db() as db:
-        buckets = load_buckets(db, user_id)
-        giants = load_giants(db, user_id)
-        movs = load_movements(db, user_id)
+        cache.read_cache.sync(user_id, services.user_revision(db, user_id))
 
-        total_balance = sum(b.balance for b in buckets)
-
-        # Métricas mensais e totais
-        today = date.today()
-        month_movs = [m for m in movs if m.date.month == today.month and m.date.year == today.year]
-        total_income_val = sum(m.amount for m in movs if m.kind == 'income')
-        total_expense_val = sum(m.amount for m in movs if m.kind in ('expense', 'transfer'))
-        month_income = sum(m.amount for m in month_movs if m.kind == 'income')
-        month_expense = sum(m.amount for m in month_movs if m.kind in ('expense', 'transfer'))
-
-        col1, col2, col3, col4, col5, col6 = st.columns(6)
-        with col1:
-            st.metric("Saldo total nos Baldes", money_br(total_balance))
-        with col2:
-            st.metric("Receitas (mês)", money_br(month_income))
-        with col3:
-            st.metric("Despesas/Transf. (mês)", money_br(month_expense))
-        with col4:
-            st.metric("Receitas (total)", money_br(total_income_val))
-        with col5:
-            st.metric("Despesas/Transf. (total)", money_br(total_expense_val))
-        with col6:
-            active = [g for g in giants if g.status == "active"]
-            st.metric("Gigantes ativos", len(active))
-
-        if buckets:
-            df_b = pd.DataFrame([{"Balde": b.name, "%": b.percent, "Saldo": money_br(b.balance)} for b in buckets])
-            st.subheader("Distribuição por Balde")
-            st.dataframe(df_b, use_container_width=True)
-
-        if giants:
-            giants_sorted = sorted(giants, key=lambda g: (g.priority, -g.total_to_pay))
-            df_g = pd.DataFrame([{"Gigante": g.name, "Total a Quitar": money_br(g.total_to_pay), "Prioridade": g.priority, "Status": g.status} for g in giants_sorted])
-            st.subheader("Gigantes")
-            st.dataframe(df_g, use_container_width=True)
-
-        defeated = [g for g in giants if g.status == "defeated"]
-        st.caption(f"Vitórias: {len(defeated)}")
-
-elif page == "Plano de Ataque":
-    st.title("🛡️ Plano de Ataque — Gigantes")
-    with get_db() as db:
-        with st.form("novo_gigante"):
-            st.subheader("Novo Gigante")
-            name_g = st.text_input("Nome", placeholder="Ex.: Cartão X")
-            total_str = st.text_input("Total a Quitar (R$)", value="")
-            total = parse_money_br(total_str) if total_str else 0.0
-            parcels = st.number_input("Parcelas", min_value=0, step=1, value=0)
-            months_left = st.number_input("Meses restantes", min_value=0, step=1, value=0)
-            priority = st.number_input("Prioridade (1=maior)", min_value=1, step=1, value=1)
-            submitted = st.form_submit_button("Adicionar")
-            if submitted and name_g.strip():
-                g = Giant(user_id=user_id, name=name_g.strip(), total_to_pay=total,
-                          parcels=parcels, months_left=months_left, priority=priority, status="active")
-                db.add(g)
-                db.commit()
-                st.success("Gigante criado!")
-
-        giants = load_giants(db, user_id)
-        if giants:
-            giants_sorted = sorted(giants, key=lambda g: (g.priority, -g.total_to_pay))
-            st.subheader("Seus Gigantes")
-            for g in giants_sorted:
-                with st.expander(f"{g.name} — {money_br(g.total_to_pay)} | prioridade {g.priority} | status {g.status}"):
-                    monthly_str = st.text_input(f"Aporte mensal para {g.name} (R$)", value="", key=f"mi_{g.id}")
-                    monthly_input = parse_money_br(monthly_str) if monthly_str else 0.0
-                    if monthly_input > 0:
-                        eff = payoff_efficiency(g, monthly_input)
-                        st.write(f"Eficiência (R$/1k): {eff['r_per_1k']}")
-                        st.write(f"Meses até a vitória: {eff['months_to_victory']}")
-                    if st.button("Marcar Vitória", key=f"def_{g.id}"):
-                        g.status = "defeated"
-                        db.commit()
-                        st.success("🎉 Vitória! Gigante derrotado.")
-
-elif page == "Baldes":
-    st.title("🪣 Baldes")
-    with get_db() as db:
-        with st.form("novo_balde"):
-            st.subheader("Adicionar Balde")
-            name_b = st.text_input("Nome do Balde", placeholder="Ex.: Operacional")
-            desc_b = st.text_input("Descrição", placeholder="Opcional")
-            percent_b = st.number_input("Percentual (%)", min_value=0.0, max_value=100.0, step=1.0)
-            type_b = st.text_input("Tipo", value="generic")
-            submitted = st.form_submit_button("Salvar")
-            if submitted and name_b.strip():
-                b = Bucket(user_id=user_id, name=name_b.strip(), description=desc_b.strip(),
-                           percent=percent_b, type=type_b, balance=0.0)
-                db.add(b)
-                db.commit()
-                st.success("Balde salvo!")
-
-        buckets = load_buckets(db, user_id)
-        if buckets:
-            total_percent = sum(b.percent for b in buckets)
-            if total_percent < 0 or any(b.percent < 0 for b in buckets):
-                st.error("Há percentuais negativos. Ajuste para continuar usando a divisão.")
-            st.info(f"Percentuais atuais somam **{total_percent:.2f}%**. Se não for 100%, a divisão é normalizada na Entrada Diária.")
-            if st.button("Normalizar percentuais para 100%"):
-                if total_percent <= 0:
-                    st.warning("Não é possível normalizar: soma é 0%.")
-                else:
-                    factor = 100.0 / total_percent
-                    for b in buckets:
-                        b.percent = round(b.percent * factor, 2)
-                    db.commit()
-                    st.success("Percentuais normalizados para 100%. Recarregue a página.")
-
-            df_b = pd.DataFrame([{"ID": b.id, "Nome": b.name, "Descrição": b.description, "%": b.percent, "Tipo": b.type, "Saldo": money_br(b.balance)} for b in buckets])
-            st.dataframe(df_b, use_container_width=True)
-
-            st.subheader("Editar balde existente")
-            ids = [b.id for b in buckets]
-            sel = st.selectbox("Escolha o ID", ids) if ids else None
-            if sel:
-                b = next(x for x in buckets if x.id == sel)
-                with st.form(f"edit_balde_{sel}"):
-                    name_b2 = st.text_input("Nome", value=b.name)
-                    desc_b2 = st.text_input("Descrição", value=b.description)
-                    percent_b2 = st.number_input("Percentual (%)", min_value=0.0, max_value=100.0, step=1.0, value=float(b.percent))
-                    type_b2 = st.text_input("Tipo", value=b.type)
-                    confirm = st.checkbox("Confirmar alterações")
-                    saveb = st.form_submit_button("Salvar alterações")
-                    if saveb and confirm:
-                        b.name, b.description, b.percent, b.type = name_b2, desc_b2, percent_b2, type_b2
-                        db.commit()
-                        st.success("Balde atualizado!")
-                    elif saveb and not confirm:
-                        st.warning("Confirme as alterações para salvar.")
-
-elif page == "Entrada Diária":
-    st.title("📥 Entrada Diária")
-    with get_db() as db:
-        buckets = load_buckets(db, user_id)
-        if not buckets:
-            st.warning("Crie baldes primeiro.")
-        else:
-            d = st.date_input("Data", value=date.today())
-            val_str = st.text_input("Valor total recebido (ex.: 10.249,00)", value="")
-            val = parse_money_br(val_str) if val_str else 0.0
-            if st.button("Dividir e Lançar"):
-                splits = compute_bucket_splits(buckets, val)
-                for s in splits:
-                    m = Movement(user_id=user_id, bucket_id=s["bucket_id"], kind="income",
-                                 amount=s["value"], description="Entrada diária", date=d)
-                    db.add(m)
-                    b = db.get(Bucket, s["bucket_id"])
-                    if b and b.user_id == user_id:
-                        b.balance += s["value"]
-                db.commit()
-                st.success("Entrada lançada e dividida entre os baldes.")
-                df = pd.DataFrame([{"Balde": s["name"], "% efetivo": s["percent_effective"], "Valor": money_br(s["value"])} for s in splits])
-                st.table(df)
-
-elif page == "Livro Caixa":
-    st.title("📗 Livro Caixa")
-    with get_db() as db:
-        st.subheader("Nova movimentação")
-        kind = st.selectbox("Tipo", ["income", "expense", "transfer"], index=0)
-        buckets_all = load_buckets(db, user_id)
-        ids = [b.id for b in buckets_all]
-        allow_negative = st.checkbox("Permitir saldo negativo no(s) balde(s)", value=False)
-
-        if kind == "transfer":
-            orig = st.selectbox("Balde de origem", ids, index=0 if ids else None)
-            dest = st.selectbox("Balde de destino", ids, index=1 if ids and len(ids) > 1 else 0)
-            val_str = st.text_input("Valor (R$)", value="")
-            val = parse_money_br(val_str) if val_str else 0.0
-            d = st.date_input("Data", value=date.today())
-            desc = st.text_input("Descrição", value="Transferência entre baldes")
-            if st.button("Transferir"):
-                if val > 0 and orig != dest:
-                    b_orig = db.get(Bucket, orig)
-                    b_dest = db.get(Bucket, dest)
-                    if b_orig and b_dest:
-                        if not allow_negative and b_orig.balance - val < 0:
+    # ---- Pages ----
+    if page == "Dashboard":
+        import pandas as pd
+        st.title("📊 Dashboard")
+        with get_db() as db:
+            buckets = load_buckets(db, user_id)
+            giants = load_giants(db, user_id)
+
+            # Métricas mensais e totais (lidas dos rollups mensais)
+            today = date.today()
+
+            totals = cache.cached(user_id, ("dashboard", today), lambda: dashboard_totals(db, user_id, today))
+            total_balance = totals["total_balance"]
+            total_income_val = totals["total_income"]
+            total_expense_val = totals["total_expense"]
+            month_income = totals["month_income"]
+            month_expense = totals["month_expense"]
+
+            col1, col2, col3, col4, col5, col6 = st.columns(6)
+            with col1:
+                st.metric("Saldo total nos Baldes", money_br(total_balance))
+            with col2:
+                st.metric("Receitas (mês)", money_br(month_income))
+            with col3:
+                st.metric("Despesas/Transf. (mês)", money_br(month_expense))
+            with col4:
+                st.metric("Receitas (total)", money_br(total_income_val))
+            with col5:
+                st.metric("Despesas/Transf. (total)", money_br(total_expense_val))
+            with col6:
+                active = [g for g in giants if g.status == "active"]
+                st.metric("Gigantes ativos", len(active))
+
+            if buckets:
+                df_b = pd.DataFrame([{"Balde": b.name, "%": b.percent, "Saldo": b.balance} for b in buckets])
+                st.subheader("Distribuição por Balde")
+                st.dataframe(br_table(df_b, money=["Saldo"]), use_container_width=True)
+
+                hist = cache.cached(user_id, "bucket_history", lambda: bucket_history(db, user_id))
+                if hist:
+                    df_h = pd.DataFrame([{"Mês": f"{h['year']}-{h['month']:02d}", "Balde": h["name"], "Líquido": h["net"]} for h in hist])
+                    st.subheader("Histórico mensal por Balde")
+                    st.bar_chart(df_h.pivot_table(index="Mês", columns="Balde", values="Líquido", aggfunc="sum").astype(float))
+
+                # Saldo em qualquer data: snapshot mensal mais recente + eventos depois dele
+                st.subheader("Saldo em uma data")
+                as_of = st.date_input("Saldo no fim do dia", value=today - timedelta(days=30), max_value=today, format="DD/MM/YYYY")
+                past = cache.cached(user_id, ("balances_at", as_of), lambda: events.balances_at(db, user_id, as_of))
+                df_p = pd.DataFrame([{"Balde": b.name, "Saldo na data": past.get(b.id, ZERO), "Saldo hoje": b.balance,
+                                      "Variação": b.balance - past.get(b.id, ZERO)} for b in buckets])
+                st.dataframe(br_table(df_p, money=["Saldo na data", "Saldo hoje", "Variação"]), use_container_width=True)
+                with st.expander("Como o saldo chegou aqui"):
+                    pick = st.selectbox("Balde", buckets, format_func=lambda b: b.name, key="hist_bucket")
+                    ev = cache.cached(user_id, ("balance_events", pick.id), lambda: events.history(db, user_id, pick.id))
+                    if ev:
+                        df_e = pd.DataFrame([{"Data": e["date"], "Evento": e["kind"], "Delta": e["delta"],
+                                              "%": e["percent"], "Descrição": e["description"]} for e in ev])
+                        st.dataframe(br_table(df_e, money=["Delta"], dates=["Data"]), use_container_width=True, height=250)
+
+            if giants:
+                giants_sorted = sorted(giants, key=lambda g: (g.priority, -g.total_to_pay))
+                df_g = pd.DataFrame([{"Gigante": g.name, "Total a Quitar": g.total_to_pay, "Prioridade": g.priority, "Status": g.status} for g in giants_sorted])
+                st.subheader("Gigantes")
+                st.dataframe(br_table(df_g, money=["Total a Quitar"]), use_container_width=True)
+
+            defeated = [g for g in giants if g.status == "defeated"]
+            st.caption(f"Vitórias: {len(defeated)}")
+
+    elif page == "Plano de Ataque":
+        import pandas as pd
+        import simulator
+        from logic import payoff_efficiency
+        st.title("🛡️ Plano de Ataque — Gigantes")
+        with get_db() as db:
+            with st.form("novo_gigante"):
+                st.subheader("Novo Gigante")
+                name_g = st.text_input("Nome", placeholder="Ex.: Cartão X")
+                total_str = st.text_input("Total a Quitar (R$)", value="")
+                total = parse_money_br(total_str) if total_str else ZERO
+                parcels = st.number_input("Parcelas", min_value=0, step=1, value=0)
+                months_left = st.number_input("Meses restantes", min_value=0, step=1, value=0)
+                priority = st.number_input("Prioridade (1=maior)", min_value=1, step=1, value=1)
+                interest_rate = st.number_input("Juros (% a.m.)", min_value=0.0, step=0.1, value=0.0)
+                submitted = st.form_submit_button("Adicionar")
+                if submitted and name_g.strip():
+                    services.create_giant(db, user_id, name_g, total, parcels=parcels, months_left=months_left,
+                                          priority=priority, interest_rate=interest_rate)
+                    cache.invalidate(user_id)
+                    st.success("Gigante criado!")
+
+            giants = load_giants(db, user_id)
+            if giants:
+                giants_sorted = sorted(giants, key=lambda g: (g.priority, -g.total_to_pay))
+                st.subheader("Seus Gigantes")
+                for g in giants_sorted:
+                    with st.expander(f"{g.name} — {money_br(g.total_to_pay)} | prioridade {g.priority} | status {g.status}"):
+                        monthly_str = st.text_input(f"Aporte mensal para {g.name} (R$)", value="", key=f"mi_{g.id}")
+                        monthly_input = parse_money_br(monthly_str) if monthly_str else ZERO
+                        if monthly_input > 0:
+                            eff = payoff_efficiency(g, monthly_input)
+                            st.write(f"Eficiência (R$/1k): {eff['r_per_1k']}")
+                            st.write(f"Meses até a vitória: {eff['months_to_victory']}")
+                        if st.button("Marcar Vitória", key=f"def_{g.id}"):
+                            services.defeat_giant(db, user_id, g.id)
+                            cache.invalidate(user_id)
+                            st.success("🎉 Vitória! Gigante derrotado.")
+
+                active = [g for g in giants if g.status == "active"]
+                if active:
+                    st.subheader("Simulação de Quitação")
+                    estimate = cache.cached(user_id, "debt_budget", lambda: debt_budget(db, user_id))
+                    budget_str = st.text_input("Orçamento mensal para dívidas (R$)", value=money_br(estimate).replace("R$", "").strip(),
+                                               help="Padrão: média das entradas nos baldes de empréstimos/cartões/ataque nos últimos 3 meses")
+                    budget = parse_money_br(budget_str) if budget_str else ZERO
+                    if budget > 0:
+                        # Cache por versão dos dados do usuário: qualquer escrita em gigantes invalida
+                        sim = cache.cached(user_id, ("sim", budget), lambda: simulator.simulate(active, [budget], keep_schedule=True))
+                        rows = []
+                        for si, s in enumerate(sim["strategies"]):
+                            mtf = int(sim["months_to_freedom"][si, 0])
+                            rows.append({
+                                "Estratégia": simulator.STRATEGY_LABELS[s],
+                                "Meses até a liberdade": str(mtf) if mtf >= 0 else "Não quita",
+                                "Juros pagos": sim["total_interest"][si, 0],
+                                "Total pago": sim["total_paid"][si, 0],
+                            })
+                        st.dataframe(br_table(pd.DataFrame(rows), money=["Juros pagos", "Total pago"]), use_container_width=True)
+
+                        # Meses até a liberdade em função do orçamento (uma única simulação vetorizada)
+                        b = float(budget)
+                        grid = [round(b * f, 2) for f in (0.5, 0.6, 0.7, 0.8, 0.9, 1.0, 1.25, 1.5, 1.75, 2.0, 2.5, 3.0)]
+                        sweep = cache.cached(user_id, ("sim_sweep", budget), lambda: simulator.simulate(active, grid))
+                        df_s = pd.DataFrame(
+                            {simulator.STRATEGY_LABELS[s]: sweep["months_to_freedom"][si].astype(float) for si, s in enumerate(sweep["strategies"])},
+                            index=pd.Index(grid, name="Orçamento (R$)"),
+                        ).where(lambda d: d >= 0)
+                        st.caption("Meses até a liberdade por orçamento mensal")
+                        st.line_chart(df_s)
+
+                        strategy = st.selectbox("Cronograma da estratégia", simulator.STRATEGIES, format_func=simulator.STRATEGY_LABELS.get)
+                        sched = simulator.schedule_rows(sim, strategy)
+                        if sched:
+                            df_c = pd.DataFrame([{"Mês": r["date"], "Gigante": r["giant"], "Pagamento": r["payment"], "Saldo": r["balance"]} for r in sched])
+                            st.dataframe(br_table(df_c, money=["Pagamento", "Saldo"], dates=["Mês"]), use_container_width=True, height=300)
+
+    elif page == "Baldes":
+        import pandas as pd
+        st.title("🪣 Baldes")
+        with get_db() as db:
+            with st.form("novo_balde"):
+                st.subheader("Adicionar Balde")
+                name_b = st.text_input("Nome do Balde", placeholder="Ex.: Operacional")
+                desc_b = st.text_input("Descrição", placeholder="Opcional")
+                percent_b = st.number_input("Percentual (%)", min_value=0.0, max_value=100.0, step=1.0)
+                type_b = st.text_input("Tipo", value="generic")
+                submitted = st.form_submit_button("Salvar")
+                if submitted and name_b.strip():
+                    services.create_bucket(db, user_id, name_b, percent_b, description=desc_b, type=type_b)
+                    cache.invalidate(user_id)
+                    st.success("Balde salvo!")
+
+            buckets = load_buckets(db, user_id)
+            if buckets:
+                total_percent = sum(b.percent for b in buckets)
+                if total_percent < 0 or any(b.percent < 0 for b in buckets):
+                    st.error("Há percentuais negativos. Ajuste para continuar usando a divisão.")
+                st.info(f"Percentuais atuais somam **{total_percent:.2f}%**. Se não for 100%, a divisão é normalizada na Entrada Diária.")
+                if st.button("Normalizar percentuais para 100%"):
+                    if total_percent <= 0:
+                        st.warning("Não é possível normalizar: soma é 0%.")
+                    else:
+                        submit_job(user_id, "normalize")
+                jobs_panel(user_id, ("normalize",))
+
+                df_b = pd.DataFrame([{"ID": b.id, "Nome": b.name, "Descrição": b.description, "%": b.percent, "Tipo": b.type, "Saldo": b.balance} for b in buckets])
+                st.dataframe(br_table(df_b, money=["Saldo"]), use_container_width=True)
+
+                st.subheader("Editar balde existente")
+                ids = [b.id for b in buckets]
+                sel = st.selectbox("Escolha o ID", ids) if ids else None
+                if sel:
+                    b = next(x for x in buckets if x.id == sel)
+                    with st.form(f"edit_balde_{sel}"):
+                        name_b2 = st.text_input("Nome", value=b.name)
+                        desc_b2 = st.text_input("Descrição", value=b.description)
+                        percent_b2 = st.number_input("Percentual (%)", min_value=0.0, max_value=100.0, step=1.0, value=float(b.percent))
+                        type_b2 = st.text_input("Tipo", value=b.type)
+                        confirm = st.checkbox("Confirmar alterações")
+                        saveb = st.form_submit_button("Salvar alterações")
+                        if saveb and confirm:
+                            services.update_bucket(db, user_id, b.id, name=name_b2, description=desc_b2, percent=percent_b2, type=type_b2)
+                            cache.invalidate(user_id)
+                            st.success("Balde atualizado!")
+                        elif saveb and not confirm:
+                            st.warning("Confirme as alterações para salvar.")
+
+                with st.expander("🧪 Simular planos de percentuais"):
+                    import simulator
+                    st.caption("Redivide as entradas do período (exceto transferências) com outros percentuais e compara saldos "
+                               "e quitação dos gigantes. As saídas ficam como foram. Nada é gravado.")
+                    sb_plans = st.number_input("Planos", min_value=1, max_value=20, step=1, value=3)
+                    plan_cols = [f"Plano {i}" for i in range(1, int(sb_plans) + 1)]
+                    # Snapshot e replay só ao enviar o formulário; os reruns seguintes reaproveitam o resultado
+                    with st.form("sandbox_form"):
+                        sc1, sc2 = st.columns(2)
+                        with sc1:
+                            sb_months = st.selectbox("Histórico (meses)", [6, 12, 24], index=2)
+                        with sc2:
+                            sb_strategy = st.selectbox("Estratégia dos gigantes", simulator.STRATEGIES, format_func=simulator.STRATEGY_LABELS.get)
+                        grid = st.data_editor(
+                            pd.DataFrame([{"id": b.id, "Balde": b.name, "Atual": b.percent, **{c: b.percent for c in plan_cols}}
+                                          for b in sorted(buckets, key=lambda b: b.id)]),
+                            hide_index=True, use_container_width=True, key=f"sandbox_grid_{len(plan_cols)}",
+                            column_config={"id": None, "Balde": st.column_config.TextColumn(disabled=True),
+                                           "Atual": st.column_config.NumberColumn(disabled=True, format="%.2f"),
+                                           **{c: st.column_config.NumberColumn(min_value=0.0, max_value=100.0, format="%.2f") for c in plan_cols}},
+                        )
+                        compare = st.form_submit_button("Comparar planos")
+                    version = (user_id, cache.read_cache.version(user_id))
+                    if compare:
+                        import sandbox
+                        grid = grid.fillna(0.0)
+                        # Snapshot por versão dos dados do usuário: reenviar só com planos novos refaz apenas o replay
+                        snap = cache.cached(user_id, ("sandbox", sb_months), lambda: sandbox.take(db, user_id, sb_months))
+                        plans = [sandbox.current(snap)] + [
+                            sandbox.plan(snap, c, dict(zip(grid["id"].astype(int), grid[c].astype(float)))) for c in plan_cols
+                        ]
+                        result = sandbox.replay(snap, plans, strategy=sb_strategy)
+                        df_sb = pd.DataFrame([{
+                            "Plano": r["plan"],
+                            "Saldo final": r["final_total"],
+                            **{b: r[f"final:{b}"] for b in result["buckets"]},
+                            "Dívidas/mês": r["debt_budget"],
+                            "Livre em": r["freedom_date"],
+                            "Primeiro saldo negativo": f"{r['first_negative'][0]} em {r['first_negative'][1].strftime('%d/%m/%Y')}" if r["first_negative"] else "—",
+                            "Falta p/ contas críticas": r["bills_short"],
+                        } for r in sandbox.summary_rows(result)])
+                        if not result["giant_names"]:
+                            df_sb = df_sb.drop(columns=["Livre em"])
+                        st.session_state["sandbox_result"] = (version, df_sb, result["buckets"], snap.start, snap.end)
+                    saved = st.session_state.get("sandbox_result")
+                    if saved and saved[0] == version:  # dados mudaram depois da comparação: pede para comparar de novo
+                        _, df_sb, sb_buckets, sb_start, sb_end = saved
+                        st.dataframe(br_table(df_sb, money=["Saldo final", "Dívidas/mês", "Falta p/ contas críticas", *sb_buckets],
+                                              dates=["Livre em"]), use_container_width=True, hide_index=True)
+                        st.caption(f"De {sb_start.strftime('%d/%m/%Y')} a {sb_end.strftime('%d/%m/%Y')}. "
+                                   "“Dívidas/mês” é a média do que o plano manda para os baldes de empréstimos/cartões/ataque; "
+                                   "“Falta p/ contas críticas” compara o saldo final com as contas críticas dos próximos 30 dias.")
+                        st.bar_chart(df_sb.set_index("Plano")[sb_buckets].astype(float), stack=False)
+
+    elif page == "Entrada Diária":
+        import pandas as pd
+        st.title("📥 Entrada Diária")
+        with get_db() as db:
+            buckets = load_buckets(db, user_id)
+            if not buckets:
+                st.warning("Crie baldes primeiro.")
+            else:
+                d = st.date_input("Data", value=date.today())
+                val_str = st.text_input("Valor total recebido (ex.: 10.249,00)", value="")
+                val = parse_money_br(val_str) if val_str else ZERO
+                if st.button("Dividir e Lançar"):
+                    try:
+                        splits = services.post_income_split(db, user_id, buckets, val, d)
+                    except ValueError as e:
+                        st.error(str(e))
+                        st.stop()
+                    except services.BucketNotFound as e:
+                        # Balde apagado em outra aba/sessão: nada foi lançado; a lista em cache está velha
+                        cache.invalidate(user_id)
+                        st.error(f"{e} Nada foi lançado; confira os baldes e tente de novo.")
+                        st.stop()
+                    cache.invalidate(user_id)
+                    st.success("Entrada lançada e dividida entre os baldes.")
+                    df = pd.DataFrame([{"Balde": s["name"], "% efetivo": s["percent_effective"], "Valor": s["value"]} for s in splits])
+                    st.table(br_table(df, money=["Valor"]))
+
+    elif page == "Livro Caixa":
+        import pandas as pd
+        st.title("📗 Livro Caixa")
+        with get_db() as db:
+            st.subheader("Nova movimentação")
+            kind = st.selectbox("Tipo", ["income", "expense", "transfer"], index=0)
+            buckets_all = load_buckets(db, user_id)
+            ids = [b.id for b in buckets_all]
+            allow_negative = st.checkbox("Permitir saldo negativo no(s) balde(s)", value=False)
+
+            if kind == "transfer":
+                orig = st.selectbox("Balde de origem", ids, index=0 if ids else None)
+                dest = st.selectbox("Balde de destino", ids, index=1 if ids and len(ids) > 1 else 0)
+                val_str = st.text_input("Valor (R$)", value="")
+                val = parse_money_br(val_str) if val_str else ZERO
+                d = st.date_input("Data", value=date.today())
+                desc = st.text_input("Descrição", value="Transferência entre baldes")
+                if st.button("Transferir"):
+                    if val > 0 and orig != dest:
+                        try:
+                            services.transfer(db, user_id, orig, dest, val, d, desc, allow_negative=allow_negative)
+                        except services.InsufficientFunds:
                             st.error("Saldo insuficiente no balde de origem (desmarque o bloqueio para permitir negativo).")
+                        except services.BucketNotFound as e:
+                            st.error(str(e))
                         else:
-                            m_out = Movement(user_id=user_id, bucket_id=orig, kind="transfer", amount=val, description=desc + " (saída)", date=d)
-                            m_in = Movement(user_id=user_id, bucket_id=dest, kind="income", amount=val, description=desc + " (entrada)", date=d)
-                            db.add(m_out)
-                            db.add(m_in)
-                            b_orig.balance -= val
-                            b_dest.balance += val
-                            db.commit()
+                            cache.invalidate(user_id)
                             st.success("Transferência realizada.")
-                else:
-                    st.warning("Informe um valor > 0 e selecione baldes diferentes.")
-        else:
-            bucket_id = st.selectbox("Balde", ids, index=0 if ids else None)
-            val_str = st.text_input("Valor (R$)", value="")
-            val = parse_money_br(val_str) if val_str else 0.0
-            d = st.date_input("Data", value=date.today())
-            desc = st.text_input("Descrição", value="")
-            if st.button("Lançar"):
-                if val > 0 and bucket_id:
-                    m = Movement(user_id=user_id, bucket_id=bucket_id, kind=kind, amount=val, description=desc, date=d)
-                    db.add(m)
-                    b = db.get(Bucket, bucket_id)
-                    if b and b.user_id == user_id:
-                        if kind == "income":
-                            b.balance += val
-                        elif kind in ("expense", "transfer"):
-                            if not allow_negative and b.balance - val < 0:
-                                st.error("Saldo insuficiente no balde selecionado (desmarque o bloqueio para permitir negativo).")
-                                db.rollback()
-                                st.stop()
-                            else:
-                                b.balance -= val
-                    db.commit()
-                    st.success("Movimentação lançada")
-                else:
-                    st.warning("Informe um valor > 0 e selecione um balde.")
-
-        movs = load_movements(db, user_id)
-        if movs:
-            df = pd.DataFrame([{"Data": date_br(m.date), "Tipo": m.kind, "BaldeID": m.bucket_id, "Valor": money_br(m.amount), "Descrição": m.description} for m in movs])
-            st.dataframe(df, use_container_width=True)
-            csv = df.to_csv(index=False).encode("utf-8")
-            st.download_button("Exportar CSV", data=csv, file_name="livro_caixa.csv")
-        else:
-            st.info("Sem movimentações ainda.")
-
-elif page == "Calendário":
-    st.title("🗓️ Calendário de Despesas")
-    with get_db() as db:
-        with st.form("nova_conta"):
-            title = st.text_input("Título", placeholder="Ex.: Cartão C6 - Fatura")
-            amount_str = st.text_input("Valor (R$)", value="")
-            amount = parse_money_br(amount_str) if amount_str else 0.0
-            due = st.date_input("Vencimento", value=date.today())
-            critical = st.checkbox("Crítica (cartão/ empréstimo/ consórcio)")
-            submitted = st.form_submit_button("Adicionar")
-            if submitted and title.strip():
-                b = Bill(user_id=user_id, title=title.strip(), amount=amount, due_date=due, is_critical=critical, paid=False)
-                db.add(b)
-                db.commit()
-                st.success("Conta adicionada.")
-
-        bills = load_bills(db, user_id)
-        if bills:
-            df = pd.DataFrame([{"ID": b.id, "Título": b.title, "Valor": money_br(b.amount), "Vencimento": date_br(b.due_date), "Crítica": b.is_critical, "Paga": b.paid} for b in bills])
-            st.dataframe(df, use_container_width=True)
-
-            st.subheader("Editar conta")
-            ids = [b.id for b in bills]
-            sel = st.selectbox("Escolha o ID", ids) if ids else None
-            if sel:
-                b = next(x for x in bills if x.id == sel)
-                with st.form(f"edit_bill_{sel}"):
-                    title2 = st.text_input("Título", value=b.title)
-                    amount2_str = st.text_input("Valor (R$)", value=str(b.amount).replace('.', ','))
-                    amount2 = parse_money_br(amount2_str) if amount2_str else b.amount
-                    due2 = st.date_input("Vencimento", value=b.due_date)
-                    critical2 = st.checkbox("Crítica", value=b.is_critical)
-                    paid2 = st.checkbox("Paga", value=b.paid)
-                    confirm = st.checkbox("Confirmar alterações")
-                    sb = st.form_submit_button("Salvar alterações")
-                    if sb and confirm:
-                        b.title, b.amount, b.due_date, b.is_critical, b.paid = title2, amount2, due2, critical2, paid2
-                        db.commit()
-                        st.success("Conta atualizada!")
-                    elif sb and not confirm:
-                        st.warning("Confirme as alterações marcando a caixa.")
-
-elif page == "Atrasos & Riscos":
-    st.title("⏰ Atrasos & Riscos")
-    today = date.today()
-    with get_db() as db:
-        bills = load_bills(db, user_id)
-        overdue = [b for b in bills if (not b.paid and b.due_date < today)]
-        due_soon = [b for b in bills if (not b.paid and today <= b.due_date <= today + timedelta(days=3))]
-
-        st.subheader("Vencidas")
-        if overdue:
-            df1 = pd.DataFrame([{"ID": b.id, "Título": b.title, "Valor": money_br(b.amount), "Venceu em": date_br(b.due_date), "Crítica": b.is_critical, "Paga": b.paid} for b in overdue])
-            st.dataframe(df1, use_container_width=True)
-            ids1 = [b.id for b in overdue]
-            sel1 = st.selectbox("ID vencida", ids1) if ids1 else None
-            if sel1:
-                b = next(x for x in bills if x.id == sel1)
-                with st.form(f"edit_overdue_{sel1}"):
-                    title2 = st.text_input("Título", value=b.title)
-                    amount2_str = st.text_input("Valor (R$)", value=str(b.amount).replace('.', ','))
-                    amount2 = parse_money_br(amount2_str) if amount2_str else b.amount
-                    due2 = st.date_input("Vencimento", value=b.due_date)
-                    critical2 = st.checkbox("Crítica", value=b.is_critical)
-                    paid2 = st.checkbox("Paga", value=b.paid)
-                    confirm = st.checkbox("Confirmar alterações")
-                    sb = st.form_submit_button("Salvar")
-                    if sb and confirm:
-                        b.title, b.amount, b.due_date, b.is_critical, b.paid = title2, amount2, due2, critical2, paid2
-                        db.commit()
-                        st.success("Atualizada!")
-                    elif sb and not confirm:
-                        st.warning("Confirme as alterações marcando a caixa.")
-
-        else:
-            st.write("Sem contas vencidas.")
-
-        st.subheader("Vencendo em até 3 dias")
-        if due_soon:
-            df2 = pd.DataFrame([{"ID": b.id, "Título": b.title, "Valor": money_br(b.amount), "Vencimento": date_br(b.due_date), "Crítica": b.is_critical, "Paga": b.paid} for b in due_soon])
-            st.dataframe(df2, use_container_width=True)
-            ids2 = [b.id for b in due_soon]
-            sel2 = st.selectbox("ID a vencer", ids2) if ids2 else None
-            if sel2:
-                b = next(x for x in bills if x.id == sel2)
-                with st.form(f"edit_duesoon_{sel2}"):
-                    title2 = st.text_input("Título", value=b.title)
-                    amount2_str = st.text_input("Valor (R$)", value=str(b.amount).replace('.', ','))
-                    amount2 = parse_money_br(amount2_str) if amount2_str else b.amount
-                    due2 = st.date_input("Vencimento", value=b.due_date)
-                    critical2 = st.checkbox("Crítica", value=b.is_critical)
-                    paid2 = st.checkbox("Paga", value=b.paid)
-                    confirm = st.checkbox("Confirmar alterações")
-                    sb = st.form_submit_button("Salvar")
-                    if sb and confirm:
-                        b.title, b.amount, b.due_date, b.is_critical, b.paid = title2, amount2, due2, critical2, paid2
-                        db.commit()
-                        st.success("Atualizada!")
-                    elif sb and not confirm:
-                        st.warning("Confirme as alterações marcando a caixa.")
-        else:
-            st.write("Sem contas críticas nos próximos 3 dias.")
-
-elif page == "Configurações":
-    st.title("⚙️ Configurações")
-    st.write("Altere o usuário ativo pela barra lateral.")
-    with get_db() as db:
-        if st.button("Reset (apagar tudo)"):
-            db.query(Bill).delete()
-            db.query(Movement).delete()
-            db.query(Giant).delete()
-            db.query(Bucket).delete()
-            db.query(User).delete()
-            db.commit()
-            st.session_state.pop("user_id", None)
-            st.session_state.pop("user_name", None)
-            st.success("Banco limpo. Recarregue e crie um novo usuário.")
+                    else:
+                        st.warning("Informe um valor > 0 e selecione baldes diferentes.")
+            else:
+                bucket_id = st.selectbox("Balde", ids, index=0 if ids else None)
+                val_str = st.text_input("Valor (R$)", value="")
+                val = parse_money_br(val_str) if val_str else ZERO
+                d = st.date_input("Data", value=date.today())
+                desc = st.text_input("Descrição", value="")
+                if st.button("Lançar"):
+                    if val > 0 and bucket_id:
+                        try:
+                            services.post_movement(db, user_id, bucket_id, kind, val, d, desc, allow_negative=allow_negative)
+                        except services.InsufficientFunds:
+                            st.error("Saldo insuficiente no balde selecionado (desmarque o bloqueio para permitir negativo).")
+                            st.stop()
+                        except services.BucketNotFound as e:
+                            st.error(str(e))
+                            st.stop()
+                        cache.invalidate(user_id)
+                        st.success("Movimentação lançada")
+                    else:
+                        st.warning("Informe um valor > 0 e selecione um balde.")
+
+            with st.expander("Importar extrato bancário (CSV/OFX)"):
+                up = st.file_uploader("Arquivo do extrato", type=["csv", "ofx", "qfx"])
+                bucket_names_imp = {b.id: b.name for b in buckets_all}
+                default_bucket = st.selectbox("Balde padrão (linhas sem regra)", [None] + ids, format_func=lambda i: "Nenhum" if i is None else bucket_names_imp.get(i, str(i)))
+                rules_text = st.text_area("Regras (uma por linha: padrão => Nome do balde; /regex/ aceito)", value="", placeholder="nubank => Cartões\n/uber|99/ => Operacional")
+                if st.button("Importar") and up is not None:
+                    try:
+                        importer.parse_rules(rules_text, buckets_all)  # regra inválida: avisa já, sem enfileirar
+                    except ValueError as e:
+                        st.error(str(e))
+                    else:
+                        # Extratos grandes (até ~1M linhas) rodam no pool de jobs; o app só grava o arquivo
+                        submit_job(user_id, "import", {"path": jobs.stage_upload(up, up.name), "filename": up.name,
+                                                       "rules": rules_text, "default_bucket_id": default_bucket})
+                jobs_panel(user_id, ("import",))
+
+            st.subheader("Movimentações")
+            bucket_names = {b.id: b.name for b in buckets_all}
+            fc1, fc2, fc3, fc4 = st.columns(4)
+            with fc1:
+                f_from = st.date_input("De", value=None, key="lc_from")
+            with fc2:
+                f_to = st.date_input("Até", value=None, key="lc_to")
+            with fc3:
+                f_kinds = st.multiselect("Tipos", ["income", "expense", "transfer"], key="lc_kinds")
+            with fc4:
+                f_bucket = st.selectbox("Filtrar por balde", [None] + ids, format_func=lambda i: "Todos" if i is None else bucket_names.get(i, str(i)), key="lc_bucket")
+            filters = {"date_from": f_from, "date_to": f_to, "kinds": f_kinds, "bucket_id": f_bucket}
+
+            # Pilha de cursores (date, id): volta uma página sem refazer a consulta inteira
+            sig = (f_from, f_to, tuple(f_kinds), f_bucket)
+            if st.session_state.get("lc_sig") != sig:
+                st.session_state["lc_sig"] = sig
+                st.session_state["lc_cursors"] = [None]
+            cursors = st.session_state["lc_cursors"]
+            rows, has_more = cache.cached(user_id, ("ledger", sig, cursors[-1]), lambda: ledger.fetch_page(db, user_id, after=cursors[-1], **filters))
+
+            if rows:
+                df = pd.DataFrame([{"Data": r["date"], "Tipo": r["kind"], "Balde": r["bucket_name"] or "—", "Valor": r["amount"], "Descrição": r["description"]} for r in rows])
+                st.dataframe(br_table(df, money=["Valor"], dates=["Data"]), use_container_width=True)
+                pc1, pc2, pc3 = st.columns([1, 1, 4])
+                with pc1:
+                    if st.button("◀ Anterior", disabled=len(cursors) == 1):
+                        cursors.pop()
+                        st.rerun()
+                with pc2:
+                    if st.button("Próxima ▶", disabled=not has_more):
+                        cursors.append(ledger.cursor_of(rows[-1]))
+                        st.rerun()
+                with pc3:
+                    st.caption(f"Página {len(cursors)} · {ledger.PAGE_SIZE} linhas por página")
+
+                with st.expander("Exportar (todas as linhas filtradas)"):
+                    exp_fmt = st.radio("Formato", ["CSV", "XLSX"], horizontal=True)
+                    exp_br = st.checkbox("Incluir colunas formatadas (R$ e dd/mm/aa)", value=True)
+                    if st.button("Gerar arquivo"):
+                        # Arquivo gerado por um worker (streaming, sem DataFrame); o download aparece abaixo
+                        submit_job(user_id, "export", {"format": exp_fmt.lower(), "formatted": exp_br, "filters": filters})
+                    jobs_panel(user_id, ("export",))
+            else:
+                st.info("Nenhuma movimentação encontrada.")
+
+    elif page == "Análises":
+        import altair as alt
+        import pandas as pd
+        st.title("📈 Análises de Gastos")
+        # Só lê category_rollups (totais mensais por categoria/balde/tipo): não varre movements
+        KIND_LABELS = {"expense": "Despesas", "transfer": "Transferências (saída)", "income": "Entradas"}
+        periods = {"Últimos 6 meses": 6, "Últimos 12 meses": 12, "Últimos 24 meses": 24, "Tudo": None}
+        fc1, fc2 = st.columns([1, 2])
+        with fc1:
+            months_back = periods[st.selectbox("Período", list(periods), index=1)]
+        with fc2:
+            kinds = st.multiselect("Tipos", list(KIND_LABELS), default=["expense"], format_func=KIND_LABELS.get)
+        start = None
+        if months_back:
+            y, m = divmod(date.today().year * 12 + date.today().month - months_back, 12)
+            start = date(y, m + 1, 1)
+        with get_db() as db:
+            rows = cache.cached(user_id, ("analytics", start, tuple(kinds)),
+                                lambda: categories.monthly(db, user_id, start=start, kinds=kinds)) if kinds else []
+            if not rows:
+                st.info("Nenhuma movimentação no período.")
+            else:
+                df = pd.DataFrame(rows).rename(columns={"month": "Mês", "category": "Categoria", "bucket": "Balde", "total": "Total"})
+                df["Total"] = df["Total"].astype(float)
+                st.metric("Total no período", money_br(sum(r["total"] for r in rows)))
+                # Clique na legenda destaca a categoria nos gráficos
+                pick = alt.selection_point(fields=["Categoria"], bind="legend")
+                by_month = alt.Chart(df).mark_bar().encode(
+                    x=alt.X("yearmonth(Mês):T", title="Mês"),
+                    y=alt.Y("sum(Total):Q", title="Total (R$)"),
+                    color=alt.Color("Categoria:N"),
+                    opacity=alt.condition(pick, alt.value(1.0), alt.value(0.2)),
+                    tooltip=["yearmonth(Mês):T", "Categoria:N", alt.Tooltip("sum(Total):Q", format=",.2f")],
+                ).add_params(pick)
+                st.altair_chart(by_month, use_container_width=True)
+                gc1, gc2 = st.columns(2)
+                with gc1:
+                    st.subheader("Por categoria")
+                    st.altair_chart(alt.Chart(df).mark_bar().encode(
+                        x=alt.X("sum(Total):Q", title="Total (R$)"),
+                        y=alt.Y("Categoria:N", sort="-x", title=None),
+                        tooltip=["Categoria:N", alt.Tooltip("sum(Total):Q", format=",.2f")],
+                    ), use_container_width=True)
+                with gc2:
+                    st.subheader("Por balde")
+                    st.altair_chart(alt.Chart(df).mark_bar().encode(
+                        x=alt.X("sum(Total):Q", title="Total (R$)"),
+                        y=alt.Y("Balde:N", sort="-x", title=None),
+                        color=alt.Color("Categoria:N"),
+                        tooltip=["Balde:N", "Categoria:N", alt.Tooltip("sum(Total):Q", format=",.2f")],
+                    ), use_container_width=True)
+                pivot = df.pivot_table(index="Categoria", columns="Balde", values="Total", aggfunc="sum", fill_value=0.0)
+                pivot["Total"] = pivot.sum(axis=1)
+                pivot = pivot.sort_values("Total", ascending=False).reset_index()
+                st.dataframe(br_table(pivot, money=[c for c in pivot.columns if c != "Categoria"]), use_container_width=True)
+
+            with st.expander("Categorias e regras"):
+                st.caption("Padrões separados por \";\" (sem diferenciar maiúsculas e acentos); /.../ é regex. "
+                           "A primeira categoria da lista que casar com a descrição ganha.")
+                cats = categories.load(db, user_id)
+                if not cats and st.button("Criar categorias sugeridas"):
+                    services.save_categories(db, user_id, [{"name": n, "patterns": p} for n, p in categories.SUGGESTED])
+                    cache.invalidate(user_id)
+                    submit_job(user_id, "categorize")
+                    st.rerun()
+                edited = st.data_editor(
+                    pd.DataFrame([{"id": c.id, "Nome": c.name, "Padrões": c.patterns} for c in cats],
+                                 columns=["id", "Nome", "Padrões"]),
+                    num_rows="dynamic", hide_index=True, use_container_width=True, key="cat_editor",
+                    column_config={"id": None},
+                )
+                if st.button("Salvar e reaplicar às movimentações"):
+                    edited = edited.astype(object).where(edited.notna(), None)  # linhas novas vêm com NaN
+                    try:
+                        services.save_categories(db, user_id, [
+                            {"id": None if r["id"] is None else int(r["id"]), "name": r["Nome"], "patterns": r["Padrões"]}
+                            for r in edited.to_dict("records")
+                        ])
+                    except ValueError as e:
+                        st.error(str(e))
+                    else:
+                        cache.invalidate(user_id)
+                        submit_job(user_id, "categorize")
+                jobs_panel(user_id, ("categorize",))
+
+    elif page == "Calendário":
+        import pandas as pd
+        st.title("🗓️ Calendário de Despesas")
+        with get_db() as db:
+            bucket_names = {bk.id: bk.name for bk in load_buckets(db, user_id)}
+            with st.form("nova_conta"):
+                title = st.text_input("Título", placeholder="Ex.: Cartão C6 - Fatura")
+                amount_str = st.text_input("Valor (R$)", value="")
+                amount = parse_money_br(amount_str) if amount_str else ZERO
+                due = st.date_input("Vencimento", value=date.today())
+                critical = st.checkbox("Crítica (cartão/ empréstimo/ consórcio)")
+                bucket_choice = st.selectbox("Balde que paga", [None] + list(bucket_names), format_func=lambda i: bucket_names.get(i, "Automático"))
+                submitted = st.form_submit_button("Adicionar")
+                if submitted and title.strip():
+                    save_bill(db, user_id, None, title=title, amount=amount, due_date=due, is_critical=critical, bucket_id=bucket_choice)
+                    st.success("Conta adicionada.")
+
+            bills = load_bills(db, user_id)
+            if bills:
+                df = pd.DataFrame([{"ID": b.id, "Título": b.title, "Valor": b.amount, "Vencimento": b.due_date, "Crítica": b.is_critical, "Paga": b.paid} for b in bills])
+                st.dataframe(br_table(df, money=["Valor"], dates=["Vencimento"]), use_container_width=True)
+
+                if bucket_names:
+                    st.subheader(f"Saldo previsto por Balde ({FORECAST_DAYS} dias)")
+                    st.line_chart(get_forecast(db, user_id).frame())
+
+                st.subheader("Editar conta")
+                ids = [b.id for b in bills]
+                sel = st.selectbox("Escolha o ID", ids) if ids else None
+                if sel:
+                    b = next(x for x in bills if x.id == sel)
+                    with st.form(f"edit_bill_{sel}"):
+                        title2 = st.text_input("Título", value=b.title)
+                        amount2_str = st.text_input("Valor (R$)", value=str(b.amount).replace('.', ','))
+                        amount2 = parse_money_br(amount2_str) if amount2_str else b.amount
+                        due2 = st.date_input("Vencimento", value=b.due_date)
+                        critical2 = st.checkbox("Crítica", value=b.is_critical)
+                        paid2 = st.checkbox("Paga", value=b.paid)
+                        options = [None] + list(bucket_names)
+                        bucket2 = st.selectbox("Balde que paga", options, index=options.index(b.bucket_id) if b.bucket_id in options else 0,
+                                               format_func=lambda i: bucket_names.get(i, "Automático"))
+                        confirm = st.checkbox("Confirmar alterações")
+                        sb = st.form_submit_button("Salvar alterações")
+                        if sb and confirm:
+                            save_bill(db, user_id, b.id, title=title2, amount=amount2, due_date=due2, is_critical=critical2,
+                                      paid=paid2, bucket_id=bucket2)
+                            st.success("Conta atualizada!")
+                        elif sb and not confirm:
+                            st.warning("Confirme as alterações marcando a caixa.")
+
+    elif page == "Atrasos & Riscos":
+        import pandas as pd
+        st.title("⏰ Atrasos & Riscos")
+        today = date.today()
+        with get_db() as db:
+            bills = load_unpaid_bills(db, user_id, today + timedelta(days=3))
+            overdue = [b for b in bills if b.due_date < today]
+            due_soon = [b for b in bills if b.due_date >= today]
+
+            st.subheader("Vencidas")
+            if overdue:
+                df1 = pd.DataFrame([{"ID": b.id, "Título": b.title, "Valor": b.amount, "Venceu em": b.due_date, "Crítica": b.is_critical, "Paga": b.paid} for b in overdue])
+                st.dataframe(br_table(df1, money=["Valor"], dates=["Venceu em"]), use_container_width=True)
+                ids1 = [b.id for b in overdue]
+                sel1 = st.selectbox("ID vencida", ids1) if ids1 else None
+                if sel1:
+                    b = next(x for x in bills if x.id == sel1)
+                    with st.form(f"edit_overdue_{sel1}"):
+                        title2 = st.text_input("Título", value=b.title)
+                        amount2_str = st.text_input("Valor (R$)", value=str(b.amount).replace('.', ','))
+                        amount2 = parse_money_br(amount2_str) if amount2_str else b.amount
+                        due2 = st.date_input("Vencimento", value=b.due_date)
+                        critical2 = st.checkbox("Crítica", value=b.is_critical)
+                        paid2 = st.checkbox("Paga", value=b.paid)
+                        confirm = st.checkbox("Confirmar alterações")
+                        sb = st.form_submit_button("Salvar")
+                        if sb and confirm:
+                            save_bill(db, user_id, b.id, title=title2, amount=amount2, due_date=due2, is_critical=critical2, paid=paid2)
+                            st.success("Atualizada!")
+                        elif sb and not confirm:
+                            st.warning("Confirme as alterações marcando a caixa.")
+
+            else:
+                st.write("Sem contas vencidas.")
+
+            st.subheader("Vencendo em até 3 dias")
+            if due_soon:
+                df2 = pd.DataFrame([{"ID": b.id, "Título": b.title, "Valor": b.amount, "Vencimento": b.due_date, "Crítica": b.is_critical, "Paga": b.paid} for b in due_soon])
+                st.dataframe(br_table(df2, money=["Valor"], dates=["Vencimento"]), use_container_width=True)
+                ids2 = [b.id for b in due_soon]
+                sel2 = st.selectbox("ID a vencer", ids2) if ids2 else None
+                if sel2:
+                    b = next(x for x in bills if x.id == sel2)
+                    with st.form(f"edit_duesoon_{sel2}"):
+                        title2 = st.text_input("Título", value=b.title)
+                        amount2_str = st.text_input("Valor (R$)", value=str(b.amount).replace('.', ','))
+                        amount2 = parse_money_br(amount2_str) if amount2_str else b.amount
+                        due2 = st.date_input("Vencimento", value=b.due_date)
+                        critical2 = st.checkbox("Crítica", value=b.is_critical)
+                        paid2 = st.checkbox("Paga", value=b.paid)
+                        confirm = st.checkbox("Confirmar alterações")
+                        sb = st.form_submit_button("Salvar")
+                        if sb and confirm:
+                            save_bill(db, user_id, b.id, title=title2, amount=amount2, due_date=due2, is_critical=critical2, paid=paid2)
+                            st.success("Atualizada!")
+                        elif sb and not confirm:
+                            st.warning("Confirme as alterações marcando a caixa.")
+            else:
+                st.write("Sem contas críticas nos próximos 3 dias.")
+
+            st.subheader(f"Riscos de saldo (próximos {FORECAST_DAYS} dias)")
+            alerts = get_forecast(db, user_id).alerts()
+            if alerts:
+                df3 = pd.DataFrame([{"Conta": a["title"], "Vencimento": a["date"], "Balde": a["bucket"], "Valor": a["amount"],
+                                     "Saldo previsto": a["balance"]} for a in alerts])
+                st.dataframe(br_table(df3, money=["Valor", "Saldo previsto"], dates=["Vencimento"]), use_container_width=True)
+                st.caption("Contas críticas que deixariam o balde negativo no vencimento, pela média das entradas recentes.")
+            else:
+                st.write("Nenhuma conta crítica deixa um balde negativo na previsão.")
+
+    elif page == "Configurações":
+        st.title("⚙️ Configurações")
+        st.write("Altere o usuário ativo pela barra lateral.")
+        st.subheader("Manutenção")
+        st.caption("Refaz os totais mensais e por categoria a partir das movimentações e confere os saldos com o log "
+                   "de eventos, sem alterá-lo (roda em segundo plano).")
+        if st.button("Recalcular totais e conferir saldos"):
+            submit_job(user_id, "rebuild")
+        jobs_panel(user_id, ("rebuild",))
+        if st.button("Reset (apagar meus dados)"):
+            services.reset_user(get_router(), user_id)
+            cache.invalidate(user_id)
+            for key in ("user_id", "user_name", "forecast"):
+                st.session_state.pop(key, None)
+            st.success("Seus dados foram apagados. Recarregue e entre de novo para começar do zero.")
+    elif page == "Diagnóstico":
+        import pandas as pd
+        st.title("🩺 Diagnóstico")
+        st.caption("Métricas dos reruns deste processo (todas as sessões). Log JSON: "
+                   + (instrument.LOG_PATH or "desligado (defina DIAGNOSTICS_LOG)"))
+        summ = instrument.summary()
+        if summ:
+            st.subheader("Por página (médias)")
+            st.dataframe(pd.DataFrame(summ).round(2).rename(columns={
+                "page": "Página", "reruns": "Reruns", "queries": "Queries", "rows": "Linhas", "db_ms": "Banco (ms)",
+                "render_ms": "Total (ms)", "max_render_ms": "Máx. (ms)"}), use_container_width=True)
+        runs = instrument.recent()
+        if runs:
+            st.subheader("Reruns recentes")
+            st.dataframe(pd.DataFrame([{
+                "Hora": time.strftime("%H:%M:%S", time.localtime(r.started)), "Página": r.page, "Queries": r.queries,
+                "Linhas": r.rows, "Banco (ms)": round(1000 * r.db_seconds, 1), "Total (ms)": round(1000 * r.render_seconds, 1),
+                "Interrompido": r.error or "", "Perfil": "sim" if r.profile else "",
+            } for r in runs]), use_container_width=True)
+            idx = st.selectbox("Detalhar rerun", range(len(runs)),
+                               format_func=lambda i: f"{time.strftime('%H:%M:%S', time.localtime(runs[i].started))} — {runs[i].page}")
+            st.dataframe(pd.DataFrame(runs[idx].top_statements()), use_container_width=True)
+            if runs[idx].profile:
+                st.code(runs[idx].profile)
+
+        st.subheader("Perfilar (cProfile)")
+        target = st.selectbox("Página", [p for p in PAGES if p != "Diagnóstico"], key="diag_target")
+        if st.button("Perfilar o próximo rerun desta página"):
+            st.session_state["diag_profile"] = target
+            st.info("Abra a página escolhida; o perfil aparece aqui em seguida.")
@@ -0,0 +1,711 @@
+import argparse
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import List, Optional
+from sqlalchemy import create_engine, insert, select, case, func
+from sqlalchemy.orm import sessionmaker
+from models import User, Bucket, Movement
+import migrations
+
+# Benchmarks de desenvolvimento: python bench.py <nome> [--sizes 10000 100000]
+
+def make_db(path: str, n_movements: int, seed: int = 42):
+    engine = create_engine(f"sqlite:///{path}")
+    migrations.upgrade(engine)
+    Session = sessionmaker(bind=engine)
+    rnd = random.Random(seed)
+    with Session() as db:
+        u = User(name="bench")
+        db.add(u)
+        db.commit()
+        buckets = [Bucket(user_id=u.id, name=f"Balde {i}", percent=20, balance=0) for i in range(5)]
+        db.add_all(buckets)
+        db.commit()
+        start = date.today() - timedelta(days=max(1, n_movements // 20))
+        batch = []
+        for i in range(n_movements):
+            batch.append({
+                "user_id": u.id,
+                "bucket_id": buckets[i % 5].id,
+                "kind": rnd.choice(("income", "income", "expense", "transfer")),
+                "amount": round(rnd.uniform(1, 5000), 2),
+                "description": f"Movimentação {i}",
+                "date": start + timedelta(days=i // 20),
+            })
+            if len(batch) == 10000:
+                db.execute(insert(Movement), batch)
+                batch = []
+        if batch:
+            db.execute(insert(Movement), batch)
+        db.commit()
+        return engine, Session, u.id
+
+def measure(fn):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    out = fn()
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return out, elapsed, peak
+
+def bench_export(sizes):
+    import pandas as pd
+    import export
+    from ledger import ledger_query
+    from formatting import money_br, date_br
+
+    print(f"{'linhas':>10} {'modo':<16} {'tempo (s)':>10} {'pico (MB)':>10}")
+    for n in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            engine, Session, user_id = make_db(os.path.join(tmp, "bench.db"), n)
+            with Session() as db:
+                # Caminho antigo: DataFrame formatado completo + to_csv + encode
+                def dataframe_csv():
+                    rows = db.execute(ledger_query(user_id)).all()
+                    df = pd.DataFrame([{"Data": date_br(r.date), "Tipo": r.kind, "Balde": r.bucket_name, "Valor": money_br(r.amount), "Descrição": r.description} for r in rows])
+                    return len(df.to_csv(index=False).encode("utf-8"))
+
+                def streaming_csv():
+                    with open(os.path.join(tmp, "out.csv"), "w", encoding="utf-8", newline="") as out:
+                        return export.write_csv(out, db, user_id)
+
+                def streaming_xlsx():
+                    return export.write_xlsx(os.path.join(tmp, "out.xlsx"), db, user_id)
+
+                for label, fn in (("dataframe_csv", dataframe_csv), ("streaming_csv", streaming_csv), ("streaming_xlsx", streaming_xlsx)):
+                    _, elapsed, peak = measure(fn)
+                    print(f"{n:>10} {label:<16} {elapsed:>10.2f} {peak / 2**20:>10.1f}")
+            engine.dispose()
+
+def bench_splits(sizes):
+    # O lote é medido quente e já com arrays: conversão de listas e imports preguiçosos (pandas) ficam fora
+    from types import SimpleNamespace
+    import numpy as np
+    from logic import compute_bucket_splits, compute_bucket_splits_batch, payoff_efficiency, payoff_efficiency_batch
+    from money import to_cents, from_cents
+
+    rnd = random.Random(42)
+    buckets = [SimpleNamespace(id=i, name=f"Balde {i}", percent=p) for i, p in enumerate((10, 50, 20, 15, 5))]
+    print(f"{'n':>10} {'função':<22} {'laço (s)':>10} {'lote (s)':>10} {'ganho':>8}")
+    for n in sizes:
+        incomes = [rnd.randint(100, 5_000_000) for _ in range(n)]  # centavos
+        t0 = time.perf_counter()
+        loop = [[to_cents(s["value"]) for s in compute_bucket_splits(buckets, from_cents(c))] for c in incomes]
+        t_loop = time.perf_counter() - t0
+        incomes_arr = np.asarray(incomes, dtype="int64")
+        compute_bucket_splits_batch(buckets, incomes_arr[:10])
+        t0 = time.perf_counter()
+        batch = compute_bucket_splits_batch(buckets, incomes_arr)
+        t_batch = time.perf_counter() - t0
+        assert batch.tolist() == loop, "lote diverge do escalar"
+        print(f"{n:>10} {'compute_bucket_splits':<22} {t_loop:>10.4f} {t_batch:>10.4f} {t_loop / t_batch:>7.1f}x")
+
+        totals = [rnd.randint(10_000, 10_000_000) for _ in range(n)]
+        inputs = [rnd.randint(0, 500_000) for _ in range(n)]
+        t0 = time.perf_counter()
+        loop = [payoff_efficiency(SimpleNamespace(total_to_pay=from_cents(t)), from_cents(m)) for t, m in zip(totals, inputs)]
+        t_loop = time.perf_counter() - t0
+        totals_arr, inputs_arr = np.asarray(totals, dtype="int64"), np.asarray(inputs, dtype="int64")
+        payoff_efficiency_batch(totals_arr[:10], inputs_arr[:10])
+        t0 = time.perf_counter()
+        df = payoff_efficiency_batch(totals_arr, inputs_arr)
+        t_batch = time.perf_counter() - t0
+        assert df["r_per_1k"].tolist() == [r["r_per_1k"] for r in loop], "lote diverge do escalar"
+        print(f"{n:>10} {'payoff_efficiency':<22} {t_loop:>10.4f} {t_batch:>10.4f} {t_loop / t_batch:>7.1f}x")
+
+def bench_import(sizes):
+    import resource
+    import importer
+
+    print(f"{'linhas':>10} {'tempo (s)':>10} {'linhas/s':>10} {'RSS máx (MB)':>13}")
+    for n in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            engine, Session, user_id = make_db(os.path.join(tmp, "bench.db"), 0)
+            path = os.path.join(tmp, "extrato.csv")
+            rnd = random.Random(n)
+            start = date.today() - timedelta(days=max(1, n // 50))
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("Data;Histórico;Valor\n")
+                for i in range(n):
+                    d = start + timedelta(days=i // 50)
+                    valor = f"{rnd.uniform(-2000, 3000):.2f}".replace(".", ",")
+                    f.write(f"{d:%d/%m/%Y};{rnd.choice(('PIX', 'UBER', 'NUBANK', 'MERCADO'))} {i % 997};{valor}\n")
+            with Session() as db:
+                buckets = db.query(Bucket).all()
+                rules = importer.parse_rules(f"nubank => {buckets[3].name}\nuber => {buckets[1].name}", buckets)
+                matcher = importer.RuleMatcher(rules, buckets[0].id)
+                with open(path, encoding="utf-8", newline="") as f:
+                    report = importer.import_file(db, user_id, f, path, matcher)
+            rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+            print(f"{n:>10} {report['seconds']:>10.2f} {report['rows_per_sec']:>10.0f} {rss:>13.0f}")
+            engine.dispose()
+
+def bench_pragmas(sizes):
+    import shutil
+    import statistics
+    from db import make_engine, make_session_factory
+    import ledger
+    import rollups
+    from aggregates import dashboard_totals
+    from money import to_money
+
+    def timed(fn, repeat):
+        samples = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            fn()
+            samples.append((time.perf_counter() - t0) * 1000)
+        return statistics.median(samples)
+
+    print(f"{'linhas':>10} {'engine':<10} {'dashboard':>10} {'ledger p1':>10} {'ledger p50':>11} {'baldes':>8} {'lançar':>8}  (mediana, ms)")
+    for n in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            base = os.path.join(tmp, "base.db")
+            engine, Session, user_id = make_db(base, n)
+            with Session() as db:
+                rollups.rebuild(db)
+            engine.dispose()
+            # Cópias separadas: journal_mode=WAL persiste no arquivo
+            for label in ("padrão", "ajustado"):
+                path = os.path.join(tmp, f"{label}.db")
+                shutil.copy(base, path)
+                url = f"sqlite:///{path}"
+                eng = create_engine(url) if label == "padrão" else make_engine(url)
+                S = make_session_factory(eng)
+                with S() as db:
+                    bucket_id = db.query(Bucket.id).filter(Bucket.user_id == user_id).first()[0]
+                    deep = None
+                    for _ in range(50):
+                        rows, _more = ledger.fetch_page(db, user_id, after=deep)
+                        deep = ledger.cursor_of(rows[-1]) if rows else None
+
+                    def lancar():
+                        db.add(Movement(user_id=user_id, bucket_id=bucket_id, kind="income", amount=to_money("1.00"), description="bench", date=date.today()))
+                        db.commit()
+
+                    res = [
+                        timed(lambda: dashboard_totals(db, user_id), 20),
+                        timed(lambda: ledger.fetch_page(db, user_id), 20),
+                        timed(lambda: ledger.fetch_page(db, user_id, after=deep), 20),
+                        timed(lambda: db.query(Bucket).filter(Bucket.user_id == user_id).all(), 20),
+                        timed(lancar, 50),
+                    ]
+                print(f"{n:>10} {label:<10} {res[0]:>10.2f} {res[1]:>10.2f} {res[2]:>11.2f} {res[3]:>8.2f} {res[4]:>8.2f}")
+                eng.dispose()
+
+def bench_stress(sizes):
+    # Escritores concorrentes (threads com sessões próprias) no mesmo arquivo SQLite.
+    # Ao final, os saldos dos baldes precisam bater com as movimentações (rollups.verify).
+    import threading
+    from sqlalchemy.exc import OperationalError
+    from db import make_engine, make_session_factory
+    import rollups
+    import services
+    from money import from_cents
+
+    def legacy_op(db, user_id, rnd, bucket_ids):
+        # Caminho antigo: ler saldo no Python, checar, somar e gravar
+        b = db.get(Bucket, rnd.choice(bucket_ids))
+        val = from_cents(rnd.randint(1, 5000))
+        if b.balance - val >= 0:
+            db.add(Movement(user_id=user_id, bucket_id=b.id, kind="expense", amount=val, description="stress", date=date.today()))
+            rollups.bump(db, user_id, b.id, "expense", date.today(), val)
+            b.balance -= val
+        db.commit()
+
+    def service_op(db, user_id, rnd, bucket_ids):
+        val = from_cents(rnd.randint(1, 5000))
+        try:
+            services.post_movement(db, user_id, rnd.choice(bucket_ids), "expense", val, date.today(), "stress")
+        except services.InsufficientFunds:
+            pass
+
+    threads_n = 8
+    print(f"{'ops':>8} {'modo':<10} {'tempo (s)':>10} {'ops/s':>8} {'divergências':>13} {'negativos':>10}")
+    for n in sizes:
+        for label, op in (("antigo", legacy_op), ("atômico", service_op)):
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, "stress.db")
+                engine, Session, user_id = make_db(path, 0)
+                engine.dispose()
+                eng = make_engine(f"sqlite:///{path}")
+                S = make_session_factory(eng)
+                with S() as db:
+                    bucket_ids = [b.id for b in db.query(Bucket).filter(Bucket.user_id == user_id)]
+                    services.post_income_split(db, user_id, db.query(Bucket).all(), from_cents(n * 1500), date.today())
+                errors = []
+
+                def worker(seed):
+                    rnd = random.Random(seed)
+                    with S() as db:
+                        for _ in range(n // threads_n):
+                            for attempt in range(20):
+                                try:
+                                    op(db, user_id, rnd, bucket_ids)
+                                    break
+                                except OperationalError:
+                                    db.rollback()
+                                    time.sleep(0.01 * rnd.random())
+                            else:
+                                errors.append("desistiu após 20 tentativas")
+
+                t0 = time.perf_counter()
+                ts = [threading.Thread(target=worker, args=(i,)) for i in range(threads_n)]
+                for t in ts:
+                    t.start()
+                for t in ts:
+                    t.join()
+                elapsed = time.perf_counter() - t0
+                with S() as db:
+                    drift = rollups.verify(db, user_id)
+                    negatives = db.query(Bucket).filter(Bucket.balance < 0).count()
+                print(f"{n:>8} {label:<10} {elapsed:>10.2f} {n / elapsed:>8.0f} {len(drift):>13} {negatives:>10}")
+                eng.dispose()
+                if label == "atômico" and (drift or negatives or errors):
+                    raise SystemExit(f"Inconsistência com o serviço atômico: {drift[:3]} {errors[:3]}")
+
+def bench_formatting(sizes):
+    from babel.numbers import format_currency
+    from babel.dates import format_date
+    from datetime import date, timedelta
+    from money import from_cents
+    import formatting
+
+    rnd = random.Random(42)
+    print(f"{'n':>10} {'função':<16} {'babel (s)':>10} {'escalar (s)':>12} {'coluna (s)':>11} {'ganho':>8}")
+    for n in sizes:
+        values = [from_cents(rnd.randint(-10**9, 10**9)) for _ in range(n)]
+        t0 = time.perf_counter()
+        ref = [format_currency(v, "BRL", locale="pt_BR") for v in values]
+        t_babel = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        scalar = [formatting.money_br(v) for v in values]
+        t_scalar = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        column = formatting.money_br_series(values).tolist()
+        t_col = time.perf_counter() - t0
+        assert scalar == ref and column == ref, "formatação diverge do babel"
+        print(f"{n:>10} {'money_br':<16} {t_babel:>10.4f} {t_scalar:>12.4f} {t_col:>11.4f} {t_babel / t_col:>7.0f}x")
+
+        dates = [date(2020, 1, 1) + timedelta(days=rnd.randint(0, 3000)) for _ in range(n)]
+        t0 = time.perf_counter()
+        ref = [format_date(d, format="short", locale="pt_BR") for d in dates]
+        t_babel = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        scalar = [formatting.date_br(d) for d in dates]
+        t_scalar = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        column = formatting.date_br_series(dates).tolist()
+        t_col = time.perf_counter() - t0
+        assert scalar == ref and column == ref, "formatação diverge do babel"
+        print(f"{n:>10} {'date_br':<16} {t_babel:>10.4f} {t_scalar:>12.4f} {t_col:>11.4f} {t_babel / t_col:>7.0f}x")
+
+        texts = [formatting.money_br(v).replace(formatting.POS_PREFIX[:-1], "").replace("\xa0", "") for v in values]
+        t0 = time.perf_counter()
+        scalar = [formatting.parse_money_br(t) for t in texts]
+        t_scalar = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        column = formatting.parse_money_br_series(texts).tolist()
+        t_col = time.perf_counter() - t0
+        assert column == [int(v * 100) for v in scalar], "leitura em lote diverge do escalar"
+        print(f"{n:>10} {'parse_money_br':<16} {'-':>10} {t_scalar:>12.4f} {t_col:>11.4f} {t_scalar / t_col:>7.1f}x")
+
+def bench_simulator(sizes):
+    from types import SimpleNamespace
+    import simulator
+
+    # sizes = número de orçamentos simulados de uma vez (varredura)
+    rnd = random.Random(42)
+    giants = [
+        SimpleNamespace(id=i, name=f"Gigante {i}", total_to_pay=round(rnd.uniform(1_000, 50_000), 2),
+                        months_left=rnd.choice((0, 6, 12, 24, 48)), priority=rnd.randint(1, 5),
+                        interest_rate=round(rnd.uniform(0, 6), 2), status="active")
+        for i in range(12)
+    ]
+    print(f"{'orçamentos':>10} {'gigantes':>9} {'tempo (s)':>10} {'meses (máx)':>12} {'sem quitação':>13}")
+    for n in sizes:
+        budgets = [round(2_000 + 38_000 * i / max(1, n - 1), 2) for i in range(n)]
+        out, elapsed, _ = measure(lambda: simulator.simulate(giants, budgets))
+        mtf = out["months_to_freedom"]
+        print(f"{n:>10} {len(giants):>9} {elapsed:>10.4f} {int(mtf.max()):>12} {int((mtf < 0).sum()):>13}")
+
+def bench_api(sizes, threads: int = 8, batch: int = 100):
+    # Sobe a API (uvicorn) num processo à parte sobre um SQLite temporário e mede requisições/s
+    import http.client
+    import json
+    import socket
+    import subprocess
+    import sys
+    import threading
+    from rollups import verify
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "api.db")
+        engine, Session, uid = make_db(path, 0)
+        engine.dispose()
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{path}", API_TOKEN="")
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "api:app", "--port", str(port), "--log-level", "warning"],
+            cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+        )
+        try:
+            for _ in range(100):
+                try:
+                    http.client.HTTPConnection("127.0.0.1", port, timeout=1).request("GET", "/health")
+                    break
+                except OSError:
+                    time.sleep(0.1)
+
+            def run(n, make_body, url):
+                errors = []
+                per_thread = n // threads
+
+                def worker(t):
+                    con = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+                    for i in range(per_thread):
+                        con.request("POST", url, json.dumps(make_body(t, i)), {"Content-Type": "application/json"})
+                        r = con.getresponse()
+                        r.read()
+                        if r.status != 200:
+                            errors.append(r.status)
+                    con.close()
+
+                ts = [threading.Thread(target=worker, args=(t,)) for t in range(threads)]
+                t0 = time.perf_counter()
+                for t in ts:
+                    t.start()
+                for t in ts:
+                    t.join()
+                return per_thread * threads, time.perf_counter() - t0, errors
+
+            today = date.today().isoformat()
+            print(f"{'req':>8} {'rota':<16} {'tempo (s)':>10} {'req/s':>8} {'entradas/s':>11} {'erros':>6}")
+            for n in sizes:
+                tag = f"n{n}"
+                done, elapsed, errors = run(
+                    n, lambda t, i: {"total": "123.45", "date": today, "ref": f"{tag}-{t}-{i}"}, f"/users/{uid}/incomes")
+                print(f"{done:>8} {'incomes':<16} {elapsed:>10.2f} {done / elapsed:>8.0f} {done / elapsed:>11.0f} {len(errors):>6}")
+                nb = max(threads, n // batch)
+                done, elapsed, errors = run(nb, lambda t, i: {"items": [
+                    {"total": "123.45", "date": today, "ref": f"{tag}-b{t}-{i}-{k}"} for k in range(batch)
+                ]}, f"/users/{uid}/incomes/batch")
+                print(f"{done:>8} {'incomes/batch':<16} {elapsed:>10.2f} {done / elapsed:>8.0f} {done * batch / elapsed:>11.0f} {len(errors):>6}")
+        finally:
+            server.terminate()
+            server.wait()
+        with Session() as db:
+            drift = verify(db)
+        print("Rollups/saldos: " + ("OK" if not drift else f"{len(drift)} divergência(s)"))
+
+def _shard_writer(args):
+    # Um processo por usuário, como vários workers da API: n entradas, uma transação cada
+    from db import ShardRouter, make_engine
+    import services
+
+    catalog_path, mode, shard_dir, uid, n = args
+    router = ShardRouter(make_engine(f"sqlite:///{catalog_path}"), mode, shard_dir)
+    with router.session(uid) as db:
+        buckets = list(db.execute(select(Bucket).where(Bucket.user_id == uid).order_by(Bucket.id)).scalars())
+        t0 = time.perf_counter()
+        for i in range(n):
+            services.post_incomes(db, uid, buckets, [{"total": Decimal("123.45"), "date": date.today(), "ref": None}])
+        elapsed = time.perf_counter() - t0
+    router.dispose()
+    return elapsed
+
+def bench_shards(sizes, users: int = 8):
+    # Escritas simultâneas de vários usuários: banco único (um lock de escrita) x um SQLite por usuário
+    import multiprocessing
+    from db import ShardRouter, make_engine
+    from rollups import verify
+    import services
+
+    print(f"{'escritas':>9} {'usuários':>9} {'modo':<8} {'tempo (s)':>10} {'escritas/s':>11} {'divergências':>13}")
+    for n in sizes:
+        for mode in ("shared", "sharded"):
+            with tempfile.TemporaryDirectory() as tmp:
+                catalog_path, shard_dir = os.path.join(tmp, "davi.db"), os.path.join(tmp, "shards")
+                router = ShardRouter(make_engine(f"sqlite:///{catalog_path}"), mode, shard_dir)
+                migrations.upgrade(router.catalog)
+                with router.session() as db:
+                    uids = []
+                    for u in range(users):
+                        user = User(name=f"bench {u}")
+                        db.add(user)
+                        db.flush()
+                        uids.append(user.id)
+                    db.commit()
+                for uid in uids:
+                    with router.session(uid) as db:
+                        for name, p in (("Operacional", 60), ("Dívidas", 30), ("Colchão", 10)):
+                            services.create_bucket(db, uid, name, p)
+                router.dispose()
+
+                t0 = time.perf_counter()
+                with multiprocessing.Pool(users) as pool:
+                    pool.map(_shard_writer, [(catalog_path, mode, shard_dir, uid, n // users) for uid in uids])
+                elapsed = time.perf_counter() - t0
+                drift = 0
+                for uid in uids:
+                    with router.session(uid) as db:
+                        drift += len(verify(db, uid))
+                router.dispose()
+                done = n // users * users
+                print(f"{done:>9} {users:>9} {mode:<8} {elapsed:>10.2f} {done / elapsed:>11.0f} {drift:>13}")
+
+def bench_pages(sizes, repeat: int = 5):
+    # Caminho de leitura de cada página sobre dados do datagen, com cache frio (como o 1º acesso)
+    import statistics
+    import cache
+    import categories
+    import datagen
+    import events
+    import export
+    import forecast
+    import ledger
+    import sandbox
+    import services
+    import simulator
+    from aggregates import dashboard_totals, bucket_history, debt_budget
+    from db import make_engine
+    from logic import compute_bucket_splits
+
+    results = []
+    print(f"{'movim.':>9} {'caminho':<18} {'mediana (s)':>12} {'melhor (s)':>11}")
+    for n in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = make_engine(f"sqlite:///{os.path.join(tmp, 'pages.db')}")
+            # Até ~20 mil movimentações por usuário (~9 anos); acima disso, mais usuários
+            gen = datagen.generate(engine, users=max(1, n // 20_000), movements=n)
+            Session = sessionmaker(bind=engine)
+            user_id = 1
+
+            def with_db(fn):
+                def run():
+                    cache.read_cache.clear()
+                    with Session() as db:
+                        return fn(db)
+                return run
+
+            def first_pages(db, pages=5):
+                after = None
+                for _ in range(pages):
+                    rows, more = ledger.fetch_page(db, user_id, after)
+                    after = ledger.cursor_of(rows[-1])
+                return len(rows)
+
+            def export_csv(db):
+                with open(os.path.join(tmp, "out.csv"), "w", encoding="utf-8", newline="") as out:
+                    return export.write_csv(out, db, user_id)
+
+            def simulation(db):
+                active = [g for g in cache.load_giants(db, user_id) if g.status == "active"]
+                budget = debt_budget(db, user_id)
+                return simulator.simulate(active, [float(budget) * f for f in (0.5, 1, 1.5, 2)])
+
+            def split(db):
+                buckets = cache.load_buckets(db, user_id)
+                compute_bucket_splits(buckets, 1234.56)
+                return services.post_income_split(db, user_id, buckets, 1234.56, date.today())
+
+            def what_if(db, plans=20):
+                # Sandbox: snapshot de 24 meses + replay de 20 planos de percentuais (variações do atual)
+                snap = sandbox.take(db, user_id, 24)
+                rnd = random.Random(7)
+                return sandbox.replay(snap, [
+                    sandbox.plan(snap, f"Plano {i}", {b.id: b.percent * rnd.uniform(0.5, 1.5) for b in snap.buckets})
+                    for i in range(plans)
+                ])
+
+            def replay(db):
+                # Saldo numa data sem snapshots: soma todas as movimentações até ela
+                signed = case((Movement.kind == "income", Movement.amount), else_=-Movement.amount)
+                return db.execute(select(Movement.bucket_id, func.sum(signed))
+                                  .where(Movement.user_id == user_id, Movement.date <= past)
+                                  .group_by(Movement.bucket_id)).all()
+
+            past = date.today() - timedelta(days=30)
+            paths = {
+                "load_buckets": lambda db: cache.load_buckets(db, user_id),
+                "load_giants": lambda db: cache.load_giants(db, user_id),
+                "load_bills": lambda db: cache.load_bills(db, user_id),
+                "dashboard_totals": lambda db: dashboard_totals(db, user_id),
+                "bucket_history": lambda db: bucket_history(db, user_id),
+                "balances_at_30d": lambda db: events.balances_at(db, user_id, past),
+                "balances_replay": replay,
+                "analytics_12m": lambda db: categories.monthly(db, user_id, start=date.today() - timedelta(days=365)),
+                "entrada_split": split,
+                "ledger_5_pages": first_pages,
+                "forecast_90d": lambda db: forecast.build(db, user_id),
+                "simulator": simulation,
+                "sandbox_20x24m": what_if,
+                "export_csv": export_csv,
+            }
+            for name, fn in paths.items():
+                run = with_db(fn)
+                times = []
+                for _ in range(repeat):
+                    t0 = time.perf_counter()
+                    run()
+                    times.append(time.perf_counter() - t0)
+                med, best = statistics.median(times), min(times)
+                print(f"{gen['movements']:>9} {name:<18} {med:>12.4f} {best:>11.4f}")
+                results.append({"bench": "pages", "size": n, "movements": gen["movements"], "path": name,
+                                "seconds": med, "best": best, "repeat": repeat})
+            engine.dispose()
+    return results
+
+# Roda num interpretador novo (nada importado ainda): mede o import do streamlit, o 1º render (tela de login)
+# e o 1º render de uma página já logado, e quais módulos pesados cada etapa carregou
+_STARTUP_PROBE = """
+import json, sys, time
+t0 = time.perf_counter()
+import streamlit
+out = {"import_streamlit": time.perf_counter() - t0}
+from streamlit.testing.v1 import AppTest
+HEAVY = ("sqlalchemy", "pandas", "numpy", "babel", "altair", "pyarrow", "openpyxl")
+at = AppTest.from_file(sys.argv[1], default_timeout=300)
+t0 = time.perf_counter()
+at.run()
+out["login"] = time.perf_counter() - t0
+out["login_modules"] = [m for m in HEAVY if m in sys.modules]
+if sys.argv[2]:
+    at.session_state["user_id"] = int(sys.argv[3])
+    at.sidebar.radio[0].set_value(sys.argv[2])
+    t0 = time.perf_counter()
+    at.run()
+    out["page"] = time.perf_counter() - t0
+    out["page_modules"] = [m for m in HEAVY if m in sys.modules]
+    out["errors"] = [e.message for e in at.exception]
+print(json.dumps(out))
+"""
+
+STARTUP_PAGES = ["Dashboard", "Plano de Ataque", "Baldes", "Entrada Diária", "Livro Caixa", "Análises",
+                 "Calendário", "Atrasos & Riscos", "Configurações"]
+
+def bench_startup(sizes, repeat: int = 3, app_path: Optional[str] = None):
+    # Partida a frio do app: cada medição é um processo novo (imports do zero), sobre dados do datagen
+    import json
+    import statistics
+    import subprocess
+    import sys
+    import datagen
+    from db import make_engine
+
+    app_path = app_path or os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+    results = []
+    print(f"{'movim.':>9} {'etapa':<26} {'mediana (s)':>12} {'melhor (s)':>11}  módulos pesados carregados")
+    for n in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, "davi.db")
+            engine = make_engine(f"sqlite:///{db_path}")
+            gen = datagen.generate(engine, users=1, movements=n)
+            engine.dispose()
+            env = dict(os.environ, DATABASE_URL=f"sqlite:///{db_path}", JOBS_WORKERS="0", STORAGE_MODE="shared")
+            env.pop("DIAGNOSTICS_LOG", None)
+
+            def probe(page: str) -> dict:
+                out = subprocess.run([sys.executable, "-c", _STARTUP_PROBE, app_path, page, "1"], cwd=tmp, env=env,
+                                     capture_output=True, text=True, check=True).stdout
+                return json.loads(out.strip().splitlines()[-1])
+
+            def report(name: str, times: List[float], modules: List[str]):
+                med, best = statistics.median(times), min(times)
+                print(f"{gen['movements']:>9} {name:<26} {med:>12.4f} {best:>11.4f}  {', '.join(modules) or '—'}")
+                results.append({"bench": "startup", "size": n, "movements": gen["movements"], "path": name,
+                                "seconds": med, "best": best, "repeat": repeat, "modules": modules})
+
+            runs = [probe("") for _ in range(repeat)]
+            report("import_streamlit", [r["import_streamlit"] for r in runs], [])
+            report("1º render (login)", [r["login"] for r in runs], runs[-1]["login_modules"])
+            for page in STARTUP_PAGES:
+                runs = [probe(page) for _ in range(repeat)]
+                if runs[-1]["errors"]:
+                    raise RuntimeError(f"{page}: {runs[-1]['errors']}")
+                report(f"1º render: {page}", [r["page"] for r in runs], runs[-1]["page_modules"])
+    return results
+
+def _meta() -> dict:
+    import platform
+    import subprocess
+    import sqlalchemy
+
+    def git(*args):
+        try:
+            return subprocess.run(["git", *args], capture_output=True, text=True, check=True,
+                                  cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    return {
+        "commit": git("rev-parse", "HEAD"),
+        "dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "sqlalchemy": sqlalchemy.__version__,
+        "platform": platform.platform(),
+    }
+
+NOISE_S = 0.002
+
+def compare(results, baseline_path: str, threshold: float) -> int:
+    # Compara com um JSON anterior (mesmo bench/tamanho/caminho); retorna quantas regressões
+    import json
+
+    with open(baseline_path, encoding="utf-8") as f:
+        base = {(r["bench"], r["size"], r["path"]): r for r in json.load(f)["results"]}
+    regressions = 0
+    print(f"\n{'movim.':>9} {'caminho':<18} {'antes (s)':>10} {'agora (s)':>10} {'razão':>7}  (melhor tempo)")
+    for r in results:
+        old = base.get((r["bench"], r["size"], r["path"]))
+        if not old:
+            continue
+        # Compara o melhor tempo (menos ruído); diferenças abaixo de NOISE_S não contam
+        ratio = r["best"] / old["best"] if old["best"] else float("inf")
+        flag = " <- regressão" if ratio > threshold and r["best"] - old["best"] > NOISE_S else ""
+        regressions += bool(flag)
+        print(f"{r['size']:>9} {r['path']:<18} {old['best']:>10.4f} {r['best']:>10.4f} {ratio:>6.2f}x{flag}")
+    return regressions
+
+BENCHES = {
+    "export": bench_export,
+    "splits": bench_splits,
+    "import": bench_import,
+    "pragmas": bench_pragmas,
+    "stress": bench_stress,
+    "simulator": bench_simulator,
+    "formatting": bench_formatting,
+    "api": bench_api,
+    "pages": bench_pages,
+    "shards": bench_shards,
+    "startup": bench_startup,
+}
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmarks do APP DAVI.")
+    parser.add_argument("bench", choices=sorted(BENCHES))
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 50_000, 100_000])
+    parser.add_argument("--json", default=None, help="Grava os resultados (benches que os devolvem) neste arquivo")
+    parser.add_argument("--baseline", default=None, help="JSON de uma execução anterior para comparar")
+    parser.add_argument("--threshold", type=float, default=1.25, help="Razão acima da qual conta como regressão")
+    args = parser.parse_args()
+    results = BENCHES[args.bench](args.sizes)
+    if args.json and results:
+        import json
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"meta": _meta(), "results": results}, f, indent=2)
+        print(f"Resultados gravados em {args.json}")
+    if args.baseline and results and compare(results, args.baseline, args.threshold):
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
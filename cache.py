@@ -0,0 +1,147 @@
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, fields
+from datetime import date
+from decimal import Decimal
+from typing import Callable, Hashable, List, Optional
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from models import Bucket, Giant, Bill
+
+# ---- Read models: cópias simples, desligadas da sessão (nada de lazy load nem flush acidental) ----
+
+@dataclass(frozen=True, slots=True)
+class BucketView:
+    id: int
+    user_id: int
+    name: str
+    description: Optional[str]
+    percent: float
+    type: Optional[str]
+    balance: Decimal
+
+@dataclass(frozen=True, slots=True)
+class GiantView:
+    id: int
+    user_id: int
+    name: str
+    total_to_pay: Decimal
+    months_left: int  # parcels (nº original de parcelas) fica de fora: o simulador só usa o que resta
+    priority: int
+    status: str
+    interest_rate: float
+
+@dataclass(frozen=True, slots=True)
+class BillView:
+    id: int
+    user_id: int
+    title: str
+    amount: Decimal
+    due_date: date
+    is_critical: bool
+    paid: bool
+    bucket_id: Optional[int]
+
+def _detach(obj, cls):
+    return cls(*(getattr(obj, f.name) for f in fields(cls)))
+
+# ---- Cache LRU por usuário, invalidado por versão ----
+
+class ReadCache:
+    # Chave = (user_id, versão do usuário, nome da leitura). Toda escrita do usuário incrementa
+    # a versão: entradas antigas deixam de ser encontradas e são descartadas na hora.
+    def __init__(self, maxsize: int = 512):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._data: "OrderedDict[tuple, object]" = OrderedDict()
+        self._versions = {}
+        self._revisions = {}
+        self.hits = 0
+        self.misses = 0
+
+    def version(self, user_id: int) -> int:
+        with self._lock:
+            return self._versions.get(user_id, 0)
+
+    def get_or_load(self, user_id: int, name: Hashable, loader: Callable[[], object]):
+        with self._lock:
+            key = (user_id, self._versions.get(user_id, 0), name)
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+        value = loader()  # fora do lock: a consulta ao banco não serializa outras sessões
+        with self._lock:
+            if key[1] == self._versions.get(user_id, 0):  # não guarda leitura que ficou velha
+                self._data[key] = value
+                self._data.move_to_end(key)
+                while len(self._data) > self.maxsize:
+                    self._data.popitem(last=False)
+        return value
+
+    def sync(self, user_id: int, revision: int) -> None:
+        # users.revision mudou sem passar por este processo (ex.: API): descarta o cache do usuário.
+        # Depois de um invalidate local a revisão nova é só registrada.
+        with self._lock:
+            seen = self._revisions.get(user_id)
+            self._revisions[user_id] = revision
+            stale = seen is not None and seen != revision
+        if stale:
+            self.invalidate(user_id)
+            with self._lock:
+                self._revisions[user_id] = revision
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+            self._revisions[user_id] = None
+            for key in [k for k in self._data if k[0] == user_id]:
+                del self._data[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            # Versões só crescem: um user_id reaproveitado nunca enxerga dados antigos
+            for uid in list(self._versions):
+                self._versions[uid] += 1
+            self._revisions.clear()
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+read_cache = ReadCache(int(os.environ.get("READ_CACHE_SIZE", "512")))
+
+def invalidate(user_id: int) -> None:
+    read_cache.invalidate(user_id)
+
+def cached(user_id: int, name: Hashable, loader: Callable[[], object]):
+    return read_cache.get_or_load(user_id, name, loader)
+
+# ---- Leituras cacheadas ----
+
+def load_buckets(db: Session, user_id: int) -> List[BucketView]:
+    return cached(user_id, "buckets", lambda: [
+        _detach(b, BucketView) for b in db.execute(select(Bucket).where(Bucket.user_id == user_id)).scalars()
+    ])
+
+def load_giants(db: Session, user_id: int) -> List[GiantView]:
+    return cached(user_id, "giants", lambda: [
+        _detach(g, GiantView) for g in db.execute(select(Giant).where(Giant.user_id == user_id)).scalars()
+    ])
+
+def load_bills(db: Session, user_id: int) -> List[BillView]:
+    return cached(user_id, "bills", lambda: [
+        _detach(b, BillView)
+        for b in db.execute(select(Bill).where(Bill.user_id == user_id).order_by(Bill.due_date.asc())).scalars()
+    ])
+
+def load_unpaid_bills(db: Session, user_id: int, until: date) -> List[BillView]:
+    # Contas em aberto até "until" (vencidas inclusas), pelo índice (user_id, paid, due_date)
+    return cached(user_id, ("unpaid_bills", until), lambda: [
+        _detach(b, BillView)
+        for b in db.execute(
+            select(Bill).where(Bill.user_id == user_id, Bill.paid.is_(False), Bill.due_date <= until).order_by(Bill.due_date.asc())
+        ).scalars()
+    ])
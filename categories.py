@@ -0,0 +1,245 @@
+import argparse
+import re
+import unicodedata
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Sequence
+from sqlalchemy import Column, Integer, MetaData, String, Table, select, update, delete, insert, func, extract, and_, or_
+from sqlalchemy.orm import Session
+from models import Bucket, Category, CategoryRollup, Movement
+from money import ZERO
+from rollups import upsert_insert
+
+# Categorias de gasto por regra (padrões sobre a descrição) + totais mensais por categoria/balde/tipo.
+# Cada lançamento recebe category_id e soma no rollup na mesma transação (como rollups.py);
+# mudar as regras exige recategorize (job em segundo plano), que reclassifica e refaz os rollups do usuário.
+# A página Análises só lê category_rollups: poucas linhas por mês, independente do volume de movimentações.
+
+SEPARATOR = ";"
+
+SUGGESTED = [
+    ("Mercado", "mercado; supermercado; padaria; atacad"),
+    ("Transporte", "combustível; posto; uber; estacionamento; pedágio"),
+    ("Moradia e contas", "aluguel; energia; água; internet; condomínio; telefone"),
+    ("Saúde", "farmácia; drogaria; médico; hospital; plano de saúde"),
+    ("Alimentação fora", "restaurante; ifood; lanche"),
+    ("Folha e impostos", "folha de pagamento; salário; impostos; darf; inss"),
+    ("Fornecedores", "fornecedor; material; manutenção"),
+    ("Igreja", "oferta; dízimo"),
+    ("Transferências", "transferência entre baldes"),
+]
+
+def fold(text: str) -> str:
+    # Minúsculas e sem acento: "Combustível" casa com "combustivel"
+    text = unicodedata.normalize("NFKD", (text or "").lower())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+def split_patterns(text: str) -> List[str]:
+    return [p.strip() for p in (text or "").split(SEPARATOR) if p.strip()]
+
+class CategoryMatcher:
+    # Mesma convenção do importer.RuleMatcher; a descrição já classificada fica em memória
+    # (descrições se repetem muito: "Mercado", "Entrada diária"...)
+    def __init__(self, categories: Iterable):
+        self._rules = []
+        for c in sorted(categories, key=lambda c: (c.priority, c.id or 0)):
+            for p in split_patterns(c.patterns):
+                if len(p) > 2 and p.startswith("/") and p.endswith("/"):
+                    self._rules.append((re.compile(p[1:-1], re.IGNORECASE), c.id, True))
+                else:
+                    self._rules.append((fold(p), c.id, False))
+        self._seen: Dict[str, Optional[int]] = {}
+
+    def category_for(self, description: Optional[str]) -> Optional[int]:
+        description = description or ""
+        if description in self._seen:
+            return self._seen[description]
+        low = fold(description)
+        found = None
+        for pattern, category_id, is_regex in self._rules:
+            if (pattern.search(description) if is_regex else pattern in low):
+                found = category_id
+                break
+        self._seen[description] = found
+        return found
+
+def load(db: Session, user_id: int) -> List[Category]:
+    return list(db.execute(
+        select(Category).where(Category.user_id == user_id).order_by(Category.priority, Category.id)
+    ).scalars())
+
+def matcher_for(db: Session, user_id: int) -> CategoryMatcher:
+    # Um por sessão (as sessões do app/API vivem um rerun/requisição); save_categories descarta
+    key = ("category_matcher", user_id)
+    if key not in db.info:
+        db.info[key] = CategoryMatcher(load(db, user_id))
+    return db.info[key]
+
+def forget(db: Session, user_id: int) -> None:
+    db.info.pop(("category_matcher", user_id), None)
+
+# ---- Escrita (na transação do lançamento) ----
+
+def tag_rows(db: Session, user_id: int, rows: List[Dict]) -> None:
+    # Dicts de Movement antes do INSERT em lote
+    m = matcher_for(db, user_id)
+    for r in rows:
+        r["category_id"] = m.category_for(r.get("description"))
+
+def record_movement(db: Session, m: Movement) -> None:
+    # Movement ORM: classifica (se ainda sem categoria) e soma no rollup
+    if m.category_id is None:
+        m.category_id = matcher_for(db, m.user_id).category_for(m.description)
+    record_rows(db, m.user_id, [{"bucket_id": m.bucket_id, "category_id": m.category_id, "kind": m.kind,
+                                 "amount": m.amount, "date": m.date}])
+
+def record_rows(db: Session, user_id: int, rows: Iterable[Dict]) -> None:
+    acc: Dict[tuple, list] = {}
+    for r in rows:
+        key = (r["date"].year, r["date"].month, r.get("category_id") or 0, r.get("bucket_id") or 0, r["kind"])
+        a = acc.setdefault(key, [ZERO, 0])
+        a[0] += r["amount"]
+        a[1] += 1
+    if not acc:
+        return
+    keyed = [{"user_id": user_id, "year": y, "month": mo, "category_id": c, "bucket_id": b, "kind": k,
+              "total": total, "count": count} for (y, mo, c, b, k), (total, count) in acc.items()]
+    upsert = upsert_insert(db)
+    if upsert is not None:
+        stmt = upsert(CategoryRollup)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["user_id", "year", "month", "category_id", "bucket_id", "kind"],
+            set_={"total": CategoryRollup.total + stmt.excluded.total, "count": CategoryRollup.count + stmt.excluded.count},
+        )
+        db.connection().execute(stmt, keyed)
+        return
+    for row in keyed:
+        key = [getattr(CategoryRollup, c) == row[c] for c in ("user_id", "year", "month", "category_id", "bucket_id", "kind")]
+        res = db.execute(
+            update(CategoryRollup).where(*key)
+            .values(total=CategoryRollup.total + row["total"], count=CategoryRollup.count + row["count"])
+            .execution_options(synchronize_session=False)
+        )
+        if res.rowcount == 0:
+            db.execute(insert(CategoryRollup).values(**row))
+
+# ---- Reclassificação / reconstrução ----
+
+def recategorize(db: Session, user_id: int, progress=None) -> int:
+    # Classifica cada descrição distinta uma vez e grava tudo num UPDATE só (tabela temporária
+    # descrição -> categoria); depois refaz os rollups do usuário. Devolve quantas movimentações têm categoria.
+    m = CategoryMatcher(load(db, user_id))
+    descriptions = db.execute(
+        select(Movement.description).where(Movement.user_id == user_id).distinct()
+    ).scalars().all()
+    mapping = [{"description": d, "category_id": c} for d in descriptions
+               if d is not None and (c := m.category_for(d)) is not None]
+    if progress:
+        progress(0.3, f"{len(descriptions)} descrições distintas, {len(mapping)} com categoria")
+    tmp = Table("tmp_category_map", MetaData(), Column("description", String, primary_key=True),
+                Column("category_id", Integer), prefixes=["TEMPORARY"])
+    conn = db.connection()
+    tmp.drop(conn, checkfirst=True)
+    tmp.create(conn)
+    try:
+        if mapping:
+            conn.execute(insert(tmp), mapping)
+        lookup = select(tmp.c.category_id).where(tmp.c.description == Movement.description).scalar_subquery()
+        db.execute(update(Movement).where(Movement.user_id == user_id).values(category_id=lookup)
+                   .execution_options(synchronize_session=False))
+    finally:
+        tmp.drop(conn)
+    if progress:
+        progress(0.7, "Refazendo os totais por categoria")
+    rebuild(db, user_id, commit=False)
+    tagged = db.execute(
+        select(func.count()).select_from(Movement).where(Movement.user_id == user_id, Movement.category_id.is_not(None))
+    ).scalar()
+    db.commit()
+    forget(db, user_id)
+    return tagged
+
+def _raw_totals_stmt(user_id: Optional[int]):
+    year = extract("year", Movement.date).label("year")
+    month = extract("month", Movement.date).label("month")
+    category = func.coalesce(Movement.category_id, 0).label("category_id")
+    bucket = func.coalesce(Movement.bucket_id, 0).label("bucket_id")
+    stmt = select(
+        Movement.user_id, year, month, category, bucket, Movement.kind,
+        func.sum(Movement.amount).label("total"), func.count().label("count"),
+    ).group_by(Movement.user_id, year, month, category, bucket, Movement.kind)
+    if user_id is not None:
+        stmt = stmt.where(Movement.user_id == user_id)
+    return stmt
+
+def rebuild(db: Session, user_id: Optional[int] = None, commit: bool = True) -> int:
+    stmt = delete(CategoryRollup)
+    if user_id is not None:
+        stmt = stmt.where(CategoryRollup.user_id == user_id)
+    db.execute(stmt)
+    cols = ["user_id", "year", "month", "category_id", "bucket_id", "kind", "total", "count"]
+    n = db.execute(insert(CategoryRollup).from_select(cols, _raw_totals_stmt(user_id))).rowcount
+    if commit:
+        db.commit()
+    return n
+
+def verify(db: Session, user_id: Optional[int] = None) -> List[Dict]:
+    raw = {(r.user_id, int(r.year), int(r.month), r.category_id, r.bucket_id, r.kind): (r.total, r.count)
+           for r in db.execute(_raw_totals_stmt(user_id))}
+    stmt = select(CategoryRollup)
+    if user_id is not None:
+        stmt = stmt.where(CategoryRollup.user_id == user_id)
+    stored = {(r.user_id, r.year, r.month, r.category_id, r.bucket_id, r.kind): (r.total, r.count)
+              for r in db.execute(stmt).scalars() if r.count}
+    return [{"key": k, "stored": stored.get(k), "raw": raw.get(k)}
+            for k in sorted(set(raw) | set(stored)) if raw.get(k) != stored.get(k)]
+
+# ---- Leitura (página Análises) ----
+
+def monthly(db: Session, user_id: int, start: Optional[date] = None, end: Optional[date] = None,
+            kinds: Sequence[str] = ("expense",)) -> List[Dict]:
+    # Linhas (mês, categoria, balde, tipo, total) com os nomes já resolvidos; start/end pegam o mês inteiro
+    stmt = select(CategoryRollup).where(CategoryRollup.user_id == user_id, CategoryRollup.kind.in_(list(kinds)),
+                                        CategoryRollup.count > 0)
+    if start is not None:
+        stmt = stmt.where(or_(CategoryRollup.year > start.year,
+                              and_(CategoryRollup.year == start.year, CategoryRollup.month >= start.month)))
+    if end is not None:
+        stmt = stmt.where(or_(CategoryRollup.year < end.year,
+                              and_(CategoryRollup.year == end.year, CategoryRollup.month <= end.month)))
+    names = {c.id: c.name for c in load(db, user_id)}
+    buckets = dict(db.execute(select(Bucket.id, Bucket.name).where(Bucket.user_id == user_id)).all())
+    return [
+        {"month": date(r.year, r.month, 1), "category": names.get(r.category_id, "Sem categoria"),
+         "bucket": buckets.get(r.bucket_id, "Sem balde"), "kind": r.kind, "total": r.total, "count": r.count}
+        for r in db.execute(stmt).scalars()
+    ]
+
+def main() -> None:
+    from db import router
+    import migrations
+
+    parser = argparse.ArgumentParser(description="Categorias de gasto: reclassificação e totais mensais por categoria.")
+    parser.add_argument("command", choices=["recategorize", "rebuild", "verify"])
+    parser.add_argument("--user", type=int, default=None, help="ID do usuário (padrão: todos)")
+    args = parser.parse_args()
+
+    migrations.upgrade(router.catalog)
+    scopes = router.user_ids() if (router.sharded or args.command == "recategorize") and args.user is None else [args.user]
+    total, drift = 0, []
+    for uid in scopes:
+        with router.session(uid) as db:
+            if args.command == "recategorize":
+                total += recategorize(db, uid)
+            elif args.command == "rebuild":
+                total += rebuild(db, uid)
+            else:
+                drift += verify(db, uid)
+    if args.command == "verify":
+        for d in drift:
+            print(f"{d['key']}: armazenado={d['stored']} movimentações={d['raw']}")
+        print("OK, sem divergências." if not drift else f"{len(drift)} divergência(s) encontrada(s).")
+        raise SystemExit(1 if drift else 0)
+    print({"recategorize": "movimentações com categoria", "rebuild": "linhas de totais gravadas"}[args.command] + f": {total}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+import argparse
+import math
+import time
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+import numpy as np
+from sqlalchemy import bindparam, insert, select, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import sessionmaker
+from models import User, Bucket, Giant, Bill, Movement, Category
+from logic import compute_bucket_splits_batch
+from money import from_cents
+import migrations
+import rollups
+import categories
+import events
+
+# Gerador de dados sintéticos em volume realista (o seed.py cria um usuário só, com 3 contas).
+# Por usuário: entradas diárias divididas nos baldes (dias úteis), despesas, transferências semanais,
+# gigantes e contas mensais. Categorias (as sugeridas), saldos, rollups e o log de eventos (com snapshots mensais)
+# são recalculados no fim, então tudo fecha com rollups.verify, categories.verify e events.verify.
+
+BUCKETS = [
+    ("Dízimo", 10, "dizimo"),
+    ("Operacional", 50, "operacional"),
+    ("Empréstimos", 20, "emprestimo"),
+    ("Cartões", 15, "cartao"),
+    ("Ataque/Colchão", 5, "ataque"),
+]
+# Peso de cada balde nas despesas (mesma ordem de BUCKETS)
+EXPENSE_WEIGHTS = np.array([0.08, 0.62, 0.14, 0.14, 0.02])
+EXPENSES = ["Mercado", "Combustível", "Fornecedor", "Aluguel", "Energia", "Água", "Internet", "Farmácia",
+            "Manutenção", "Folha de pagamento", "Impostos", "Restaurante", "Oferta", "Material de escritório"]
+INCOMES = ["Entrada diária", "Vendas PIX", "Vendas cartão", "Boleto recebido"]
+BILLS = [("Cartão - Fatura", True, "cartao"), ("Consórcio", True, "emprestimo"), ("Empréstimo - Parcela", True, "emprestimo"),
+         ("Internet", False, None), ("Energia", False, None), ("Aluguel", True, None)]
+
+EXPENSES_PER_DAY = 2.0
+BATCH = 20_000
+
+def movements_per_user_day() -> float:
+    # Média esperada de linhas em movements por usuário e dia (para dimensionar a geração)
+    return len(BUCKETS) * 5 / 7 + EXPENSES_PER_DAY + 2 / 7
+
+def _user_movements(rng: np.random.Generator, user_id: int, buckets: List[Bucket], start: date, days: int) -> List[Dict]:
+    dates = np.array([start + timedelta(days=i) for i in range(days)])
+    weekday = np.array([d.weekday() for d in dates])
+    rows: List[Dict] = []
+
+    # Entradas: dias úteis, valor log-normal, dividido pelos percentuais (mesma regra do app)
+    work = np.flatnonzero(weekday < 5)
+    incomes = np.maximum(100, rng.lognormal(np.log(150_000), 0.5, work.size).astype("int64"))  # centavos
+    splits = compute_bucket_splits_batch(buckets, incomes)
+    inc_desc = rng.choice(INCOMES, work.size)
+    for k, i in enumerate(work):
+        for j, b in enumerate(buckets):
+            rows.append({"user_id": user_id, "bucket_id": b.id, "kind": "income", "amount": from_cents(int(splits[k, j])),
+                         "description": str(inc_desc[k]), "date": dates[i], "transfer_in": False})
+
+    # Despesas: Poisson por dia, balde sorteado pelos pesos, valor ~ 55% da entrada média
+    n_exp = rng.poisson(EXPENSES_PER_DAY, days)
+    exp_day = np.repeat(np.arange(days), n_exp)
+    exp_bucket = rng.choice(len(buckets), exp_day.size, p=EXPENSE_WEIGHTS)
+    exp_amount = np.maximum(100, rng.lognormal(np.log(25_000), 0.9, exp_day.size).astype("int64"))
+    exp_desc = rng.choice(EXPENSES, exp_day.size)
+    for i, j, a, desc in zip(exp_day, exp_bucket, exp_amount, exp_desc):
+        rows.append({"user_id": user_id, "bucket_id": buckets[j].id, "kind": "expense", "amount": from_cents(int(a)),
+                     "description": str(desc), "date": dates[i], "transfer_in": False})
+
+    # Transferência semanal do Operacional para o Ataque (par saída/entrada, como services.transfer)
+    for i in np.flatnonzero(weekday == 4):
+        a = from_cents(int(rng.integers(5_000, 50_000)))
+        rows.append({"user_id": user_id, "bucket_id": buckets[1].id, "kind": "transfer", "amount": a,
+                     "description": "Transferência entre baldes (saída)", "date": dates[i], "transfer_in": False})
+        rows.append({"user_id": user_id, "bucket_id": buckets[4].id, "kind": "income", "amount": a,
+                     "description": "Transferência entre baldes (entrada)", "date": dates[i], "transfer_in": True})
+    return rows
+
+def generate(engine: Engine, users: int = 1, years: float = 1.0, movements: Optional[int] = None,
+             seed: int = 42, today: Optional[date] = None, progress=None) -> Dict:
+    # movements (se informado) define o tamanho: os dias por usuário são ajustados para chegar perto do alvo
+    today = today or date.today()
+    if movements is not None:
+        days = max(7, math.ceil(movements / users / movements_per_user_day()))
+    else:
+        days = max(7, int(years * 365))
+    start = today - timedelta(days=days)
+    rng = np.random.default_rng(seed)
+    migrations.upgrade(engine)
+    Session = sessionmaker(bind=engine)
+    t0 = time.perf_counter()
+    total = 0
+    with Session() as db:
+        # users.name é único: numera a partir do próximo "Usuário N" livre (o banco pode ter nomes fora de ordem)
+        taken = set(db.scalars(select(User.name)))
+        number = len(taken)
+        created = []
+        for n in range(users):
+            number += 1
+            while f"Usuário {number}" in taken:
+                number += 1
+            u = User(name=f"Usuário {number}")
+            db.add(u)
+            db.flush()
+            created.append(u.id)
+            buckets = [Bucket(user_id=u.id, name=name, description="", percent=p, type=t, balance=0) for name, p, t in BUCKETS]
+            db.add_all(buckets)
+            db.flush()
+
+            for g in range(int(rng.integers(2, 7))):
+                months = int(rng.choice([0, 6, 12, 24, 48]))
+                db.add(Giant(user_id=u.id, name=f"Dívida {g + 1}", total_to_pay=from_cents(int(rng.integers(100_000, 5_000_000))),
+                             parcels=months, months_left=months, priority=int(rng.integers(1, 4)),
+                             interest_rate=round(float(rng.uniform(0, 8)), 2), status="active"))
+
+            # Contas mensais: passadas pagas, futuras (3 meses) em aberto
+            by_type = {b.type: b.id for b in buckets}
+            bills = []
+            for title, critical, btype in BILLS:
+                day, amount = int(rng.integers(1, 29)), int(rng.integers(5_000, 300_000))
+                for m in range(-(days // 30), 4):
+                    y, mo = divmod(today.year * 12 + today.month - 1 + m, 12)
+                    due = date(y, mo + 1, day)
+                    bills.append({"user_id": u.id, "title": title, "amount": from_cents(amount), "due_date": due,
+                                  "is_critical": critical, "paid": due < today, "bucket_id": by_type.get(btype)})
+            db.execute(insert(Bill), bills)
+
+            rows = _user_movements(rng, u.id, buckets, start, days)
+            for i in range(0, len(rows), BATCH):
+                db.execute(insert(Movement), rows[i:i + BATCH])
+            total += len(rows)
+            db.commit()
+            if progress:
+                progress(n + 1, users, total)
+
+        # Só os usuários criados aqui: os que já estavam no banco ficam como estão (saldos, rollups e log de eventos).
+        # Saldos = soma das movimentações (mesmo sinal de rollups.BALANCE_SIGN), depois os rollups
+        db.execute(text(
+            "UPDATE buckets SET balance = COALESCE((SELECT SUM(CASE WHEN m.kind = 'income' THEN m.amount ELSE -m.amount END) "
+            "FROM movements m WHERE m.bucket_id = buckets.id), 0) WHERE user_id IN :ids"
+        ).bindparams(bindparam("ids", expanding=True)), {"ids": created})
+        db.commit()
+        # Categorias sugeridas para cada usuário novo, aplicadas às movimentações geradas
+        for uid in created:
+            db.execute(insert(Category), [{"user_id": uid, "name": name, "patterns": patterns, "priority": i}
+                                          for i, (name, patterns) in enumerate(categories.SUGGESTED)])
+            categories.recategorize(db, uid)
+            rollups.rebuild(db, uid)
+            events.rebuild(db, uid)
+            events.compact(db, uid, until=today - timedelta(days=1))
+    return {"users": users, "days": days, "movements": total, "seconds": time.perf_counter() - t0}
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Gera um banco SQLite com dados sintéticos realistas.")
+    parser.add_argument("path", help="Arquivo .db de saída (criado/complementado)")
+    parser.add_argument("--users", type=int, default=1)
+    parser.add_argument("--years", type=float, default=3.0)
+    parser.add_argument("--movements", type=int, default=None, help="Alvo total de movimentações (ignora --years)")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    from db import make_engine
+    engine = make_engine(f"sqlite:///{args.path}")
+    out = generate(engine, args.users, args.years, args.movements, args.seed,
+                   progress=lambda i, n, m: print(f"\r{i}/{n} usuários, {m} movimentações", end="", flush=True))
+    print(f"\n{out['movements']} movimentações ({out['users']} usuário(s), {out['days']} dias) em {out['seconds']:.1f}s")
+
+if __name__ == "__main__":
+    main()
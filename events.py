@@ -0,0 +1,244 @@
+import argparse
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Sequence
+from sqlalchemy import select, update, delete, insert, func, case, and_, or_
+from sqlalchemy.orm import Session, aliased
+from models import Bucket, Movement, BalanceEvent, BalanceSnapshot
+from money import ZERO
+from rollups import BALANCE_SIGN
+
+# Log de eventos de saldo (só inserção) + snapshots periódicos.
+# Cada lançamento grava, na mesma transação, um evento com o delta do balde; Bucket.balance continua
+# sendo o saldo atual materializado, conferível contra os eventos (verify) e recalculável (rebuild_balances).
+# Saldo numa data = último snapshot até a data + eventos depois dele: custa O(eventos desde o snapshot).
+
+def _event_rows(user_id: int, rows: Iterable[Dict]) -> List[Dict]:
+    return [
+        {"user_id": user_id, "bucket_id": r["bucket_id"], "kind": r["kind"],
+         "delta": r["amount"] * BALANCE_SIGN[r["kind"]], "description": r.get("description") or "", "date": r["date"]}
+        for r in rows if r.get("bucket_id") is not None
+    ]
+
+def _append(db: Session, user_id: int, events: List[Dict]) -> None:
+    if not events:
+        return
+    db.execute(insert(BalanceEvent), events)
+    # Lançamento com data retroativa: snapshots dali em diante ficaram velhos (a compactação refaz)
+    first = min(e["date"] for e in events)
+    db.execute(
+        delete(BalanceSnapshot)
+        .where(BalanceSnapshot.user_id == user_id, BalanceSnapshot.as_of >= first,
+               BalanceSnapshot.bucket_id.in_({e["bucket_id"] for e in events}))
+        .execution_options(synchronize_session=False)
+    )
+
+def record_movement(db: Session, m: Movement) -> None:
+    record_rows(db, m.user_id, [{"bucket_id": m.bucket_id, "kind": m.kind, "amount": m.amount,
+                                 "description": m.description, "date": m.date}])
+
+def record_rows(db: Session, user_id: int, rows: Iterable[Dict]) -> None:
+    # Dicts de Movement (inserções em lote): um INSERT executemany
+    _append(db, user_id, _event_rows(user_id, rows))
+
+def record_percents(db: Session, user_id: int, buckets: Sequence, description: str, d: Optional[date] = None) -> None:
+    # Mudança de percentual (ex.: normalização): delta 0, fica no histórico com o percentual novo
+    d = d or date.today()
+    db.execute(insert(BalanceEvent), [
+        {"user_id": user_id, "bucket_id": b.id, "kind": "percent", "delta": ZERO, "percent": b.percent,
+         "description": description, "date": d}
+        for b in buckets
+    ])
+
+# ---- Leituras ----
+
+def balances_at(db: Session, user_id: int, d: date) -> Dict[int, Decimal]:
+    # Saldo de cada balde no fim do dia d: snapshot mais recente até d + cauda de eventos
+    latest = (
+        select(BalanceSnapshot.bucket_id, func.max(BalanceSnapshot.as_of).label("as_of"))
+        .where(BalanceSnapshot.user_id == user_id, BalanceSnapshot.as_of <= d)
+        .group_by(BalanceSnapshot.bucket_id)
+        .subquery()
+    )
+    snap = aliased(BalanceSnapshot)
+    base = (
+        select(Bucket.id, snap.as_of, snap.balance)
+        .outerjoin(latest, latest.c.bucket_id == Bucket.id)
+        .outerjoin(snap, and_(snap.bucket_id == Bucket.id, snap.as_of == latest.c.as_of))
+        .where(Bucket.user_id == user_id)
+        .subquery()
+    )
+    tail = (
+        select(base.c.id, func.sum(BalanceEvent.delta))
+        .join(BalanceEvent, BalanceEvent.bucket_id == base.c.id)
+        .where(BalanceEvent.date <= d, or_(base.c.as_of.is_(None), BalanceEvent.date > base.c.as_of))
+        .group_by(base.c.id)
+    )
+    out = {}
+    for bucket_id, _, balance in db.execute(select(base)):
+        out[bucket_id] = balance or ZERO
+    for bucket_id, total in db.execute(tail):
+        out[bucket_id] += total or ZERO
+    return out
+
+def history(db: Session, user_id: int, bucket_id: int, since: Optional[date] = None, limit: int = 200) -> List[Dict]:
+    # Como o saldo chegou ao valor atual: eventos mais recentes primeiro
+    stmt = select(BalanceEvent).where(BalanceEvent.user_id == user_id, BalanceEvent.bucket_id == bucket_id)
+    if since is not None:
+        stmt = stmt.where(BalanceEvent.date >= since)
+    stmt = stmt.order_by(BalanceEvent.date.desc(), BalanceEvent.id.desc()).limit(limit)
+    return [
+        {"date": e.date, "kind": e.kind, "delta": e.delta, "percent": e.percent, "description": e.description}
+        for e in db.execute(stmt).scalars()
+    ]
+
+# ---- Compactação ----
+
+def month_end(d: date) -> date:
+    return (d.replace(day=1) + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+
+def compact(db: Session, user_id: Optional[int] = None, until: Optional[date] = None) -> int:
+    # Grava um snapshot por balde no fim de cada mês fechado que tem eventos depois do último snapshot.
+    # Os eventos ficam (o log não é apagado); só a leitura passa a começar do snapshot.
+    until = until or (date.today().replace(day=1) - timedelta(days=1))
+    last = (
+        select(BalanceSnapshot.bucket_id, func.max(BalanceSnapshot.as_of).label("as_of"))
+        .group_by(BalanceSnapshot.bucket_id)
+        .subquery()
+    )
+    snap = aliased(BalanceSnapshot)
+    stmt = (
+        select(Bucket.id, Bucket.user_id, snap.as_of, snap.balance)
+        .outerjoin(last, last.c.bucket_id == Bucket.id)
+        .outerjoin(snap, and_(snap.bucket_id == Bucket.id, snap.as_of == last.c.as_of))
+    )
+    if user_id is not None:
+        stmt = stmt.where(Bucket.user_id == user_id)
+    created = 0
+    for bucket_id, owner, as_of, balance in db.execute(stmt).all():
+        if as_of is not None and as_of >= until:
+            continue
+        tail = select(BalanceEvent.date, BalanceEvent.delta).where(BalanceEvent.bucket_id == bucket_id, BalanceEvent.date <= until)
+        if as_of is not None:
+            tail = tail.where(BalanceEvent.date > as_of)
+        running, count, current, snaps = balance or ZERO, 0, None, []
+        for d, delta in db.execute(tail.order_by(BalanceEvent.date)):
+            end = month_end(d)
+            if current is not None and end != current:
+                snaps.append({"user_id": owner, "bucket_id": bucket_id, "as_of": current, "balance": running, "events": count})
+                count = 0
+            current = end
+            running += delta
+            count += 1
+        if current is not None:
+            snaps.append({"user_id": owner, "bucket_id": bucket_id, "as_of": min(current, until), "balance": running, "events": count})
+        if snaps:
+            db.execute(insert(BalanceSnapshot), snaps)
+            created += len(snaps)
+    db.commit()
+    return created
+
+# ---- Reconstrução / conferência ----
+
+def rebuild(db: Session, user_id: Optional[int] = None) -> int:
+    # Refaz o log a partir das movimentações (bancos antigos, dados gerados em lote). Diferenças entre
+    # Bucket.balance e as movimentações viram um evento "opening" na data do primeiro lançamento.
+    scope_e = delete(BalanceEvent)
+    scope_s = delete(BalanceSnapshot)
+    if user_id is not None:
+        scope_e = scope_e.where(BalanceEvent.user_id == user_id)
+        scope_s = scope_s.where(BalanceSnapshot.user_id == user_id)
+    db.execute(scope_s)
+    db.execute(scope_e)
+    signed = case((Movement.kind == "income", Movement.amount), else_=-Movement.amount)
+    src = select(Movement.user_id, Movement.bucket_id, Movement.kind, signed, Movement.description, Movement.date).where(
+        Movement.bucket_id.is_not(None))
+    if user_id is not None:
+        src = src.where(Movement.user_id == user_id)
+    cols = ["user_id", "bucket_id", "kind", "delta", "description", "date"]
+    n = db.execute(insert(BalanceEvent).from_select(cols, src.order_by(Movement.date, Movement.id))).rowcount
+    n += _opening_events(db, user_id)
+    db.commit()
+    return n
+
+def _opening_events(db: Session, user_id: Optional[int]) -> int:
+    totals = (
+        select(BalanceEvent.bucket_id, func.sum(BalanceEvent.delta).label("total"), func.min(BalanceEvent.date).label("first"))
+        .group_by(BalanceEvent.bucket_id)
+        .subquery()
+    )
+    stmt = select(Bucket.id, Bucket.user_id, Bucket.balance, totals.c.total, totals.c.first).outerjoin(
+        totals, totals.c.bucket_id == Bucket.id)
+    if user_id is not None:
+        stmt = stmt.where(Bucket.user_id == user_id)
+    rows = []
+    for bucket_id, owner, balance, total, first in db.execute(stmt):
+        diff = (balance or ZERO) - (total or ZERO)
+        if diff:
+            rows.append({"user_id": owner, "bucket_id": bucket_id, "kind": "opening", "delta": diff,
+                         "description": "Saldo sem lançamentos correspondentes", "date": first or date.today()})
+    if rows:
+        db.execute(insert(BalanceEvent), rows)
+    return len(rows)
+
+def current_balances(db: Session, user_id: Optional[int] = None) -> Dict[int, Decimal]:
+    # Soma de todos os eventos por balde (inclusive datas futuras): deve bater com Bucket.balance
+    stmt = select(BalanceEvent.bucket_id, func.sum(BalanceEvent.delta)).group_by(BalanceEvent.bucket_id)
+    if user_id is not None:
+        stmt = stmt.where(BalanceEvent.user_id == user_id)
+    return {b: t or ZERO for b, t in db.execute(stmt)}
+
+def verify(db: Session, user_id: Optional[int] = None) -> List[Dict]:
+    expected = current_balances(db, user_id)
+    stmt = select(Bucket)
+    if user_id is not None:
+        stmt = stmt.where(Bucket.user_id == user_id)
+    drift = []
+    for b in db.execute(stmt).scalars():
+        if (b.balance or ZERO) != expected.get(b.id, ZERO):
+            drift.append({"user_id": b.user_id, "bucket_id": b.id, "stored": b.balance, "events": expected.get(b.id, ZERO)})
+    return drift
+
+def rebuild_balances(db: Session, user_id: Optional[int] = None) -> int:
+    # Os eventos são a fonte da verdade: regrava Bucket.balance a partir deles
+    drift = verify(db, user_id)
+    for d in drift:
+        db.execute(update(Bucket).where(Bucket.id == d["bucket_id"]).values(balance=d["events"])
+                   .execution_options(synchronize_session=False))
+    db.commit()
+    return len(drift)
+
+def main() -> None:
+    from db import router
+    import migrations
+
+    parser = argparse.ArgumentParser(description="Log de eventos de saldo: compactação, conferência e reconstrução.")
+    parser.add_argument("command", choices=["compact", "verify", "rebuild", "rebuild-balances"])
+    parser.add_argument("--user", type=int, default=None, help="ID do usuário (padrão: todos)")
+    parser.add_argument("--until", type=date.fromisoformat, default=None,
+                        help="compact: último dia consolidado (padrão: fim do mês passado)")
+    args = parser.parse_args()
+
+    migrations.upgrade(router.catalog)
+    scopes = router.user_ids() if router.sharded and args.user is None else [args.user]
+    total, drift = 0, []
+    for uid in scopes:
+        with router.session(uid) as db:
+            if args.command == "compact":
+                total += compact(db, uid, args.until)
+            elif args.command == "rebuild":
+                total += rebuild(db, uid)
+            elif args.command == "rebuild-balances":
+                total += rebuild_balances(db, uid)
+            else:
+                drift += verify(db, uid)
+    if args.command == "verify":
+        for d in drift:
+            print(f"[balde {d['bucket_id']}] armazenado={d['stored']} pelos eventos={d['events']}")
+        print("OK, sem divergências." if not drift else f"{len(drift)} divergência(s) encontrada(s).")
+        raise SystemExit(1 if drift else 0)
+    print({"compact": "snapshots gravados", "rebuild": "eventos gravados",
+           "rebuild-balances": "saldos corrigidos"}[args.command] + f": {total}")
+
+if __name__ == "__main__":
+    main()
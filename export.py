@@ -0,0 +1,81 @@
+import csv
+from datetime import date
+from typing import IO, Iterator, List, Optional, Sequence
+from sqlalchemy import select, func
+from sqlalchemy.orm import Session
+from ledger import ledger_query
+from formatting import money_br_series, date_br_series
+
+CHUNK_SIZE = 5000
+
+RAW_HEADER = ["Data", "Tipo", "Balde", "Valor", "Descrição"]
+BR_HEADER = ["Data (BR)", "Valor (BR)"]
+XLSX_DATE_FORMAT = "DD/MM/YYYY"
+XLSX_MONEY_FORMAT = '"R$" #,##0.00'
+
+def iter_chunks(db: Session, user_id: int, chunk_size: int = CHUNK_SIZE,
+                date_from: Optional[date] = None, date_to: Optional[date] = None,
+                kinds: Optional[Sequence[str]] = None, bucket_id: Optional[int] = None) -> Iterator[list]:
+    # Cursor em streaming: só um bloco de linhas fica em memória por vez.
+    # Executa na Connection: Session.execute pré-carrega tudo quando o driver
+    # (pysqlite) não tem cursor do lado do servidor.
+    stmt = ledger_query(user_id, date_from=date_from, date_to=date_to, kinds=kinds, bucket_id=bucket_id)
+    result = db.connection().execute(stmt.execution_options(yield_per=chunk_size))
+    try:
+        for part in result.partitions(chunk_size):
+            yield part
+    finally:
+        result.close()
+
+def count_rows(db: Session, user_id: int, **filters) -> int:
+    stmt = ledger_query(user_id, **filters).order_by(None)
+    return db.execute(select(func.count()).select_from(stmt.subquery())).scalar()
+
+def _header(formatted: bool) -> List[str]:
+    return RAW_HEADER + (BR_HEADER if formatted else [])
+
+def _rows(part, formatted: bool) -> List[list]:
+    rows = [[r.date, r.kind, r.bucket_name or "", r.amount, r.description or ""] for r in part]
+    if formatted and rows:
+        # Texto BR da partição inteira de uma vez
+        dates = date_br_series([r.date for r in part]).tolist()
+        amounts = money_br_series([r.amount for r in part]).tolist()
+        for row, d, v in zip(rows, dates, amounts):
+            row += [d, v]
+    return rows
+
+def write_csv(out: IO[str], db: Session, user_id: int, formatted: bool = True,
+              chunk_size: int = CHUNK_SIZE, progress=None, **filters) -> int:
+    writer = csv.writer(out)
+    writer.writerow(_header(formatted))
+    n = 0
+    for part in iter_chunks(db, user_id, chunk_size, **filters):
+        writer.writerows(_rows(part, formatted))
+        n += len(part)
+        if progress:
+            progress(n)
+    return n
+
+def write_xlsx(out, db: Session, user_id: int, formatted: bool = True,
+               chunk_size: int = CHUNK_SIZE, progress=None, **filters) -> int:
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+
+    # Modo write-only: as linhas vão direto para o arquivo, sem manter a planilha em memória
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Livro Caixa")
+    ws.append(_header(formatted))
+    n = 0
+    for part in iter_chunks(db, user_id, chunk_size, **filters):
+        for values in _rows(part, formatted):
+            d = WriteOnlyCell(ws, value=values[0])
+            d.number_format = XLSX_DATE_FORMAT
+            v = WriteOnlyCell(ws, value=values[3])
+            v.number_format = XLSX_MONEY_FORMAT
+            values[0], values[3] = d, v
+            ws.append(values)
+        n += len(part)
+        if progress:
+            progress(n)
+    wb.save(out)
+    return n
@@ -0,0 +1,180 @@
+import argparse
+import time
+import unicodedata
+from datetime import date, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+import numpy as np
+import pandas as pd
+from sqlalchemy import select, func
+from sqlalchemy.orm import Session
+from models import Bucket, Bill, Movement
+from logic import compute_bucket_splits_batch
+from money import to_cents, from_cents
+
+# Previsão de caixa: saldo diário projetado de cada balde (dias x baldes, em centavos).
+# Entradas = média por dia da semana das entradas passadas, dividida pelos percentuais dos baldes.
+# Saídas = contas em aberto no vencimento (vencidas caem no dia 0).
+
+HORIZON_DAYS = 90
+HISTORY_DAYS = 112  # 16 semanas de histórico de entradas
+
+# Palavras do título da conta -> tipo de balde (quando a conta não tem balde definido)
+BILL_HINTS = {
+    "cartao": ("cartao", "fatura"),
+    "emprestimo": ("emprestimo", "consorcio", "financiamento", "parcela"),
+    "dizimo": ("dizimo", "oferta"),
+}
+
+def _plain(s: str) -> str:
+    return unicodedata.normalize("NFKD", s or "").encode("ascii", "ignore").decode().lower()
+
+def bill_bucket(bill, buckets: Sequence) -> Optional[int]:
+    # Índice do balde que paga a conta: o escolhido, senão nome/tipo no título, senão o de maior %
+    if not buckets:
+        return None
+    ids = [b.id for b in buckets]
+    if getattr(bill, "bucket_id", None) in ids:
+        return ids.index(bill.bucket_id)
+    title = _plain(bill.title)
+    for i, b in enumerate(buckets):
+        if _plain(b.name) and _plain(b.name) in title:
+            return i
+    for kind, words in BILL_HINTS.items():
+        if any(w in title for w in words):
+            for i, b in enumerate(buckets):
+                if b.type == kind:
+                    return i
+    return max(range(len(buckets)), key=lambda i: buckets[i].percent)
+
+def income_profile(db: Session, user_id: int, today: Optional[date] = None, days: int = HISTORY_DAYS) -> np.ndarray:
+    # Entrada média (centavos) por dia da semana, segunda=0 ... domingo=6.
+    # A perna de entrada das transferências entre baldes não é receita: fica de fora
+    today = today or date.today()
+    since = today - timedelta(days=days)
+    stmt = (
+        select(Movement.date, func.sum(Movement.amount))
+        .where(Movement.user_id == user_id, Movement.kind == "income", Movement.transfer_in.is_(False),
+               Movement.date >= since, Movement.date < today)
+        .group_by(Movement.date)
+    )
+    totals = np.zeros(7, dtype="int64")
+    for d, total in db.execute(stmt):
+        totals[d.weekday()] += to_cents(total)
+    weekdays = np.bincount([(since + timedelta(days=i)).weekday() for i in range(days)], minlength=7)
+    return totals // np.maximum(weekdays, 1)
+
+def unpaid_bills(db: Session, user_id: int, until: Optional[date] = None) -> List[Bill]:
+    # Contas em aberto (vencidas inclusas) até "until", pelo índice (user_id, paid, due_date)
+    stmt = select(Bill).where(Bill.user_id == user_id, Bill.paid.is_(False))
+    if until is not None:
+        stmt = stmt.where(Bill.due_date <= until)
+    return list(db.execute(stmt.order_by(Bill.due_date.asc())).scalars())
+
+class Forecast:
+    def __init__(self, start: date, days: int, buckets: Sequence, opening_cents, profile_cents):
+        self.start = start
+        self.days = days
+        self.buckets = list(buckets)
+        dates = pd.date_range(start, periods=days, freq="D")
+        # Divide as 7 médias uma vez só e espalha pelos dias; o dia 0 (hoje) já está nos saldos
+        splits = compute_bucket_splits_batch(self.buckets, profile_cents) if self.buckets else np.zeros((7, 0), dtype="int64")
+        inflow = splits[dates.weekday.to_numpy()]
+        inflow[0] = 0
+        self.index = dates
+        self.balance = np.asarray(opening_cents, dtype="int64")[None, :] + np.cumsum(inflow, axis=0)
+        self._bills: Dict[int, tuple] = {}
+
+    def _day(self, d: date) -> int:
+        return max(0, (d - self.start).days)
+
+    def _apply(self, day: int, col: int, cents: int) -> None:
+        # Só o trecho do horizonte a partir do dia afetado é recalculado
+        if day < self.days:
+            self.balance[day:, col] += cents
+
+    def put_bill(self, bill) -> None:
+        # Inclui/atualiza uma conta; paga (ou sem balde) sai da previsão
+        self.remove_bill(bill.id)
+        col = bill_bucket(bill, self.buckets)
+        if bill.paid or col is None:
+            return
+        day, cents = self._day(bill.due_date), to_cents(bill.amount)
+        self._apply(day, col, -cents)
+        self._bills[bill.id] = (day, col, cents, bool(bill.is_critical), bill.title)
+
+    def remove_bill(self, bill_id: int) -> None:
+        entry = self._bills.pop(bill_id, None)
+        if entry:
+            self._apply(entry[0], entry[1], entry[2])
+
+    def alerts(self) -> List[Dict]:
+        # Contas críticas que deixam o balde negativo no dia do vencimento
+        out = []
+        for bill_id, (day, col, cents, critical, title) in self._bills.items():
+            if critical and day < self.days and self.balance[day, col] < 0:
+                out.append({
+                    "bill_id": bill_id,
+                    "title": title,
+                    "date": self.index[day].date(),
+                    "bucket_id": self.buckets[col].id,
+                    "bucket": self.buckets[col].name,
+                    "amount": from_cents(cents),
+                    "balance": from_cents(int(self.balance[day, col])),
+                })
+        return sorted(out, key=lambda a: (a["date"], a["bill_id"]))
+
+    def frame(self) -> pd.DataFrame:
+        # Saldos em reais, uma coluna por balde (para gráficos)
+        return pd.DataFrame(self.balance / 100.0, index=self.index, columns=[b.name for b in self.buckets])
+
+    def summary(self) -> Dict:
+        low = self.balance.min(axis=0) if self.buckets else np.zeros(0, dtype="int64")
+        negative = np.flatnonzero((self.balance < 0).any(axis=1))
+        return {
+            "alerts": len(self.alerts()),
+            "first_negative": self.index[negative[0]].date() if negative.size else None,
+            "min_balance": {b.name: from_cents(int(v)) for b, v in zip(self.buckets, low)},
+        }
+
+def build(db: Session, user_id: int, days: int = HORIZON_DAYS, today: Optional[date] = None,
+          buckets: Optional[Sequence] = None, bills: Optional[Iterable] = None) -> Forecast:
+    today = today or date.today()
+    if buckets is None:
+        buckets = list(db.execute(select(Bucket).where(Bucket.user_id == user_id).order_by(Bucket.id)).scalars())
+    if bills is None:
+        bills = unpaid_bills(db, user_id, today + timedelta(days=days - 1))
+    fc = Forecast(today, days, buckets, [to_cents(b.balance or 0) for b in buckets], income_profile(db, user_id, today))
+    for b in bills:
+        fc.put_bill(b)
+    return fc
+
+def run_batch(router, user_ids: Optional[List[int]] = None, days: int = 3 * 365,
+              today: Optional[date] = None) -> Iterator[Dict]:
+    # Uma sessão curta por usuário (no shard dele, se houver): o job pode rodar em paralelo com o app
+    if user_ids is None:
+        user_ids = router.user_ids()
+    for uid in user_ids:
+        with router.session(uid) as db:
+            fc = build(db, uid, days=days, today=today)
+            yield {"user_id": uid, **fc.summary()}
+
+def main() -> None:
+    from db import router
+    import migrations
+
+    parser = argparse.ArgumentParser(description="Previsão de caixa por balde para todos os usuários.")
+    parser.add_argument("--days", type=int, default=3 * 365)
+    parser.add_argument("--user", type=int, nargs="*", default=None, help="IDs dos usuários (padrão: todos)")
+    args = parser.parse_args()
+
+    migrations.upgrade(router.catalog)
+    t0 = time.perf_counter()
+    n = 0
+    for s in run_batch(router, args.user, args.days):
+        n += 1
+        first = s["first_negative"].strftime("%d/%m/%Y") if s["first_negative"] else "-"
+        print(f"usuário {s['user_id']}: {s['alerts']} alerta(s), primeiro saldo negativo em {first}")
+    print(f"{n} usuário(s), {args.days} dias em {time.perf_counter() - t0:.2f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+from decimal import Decimal
+from typing import TYPE_CHECKING, Optional, Sequence
+from babel import Locale
+from babel.numbers import format_currency, get_currency_symbol
+from babel.dates import format_date
+from money import ZERO, parse_decimal, to_cents
+
+if TYPE_CHECKING:
+    import numpy as np
+    import pandas as pd
+
+# Padrões pt_BR lidos do babel uma vez só, na importação; o resto é f-string/str.format.
+# money_br/date_br/parse_money_br formatam um valor; as versões *_series trabalham numa coluna inteira
+# (NumPy/pandas importados dentro delas: as páginas que só formatam valores soltos não carregam o pandas).
+
+LOCALE = "pt_BR"
+
+def _money_pattern():
+    loc = Locale.parse(LOCALE)
+    pattern = loc.currency_formats["standard"]
+    symbols = loc.number_symbols["latn"]
+    symbol = get_currency_symbol("BRL", LOCALE)
+    pos, neg = (p.replace("¤", symbol).replace("-", symbols["minusSign"]) for p in pattern.prefix)
+    return pos, neg, symbols["group"], symbols["decimal"]
+
+def _date_pattern() -> Optional[str]:
+    # dd/MM/y -> "{day:02d}/{month:02d}/{year}" (str.format com inteiros: %-d do strftime não existe no Windows);
+    # campo sem equivalente = cai no babel
+    codes = {"d": "{day}", "dd": "{day:02d}", "M": "{month}", "MM": "{month:02d}", "y": "{year}", "yyyy": "{year}",
+             "yy": "{yy:02d}"}
+    try:
+        pattern = Locale.parse(LOCALE).date_formats["short"].format
+        return pattern.replace("{", "{{").replace("}", "}}") % codes
+    except KeyError:
+        return None
+
+POS_PREFIX, NEG_PREFIX, GROUP, DECIMAL = _money_pattern()
+DATE_FORMAT = _date_pattern()
+_SEPARATORS = str.maketrans({",": GROUP, ".": DECIMAL})
+
+def _cents_br(cents: int) -> str:
+    body = f"{abs(cents) // 100:,}.{abs(cents) % 100:02d}".translate(_SEPARATORS)
+    return (NEG_PREFIX if cents < 0 else POS_PREFIX) + body
+
+# ---- Helpers BR ----
+def money_br(v: Decimal) -> str:
+    try:
+        return _cents_br(to_cents(v))
+    except Exception:
+        return format_currency(v, 'BRL', locale=LOCALE)
+
+def date_br(d) -> str:
+    if DATE_FORMAT is None:
+        return format_date(d, format='short', locale=LOCALE)
+    return DATE_FORMAT.format(day=d.day, month=d.month, year=d.year, yy=d.year % 100)
+
+def parse_money_br(s: str) -> Decimal:
+    if s is None:
+        return ZERO
+    s = s.strip().replace('.', '').replace(',', '.')
+    return parse_decimal(s)
+
+# ---- Colunas inteiras ----
+def _cents_array(values) -> "np.ndarray":
+    import numpy as np
+    import pandas as pd
+    # Reais (Decimal/float/int, já com 2 casas) -> centavos int64; via float é exato até ~10^13 e NaN/None viram 0
+    s = pd.Series(values, dtype="float64")
+    return np.rint(s.fillna(0).to_numpy() * 100).astype("int64")
+
+def _by_unique(codes: "np.ndarray", texts: list, index, na: str) -> "pd.Series":
+    import numpy as np
+    import pandas as pd
+    # Cada valor distinto é formatado uma vez; o código -1 (nulo) vira "na"
+    table = np.array(texts + [na], dtype=object)
+    return pd.Series(table[codes], index=index, dtype=object)
+
+def money_br_series(values, na: str = "") -> "pd.Series":
+    import numpy as np
+    import pandas as pd
+    s = pd.Series(values)
+    codes, uniques = pd.factorize(_cents_array(s))
+    codes = np.where(s.notna().to_numpy(), codes, -1)
+    return _by_unique(codes, [_cents_br(c) for c in uniques.tolist()], s.index, na)
+
+def date_br_series(values, na: str = "") -> "pd.Series":
+    import pandas as pd
+    s = pd.Series(values)
+    codes, uniques = pd.factorize(s)
+    texts = [date_br(d) for d in uniques]
+    return _by_unique(codes, texts, s.index, na)
+
+def parse_money_br_series(values) -> "pd.Series":
+    # Texto "1.234,56" / "R$ -10,5" -> centavos (Int64, inválido = <NA>), sem Decimal por linha.
+    # Os dígitos viram um inteiro só e a escala sai da posição da vírgula; arredonda como o to_cents.
+    import numpy as np
+    import pandas as pd
+    s = pd.Series(values, dtype="string").fillna("").str.strip()
+    for junk in ("R$", "\xa0", " ", "."):
+        s = s.str.replace(junk, "", regex=False)
+    s = s.str.replace(",", ".", regex=False)
+    valid = (s.str.fullmatch(r"[+-]?(\d+\.?\d*|\.\d+)") & (s.str.len() <= 18)).fillna(False).to_numpy(bool)
+    s = s.where(valid, "0").str.lstrip("+")
+    neg = s.str.startswith("-").to_numpy(bool)
+    digits = s.str.lstrip("-")
+    dot = digits.str.find(".").to_numpy("int64")
+    places = np.where(dot >= 0, digits.str.len().to_numpy("int64") - dot - 1, 0)
+    n = digits.str.replace(".", "", regex=False).replace("", "0").astype("int64").to_numpy()
+    cents = np.where(places <= 2, n * 10 ** np.clip(2 - places, 0, 2),
+                     (n + 5 * 10 ** np.clip(places - 3, 0, None)) // 10 ** np.clip(places - 2, 0, None))
+    return pd.Series(np.where(neg, -cents, cents), dtype="Int64").where(valid, pd.NA)
+
+def br_table(df: "pd.DataFrame", money: Sequence[str] = (), dates: Sequence[str] = ()):
+    import pandas as pd
+    # Tabela para st.dataframe: dados crus (numéricos/datas, ordenam certo) e texto BR só na exibição.
+    # O texto de cada coluna sai de uma passada vetorizada; o Styler só consulta o dicionário pronto.
+    df = df.copy()
+    formats = {}
+    for c in (c for c in money if c in df):
+        df[c] = pd.to_numeric(df[c].map(lambda v: float(v) if isinstance(v, Decimal) else v), errors="coerce")
+        lookup = dict(zip(df[c].tolist(), money_br_series(df[c], na="—").tolist()))
+        formats[c] = lambda v, lookup=lookup: lookup.get(v, "—")
+    for c in (c for c in dates if c in df):
+        df[c] = pd.to_datetime(df[c])
+        lookup = dict(zip(df[c].tolist(), date_br_series(df[c], na="—").tolist()))
+        formats[c] = lambda v, lookup=lookup: lookup.get(v, "—")
+    return df.style.format(formats)
@@ -0,0 +1,302 @@
+import argparse
+import csv
+import hashlib
+import io
+import re
+import time
+from datetime import date, datetime
+from decimal import Decimal
+from typing import IO, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence
+from sqlalchemy import select, update, insert
+from sqlalchemy.orm import Session
+from models import Bucket, Movement
+from money import ZERO, parse_decimal, to_cents
+import rollups
+import categories
+import events
+import services
+
+BATCH_SIZE = 5000
+
+class StatementRow(NamedTuple):
+    date: date
+    amount: Decimal  # positivo = entrada, negativo = saída
+    description: str
+    ref: str = ""    # identificador do banco (FITID no OFX), quando existir
+
+class Rule(NamedTuple):
+    pattern: str
+    bucket_id: int
+    regex: bool = False
+
+# ---- Parsers (streaming: uma linha/transação por vez) ----
+
+def parse_amount(s: str) -> Decimal:
+    s = (s or "").strip().replace("R$", "").replace(" ", "").replace("\xa0", "")
+    if "," in s and "." in s:
+        # O último separador é o decimal: 1.234,56 (BR) ou 1,234.56 (US)
+        if s.rfind(",") > s.rfind("."):
+            s = s.replace(".", "").replace(",", ".")
+        else:
+            s = s.replace(",", "")
+    else:
+        s = s.replace(",", ".")
+    return parse_decimal(s)
+
+def parse_date(s: str) -> date:
+    s = s.strip()
+    for fmt in ("%d/%m/%Y", "%Y-%m-%d", "%d/%m/%y", "%Y%m%d", "%d-%m-%Y"):
+        try:
+            return datetime.strptime(s, fmt).date()
+        except ValueError:
+            continue
+    raise ValueError(f"Data inválida: {s!r}")
+
+CSV_COLUMNS = {
+    "date": ("data", "date", "data lançamento", "data lancamento", "dt"),
+    "amount": ("valor", "amount", "value", "valor (r$)"),
+    "description": ("descrição", "descricao", "description", "histórico", "historico", "memo", "lançamento", "lancamento"),
+    "ref": ("id", "documento", "doc", "fitid", "identificador"),
+}
+
+def iter_csv(f: IO[str]) -> Iterator[StatementRow]:
+    sample = f.read(4096)
+    f.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=";,\t")
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.reader(f, dialect)
+    header = [h.strip().lower() for h in next(reader)]
+    idx = {}
+    for key, names in CSV_COLUMNS.items():
+        for i, h in enumerate(header):
+            if h in names:
+                idx[key] = i
+                break
+    missing = {"date", "amount"} - set(idx)
+    if missing:
+        raise ValueError(f"CSV sem coluna(s) obrigatória(s): {', '.join(sorted(missing))}")
+    for line in reader:
+        if not line or not any(c.strip() for c in line):
+            continue
+        yield StatementRow(
+            date=parse_date(line[idx["date"]]),
+            amount=parse_amount(line[idx["amount"]]),
+            description=line[idx["description"]].strip() if "description" in idx else "",
+            ref=line[idx["ref"]].strip() if "ref" in idx else "",
+        )
+
+def _ofx_tokens(f: IO[str], chunk_size: int = 65536) -> Iterator[tuple]:
+    # OFX 1.x é SGML (tags sem fechamento, às vezes tudo numa linha só): quebra em "<tag>valor"
+    buf = ""
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            break
+        buf += chunk
+        parts = buf.split("<")
+        buf = parts.pop()  # pode estar incompleto
+        for part in parts:
+            if ">" in part:
+                tag, _, value = part.partition(">")
+                yield tag.strip().upper(), value.strip()
+    if ">" in buf:
+        tag, _, value = buf.partition(">")
+        yield tag.strip().upper(), value.strip()
+
+def iter_ofx(f: IO[str]) -> Iterator[StatementRow]:
+    cur = None
+    for tag, value in _ofx_tokens(f):
+        if tag == "STMTTRN":
+            cur = {}
+        elif tag == "/STMTTRN" and cur is not None:
+            if "DTPOSTED" in cur and "TRNAMT" in cur:
+                yield StatementRow(
+                    date=parse_date(cur["DTPOSTED"][:8]),
+                    amount=parse_amount(cur["TRNAMT"]),
+                    description=cur.get("MEMO") or cur.get("NAME") or "",
+                    ref=cur.get("FITID", ""),
+                )
+            cur = None
+        elif cur is not None and value:
+            cur[tag] = value
+
+def iter_statement(f: IO[str], filename: str = "") -> Iterator[StatementRow]:
+    if filename.lower().endswith((".ofx", ".qfx")):
+        return iter_ofx(f)
+    return iter_csv(f)
+
+# ---- Regras e deduplicação ----
+
+def parse_rules(text: str, buckets: Sequence[Bucket]) -> List[Rule]:
+    # Uma regra por linha: "padrão => Nome do balde" (padrão entre /.../ vira regex)
+    by_name = {b.name.lower(): b.id for b in buckets}
+    rules = []
+    for line in text.splitlines():
+        if "=>" not in line:
+            continue
+        pattern, _, bucket = (p.strip() for p in line.partition("=>"))
+        bucket_id = by_name.get(bucket.lower())
+        if not pattern or bucket_id is None:
+            raise ValueError(f"Regra inválida ou balde inexistente: {line.strip()!r}")
+        if len(pattern) > 2 and pattern.startswith("/") and pattern.endswith("/"):
+            rules.append(Rule(pattern[1:-1], bucket_id, regex=True))
+        else:
+            rules.append(Rule(pattern, bucket_id))
+    return rules
+
+class RuleMatcher:
+    def __init__(self, rules: Iterable[Rule], default_bucket_id: Optional[int] = None):
+        self._rules = [
+            (re.compile(r.pattern, re.IGNORECASE) if r.regex else r.pattern.lower(), r.bucket_id, r.regex)
+            for r in rules
+        ]
+        self.default_bucket_id = default_bucket_id
+
+    def bucket_for(self, description: str) -> Optional[int]:
+        low = description.lower()
+        for pattern, bucket_id, is_regex in self._rules:
+            if (pattern.search(description) if is_regex else pattern in low):
+                return bucket_id
+        return self.default_bucket_id
+
+def fingerprint(row: StatementRow, occurrence: int = 0) -> str:
+    # Mesmo conteúdo => mesmo hash. "occurrence" separa lançamentos idênticos no mesmo dia
+    key = f"{row.date.isoformat()}|{to_cents(row.amount)}|{' '.join(row.description.lower().split())}|{row.ref}|{occurrence}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+# ---- Importação em lote ----
+
+def _flush(db: Session, user_id: int, batch: List[Dict], report: Dict) -> None:
+    # Um lote = uma transação, com nova tentativa em SQLITE_BUSY (ex.: job de outro usuário gravando ao mesmo tempo)
+    def op(db: Session) -> List[Dict]:
+        fps = [r["fingerprint"] for r in batch]
+        existing = set(db.execute(
+            select(Movement.fingerprint).where(Movement.user_id == user_id, Movement.fingerprint.in_(fps))
+        ).scalars())
+        rows = [r for r in batch if r["fingerprint"] not in existing]
+        if not rows:
+            return rows
+        categories.tag_rows(db, user_id, rows)
+        db.execute(insert(Movement), rows)  # executemany
+
+        # Um UPDATE de saldo por balde e um bump de rollup por (balde, tipo, mês) por lote
+        deltas: Dict[int, Decimal] = {}
+        for r in rows:
+            if r["bucket_id"] is not None:
+                sign = 1 if r["kind"] == "income" else -1
+                deltas[r["bucket_id"]] = deltas.get(r["bucket_id"], ZERO) + sign * r["amount"]
+        for bucket_id, delta in deltas.items():
+            db.execute(
+                update(Bucket)
+                .where(Bucket.id == bucket_id, Bucket.user_id == user_id)
+                .values(balance=Bucket.balance + delta)
+            )
+        rollups.record_rows(db, user_id, rows)
+        categories.record_rows(db, user_id, rows)
+        events.record_rows(db, user_id, rows)
+        services.touch_user(db, user_id)
+        return rows
+
+    rows = services.with_retry(db, op)
+    report["inserted"] += len(rows)
+    report["unmatched"] += sum(1 for r in rows if r["bucket_id"] is None)
+
+def import_rows(db: Session, user_id: int, rows: Iterable[StatementRow], matcher: RuleMatcher,
+                batch_size: int = BATCH_SIZE, progress=None) -> Dict:
+    t0 = time.perf_counter()
+    report = {"read": 0, "inserted": 0, "duplicates": 0, "unmatched": 0}
+    batch: List[Dict] = []
+    seen_in_batch = set()
+    # Contador de repetições só do dia corrente: extratos vêm em ordem de data (memória limitada)
+    occ_day, occ = None, {}
+    for row in rows:
+        report["read"] += 1
+        if row.amount == 0:
+            continue
+        if row.date != occ_day:
+            occ_day, occ = row.date, {}
+        base = fingerprint(row)
+        n = occ.get(base, 0)
+        occ[base] = n + 1
+        fp = fingerprint(row, n) if n else base
+        if fp in seen_in_batch:
+            continue
+        seen_in_batch.add(fp)
+        bucket_id = matcher.bucket_for(row.description)
+        batch.append({
+            "user_id": user_id,
+            "bucket_id": bucket_id,
+            "kind": "income" if row.amount > 0 else "expense",
+            "amount": abs(row.amount),
+            "description": row.description,
+            "date": row.date,
+            "fingerprint": fp,
+        })
+        if len(batch) >= batch_size:
+            _flush(db, user_id, batch, report)
+            batch, seen_in_batch = [], set()
+            if progress:
+                progress(report)
+    if batch:
+        _flush(db, user_id, batch, report)
+    report["duplicates"] = report["read"] - report["inserted"]
+    report["seconds"] = time.perf_counter() - t0
+    report["rows_per_sec"] = report["read"] / report["seconds"] if report["seconds"] else 0.0
+    return report
+
+def import_file(db: Session, user_id: int, f: IO[str], filename: str, matcher: RuleMatcher, **kw) -> Dict:
+    return import_rows(db, user_id, iter_statement(f, filename), matcher, **kw)
+
+def open_text(data: IO[bytes]) -> IO[str]:
+    # Extratos de bancos brasileiros costumam vir em latin-1; tenta UTF-8 primeiro
+    head = data.read(65536)
+    data.seek(0)
+    try:
+        head.decode("utf-8")
+        encoding = "utf-8-sig"
+    except UnicodeDecodeError:
+        encoding = "latin-1"
+    return io.TextIOWrapper(data, encoding=encoding, newline="")
+
+def main() -> None:
+    from db import router
+    from models import User
+    import migrations
+
+    parser = argparse.ArgumentParser(description="Importa extratos bancários (CSV/OFX) para o Livro Caixa.")
+    parser.add_argument("file")
+    parser.add_argument("--user", required=True, help="Nome do usuário")
+    parser.add_argument("--rules", help='Arquivo texto com regras "padrão => balde", uma por linha')
+    parser.add_argument("--default-bucket", help="Balde para linhas sem regra")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    migrations.upgrade(router.catalog)
+    with router.session() as db:
+        user = db.execute(select(User).where(User.name == args.user)).scalar_one_or_none()
+        if user is None:
+            raise SystemExit(f"Usuário não encontrado: {args.user}")
+    with router.session(user.id) as db:
+        buckets = db.execute(select(Bucket).where(Bucket.user_id == user.id)).scalars().all()
+        rules = []
+        if args.rules:
+            with open(args.rules, encoding="utf-8") as rf:
+                rules = parse_rules(rf.read(), buckets)
+        default_id = None
+        if args.default_bucket:
+            default_id = next((b.id for b in buckets if b.name.lower() == args.default_bucket.lower()), None)
+            if default_id is None:
+                raise SystemExit(f"Balde não encontrado: {args.default_bucket}")
+        with open(args.file, "rb") as raw:
+            report = import_file(
+                db, user.id, open_text(raw), args.file, RuleMatcher(rules, default_id),
+                batch_size=args.batch_size,
+                progress=lambda r: print(f"... {r['read']} linhas lidas, {r['inserted']} inseridas"),
+            )
+    print(f"Lidas: {report['read']} | Inseridas: {report['inserted']} | Duplicadas/ignoradas: {report['duplicates']} "
+          f"| Sem balde: {report['unmatched']} | {report['rows_per_sec']:.0f} linhas/s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field, asdict
+from typing import Deque, Dict, List, Optional
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Instrumentação por rerun: nº de queries, tempo no banco, linhas lidas e tempo total da página.
+# Os eventos do SQLAlchemy só contam quando há um rerun ativo (track) na thread atual.
+# DIAGNOSTICS_LOG=caminho grava uma linha JSON por rerun.
+
+LOG_PATH = os.environ.get("DIAGNOSTICS_LOG")
+HISTORY_SIZE = 500
+TOP_STATEMENTS = 15
+
+@dataclass
+class RerunStats:
+    page: str
+    started: float = field(default_factory=time.time)
+    queries: int = 0
+    db_seconds: float = 0.0
+    rows: int = 0
+    render_seconds: float = 0.0
+    error: Optional[str] = None
+    # SQL normalizado -> [execuções, segundos, linhas]
+    statements: Dict[str, list] = field(default_factory=dict)
+    profile: Optional[str] = None
+
+    def top_statements(self, n: int = TOP_STATEMENTS) -> List[Dict]:
+        rows = [{"sql": sql, "count": c, "seconds": s, "rows": r} for sql, (c, s, r) in self.statements.items()]
+        return sorted(rows, key=lambda x: -x["seconds"])[:n]
+
+    def to_json(self) -> Dict:
+        out = asdict(self)
+        out["statements"] = self.top_statements()
+        out.pop("profile")
+        return out
+
+_current: ContextVar[Optional[RerunStats]] = ContextVar("instrument_rerun", default=None)
+_lock = threading.Lock()
+history: Deque[RerunStats] = deque(maxlen=HISTORY_SIZE)
+
+_WS = re.compile(r"\s+")
+
+def _normalize(sql: str) -> str:
+    return _WS.sub(" ", sql).strip()[:300]
+
+class _CountingCursor:
+    # Repassa tudo ao cursor DBAPI e conta as linhas entregues pelos fetch*
+    __slots__ = ("_cursor", "_entry", "_stats")
+
+    def __init__(self, cursor, stats: RerunStats, entry: list):
+        self._cursor = cursor
+        self._stats = stats
+        self._entry = entry
+
+    def _count(self, n: int) -> None:
+        self._stats.rows += n
+        self._entry[2] += n
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None:
+            self._count(1)
+        return row
+
+    def fetchmany(self, *args):
+        rows = self._cursor.fetchmany(*args)
+        self._count(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        self._count(len(rows))
+        return rows
+
+    def __iter__(self):
+        for row in self._cursor:
+            self._count(1)
+            yield row
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+def _before(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("instrument_t0", []).append(time.perf_counter())
+
+def _after(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    if stats is None or not conn.info.get("instrument_t0"):
+        return
+    elapsed = time.perf_counter() - conn.info["instrument_t0"].pop()
+    entry = stats.statements.setdefault(_normalize(statement), [0, 0.0, 0])
+    entry[0] += 1
+    entry[1] += elapsed
+    stats.queries += 1
+    stats.db_seconds += elapsed
+    if cursor.description is not None and context is not None:
+        # O resultado lê de context.cursor logo depois deste evento: o proxy conta as linhas buscadas
+        context.cursor = _CountingCursor(cursor, stats, entry)
+    elif cursor.rowcount and cursor.rowcount > 0:
+        stats.rows += cursor.rowcount
+        entry[2] += cursor.rowcount
+
+def install(engine: Engine) -> None:
+    if event.contains(engine, "after_cursor_execute", _after):
+        return
+    event.listen(engine, "before_cursor_execute", _before)
+    event.listen(engine, "after_cursor_execute", _after)
+
+@contextmanager
+def track(page: str, profile: bool = False):
+    stats = RerunStats(page=page)
+    token = _current.set(stats)
+    prof = cProfile.Profile() if profile else None
+    t0 = time.perf_counter()
+    if prof:
+        prof.enable()
+    try:
+        yield stats
+    except BaseException as e:
+        # st.stop()/st.rerun() também passam por aqui (exceções de controle do Streamlit)
+        stats.error = type(e).__name__
+        raise
+    finally:
+        if prof:
+            prof.disable()
+            out = io.StringIO()
+            pstats.Stats(prof, stream=out).sort_stats("cumulative").print_stats(40)
+            stats.profile = out.getvalue()
+        stats.render_seconds = time.perf_counter() - t0
+        _current.reset(token)
+        _record(stats)
+
+def _record(stats: RerunStats) -> None:
+    with _lock:
+        history.append(stats)
+        if LOG_PATH:
+            with open(LOG_PATH, "a", encoding="utf-8") as f:
+                f.write(json.dumps(stats.to_json(), ensure_ascii=False) + "\n")
+
+def summary() -> List[Dict]:
+    # Médias por página sobre o histórico deste processo
+    with _lock:
+        items = list(history)
+    pages: Dict[str, List[RerunStats]] = {}
+    for s in items:
+        pages.setdefault(s.page, []).append(s)
+    out = []
+    for page, runs in pages.items():
+        n = len(runs)
+        out.append({
+            "page": page,
+            "reruns": n,
+            "queries": sum(r.queries for r in runs) / n,
+            "rows": sum(r.rows for r in runs) / n,
+            "db_ms": 1000 * sum(r.db_seconds for r in runs) / n,
+            "render_ms": 1000 * sum(r.render_seconds for r in runs) / n,
+            "max_render_ms": 1000 * max(r.render_seconds for r in runs),
+        })
+    return sorted(out, key=lambda x: -x["render_ms"])
+
+def recent(n: int = 50) -> List[RerunStats]:
+    with _lock:
+        return list(history)[-n:][::-1]
@@ -0,0 +1,333 @@
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import socket
+import time
+import traceback
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional
+from sqlalchemy import select, update, delete, insert, exists
+from sqlalchemy.orm import Session, aliased
+from models import Job
+import services
+
+# Fila de tarefas pesadas numa tabela (jobs, no banco principal) + pool de processos.
+# O app só enfileira (submit) e acompanha (recent); cada worker pega o job mais antigo de um usuário
+# que não tem outro rodando (UPDATE ... RETURNING, atômico), então usuários diferentes ocupam núcleos
+# diferentes e os jobs de um mesmo usuário rodam em ordem. O progresso gravado serve de batimento:
+# job "running" sem batimento há STALE_SECONDS volta para a fila (até MAX_ATTEMPTS).
+# Rodar à parte: python jobs.py worker --processes 4   (o app sobe um sozinho se JOBS_WORKERS > 0)
+
+JOBS_DIR = os.environ.get("JOBS_DIR", "./job_results")
+JOBS_WORKERS = int(os.environ.get("JOBS_WORKERS", str(min(4, os.cpu_count() or 1))))
+STALE_SECONDS = int(os.environ.get("JOBS_STALE_SECONDS", "600"))
+KEEP_DAYS = int(os.environ.get("JOBS_KEEP_DAYS", "7"))
+MAX_ATTEMPTS = 2
+POLL_SECONDS = 0.5
+PROGRESS_EVERY = 0.5  # segundos entre gravações de progresso
+HOUSEKEEPING_EVERY = 60
+
+ACTIVE = ("queued", "running")
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+# ---- Lado do app ----
+
+def submit(db: Session, user_id: int, kind: str, params: Optional[Dict] = None) -> int:
+    # db = sessão no banco principal (router.session())
+    if kind not in HANDLERS:
+        raise ValueError(f"Tipo de tarefa desconhecido: {kind}")
+    payload = json.dumps(params or {}, default=lambda v: v.isoformat() if isinstance(v, date) else str(v))
+
+    def op(db: Session):
+        return db.execute(
+            insert(Job).values(user_id=user_id, kind=kind, params=payload, status="queued", progress=0.0,
+                               message="Na fila", attempts=0, created_at=_now())
+            .returning(Job.id)
+        ).scalar_one()
+
+    return services.with_retry(db, op)
+
+def stage_upload(data, filename: str) -> str:
+    # Arquivo enviado pelo navegador vai para JOBS_DIR; o job de importação lê de lá e apaga no fim
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    ext = os.path.splitext(filename)[1].lower() or ".csv"
+    path = os.path.join(JOBS_DIR, f"upload_{uuid.uuid4().hex}{ext}")
+    with open(path + ".part", "wb") as out:
+        shutil.copyfileobj(data, out)
+    os.replace(path + ".part", path)
+    return path
+
+def recent(db: Session, user_id: int, limit: int = 10) -> List[Dict]:
+    stmt = select(Job).where(Job.user_id == user_id).order_by(Job.id.desc()).limit(limit)
+    return [
+        {"id": j.id, "kind": j.kind, "status": j.status, "progress": j.progress, "message": j.message or "",
+         "error": j.error, "result_path": j.result_path, "result_name": j.result_name,
+         "created_at": j.created_at, "finished_at": j.finished_at}
+        for j in db.execute(stmt).scalars()
+    ]
+
+def has_active(db: Session, user_id: int, kind: Optional[str] = None) -> bool:
+    stmt = select(Job.id).where(Job.user_id == user_id, Job.status.in_(ACTIVE))
+    if kind is not None:
+        stmt = stmt.where(Job.kind == kind)
+    return db.execute(stmt.limit(1)).first() is not None
+
+# ---- Tarefas ----
+
+class Progress:
+    # Grava progresso/mensagem do job (sessão própria no banco principal), no máximo a cada PROGRESS_EVERY
+    def __init__(self, router, job_id: int):
+        self.router = router
+        self.job_id = job_id
+        self.last = 0.0
+
+    def __call__(self, fraction: float, message: Optional[str] = None, force: bool = False) -> None:
+        if not force and time.monotonic() - self.last < PROGRESS_EVERY:
+            return
+        self.last = time.monotonic()
+        values = {"progress": max(0.0, min(1.0, fraction)), "updated_at": _now()}
+        if message is not None:
+            values["message"] = message
+        try:
+            with self.router.session() as db:
+                services.with_retry(db, lambda db: db.execute(update(Job).where(Job.id == self.job_id).values(**values)))
+        except Exception:
+            pass  # progresso é informativo: não derruba o job
+
+def _normalize(db: Session, user_id: int, params: Dict, job_id: int, report: Progress) -> Dict:
+    percents = services.normalize_buckets(db, user_id)
+    return {"message": f"{len(percents)} baldes normalizados para 100%."}
+
+def _export(db: Session, user_id: int, params: Dict, job_id: int, report: Progress) -> Dict:
+    import export  # pandas/openpyxl só no worker
+    fmt = "xlsx" if params.get("format") == "xlsx" else "csv"
+    filters = dict(params.get("filters") or {})
+    for key in ("date_from", "date_to"):
+        if filters.get(key):
+            filters[key] = date.fromisoformat(filters[key])
+    total = max(1, export.count_rows(db, user_id, **filters))
+    report(0.0, f"Exportando {total} linhas", force=True)
+    step = lambda n: report(n / total, f"{n} de {total} linhas")
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    path = os.path.join(JOBS_DIR, f"job_{job_id}.{fmt}")
+    tmp = path + ".part"
+    formatted = bool(params.get("formatted", True))
+    if fmt == "csv":
+        with open(tmp, "w", encoding="utf-8", newline="") as out:
+            n = export.write_csv(out, db, user_id, formatted=formatted, progress=step, **filters)
+    else:
+        with open(tmp, "wb") as out:
+            n = export.write_xlsx(out, db, user_id, formatted=formatted, progress=step, **filters)
+    os.replace(tmp, path)
+    return {"message": f"{n} linhas exportadas.", "result_path": path, "result_name": f"livro_caixa.{fmt}"}
+
+def _import(db: Session, user_id: int, params: Dict, job_id: int, report: Progress) -> Dict:
+    # Extrato já gravado em JOBS_DIR pelo app (stage_upload); progresso = posição no arquivo
+    import importer
+    from cache import load_buckets
+    path = params["path"]
+    try:
+        matcher = importer.RuleMatcher(importer.parse_rules(params.get("rules") or "", load_buckets(db, user_id)),
+                                       params.get("default_bucket_id"))
+        size = max(1, os.path.getsize(path))
+        with open(path, "rb") as raw:
+            step = lambda r: report(raw.tell() / size, f"{r['read']} linhas lidas, {r['inserted']} inseridas")
+            out = importer.import_file(db, user_id, importer.open_text(raw), params.get("filename") or path, matcher,
+                                       progress=step)
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+    return {"message": f"{out['inserted']} movimentações importadas, {out['duplicates']} duplicadas/ignoradas, "
+                       f"{out['unmatched']} sem balde ({out['rows_per_sec']:.0f} linhas/s)."}
+
+def _rebuild(db: Session, user_id: int, params: Dict, job_id: int, report: Progress) -> Dict:
+    # Recalcula os totais (rollups e categorias) a partir das movimentações. O log de eventos é só de
+    # inserção e não é refeito aqui: só ganha os snapshots pendentes e é conferido contra os saldos
+    import categories
+    import events
+    import rollups
+    report(0.0, "Recalculando totais mensais", force=True)
+    n_rollups = rollups.rebuild(db, user_id)
+    report(0.4, "Refazendo os totais por categoria", force=True)
+    categories.rebuild(db, user_id)
+    report(0.7, "Gravando snapshots mensais", force=True)
+    events.compact(db, user_id)
+    report(0.85, "Conferindo saldos com o log de eventos", force=True)
+    drift = events.verify(db, user_id)
+    services.with_retry(db, lambda db: services.touch_user(db, user_id))
+    message = f"{n_rollups} totais mensais recalculados; "
+    if drift:
+        return {"message": message + f"{len(drift)} balde(s) com saldo diferente do log de eventos (veja python events.py verify)."}
+    return {"message": message + "saldos conferem com o log de eventos."}
+
+def _categorize(db: Session, user_id: int, params: Dict, job_id: int, report: Progress) -> Dict:
+    # Reaplica as regras de categoria em todas as movimentações do usuário
+    import categories
+    report(0.0, "Classificando descrições", force=True)
+    tagged = categories.recategorize(db, user_id, progress=lambda f, msg: report(f, msg, force=True))
+    services.with_retry(db, lambda db: services.touch_user(db, user_id))
+    return {"message": f"{tagged} movimentações com categoria."}
+
+HANDLERS: Dict[str, Callable] = {"normalize": _normalize, "export": _export, "import": _import, "rebuild": _rebuild,
+                                  "categorize": _categorize}
+LABELS = {"normalize": "Normalizar percentuais", "export": "Exportar livro caixa", "import": "Importar extrato", "rebuild": "Recalcular totais e conferir saldos",
+          "categorize": "Aplicar regras de categoria"}
+
+# ---- Lado do worker ----
+
+def claim(db: Session, worker: str) -> Optional[Dict]:
+    # Job mais antigo na fila cujo usuário não tem outro rodando; o status no WHERE protege de dois
+    # workers pegando o mesmo (no SQLite a escrita é serializada; no Postgres o UPDATE reavalia a linha)
+    cand, running = aliased(Job), aliased(Job)
+    pick = (
+        select(cand.id)
+        .where(cand.status == "queued",
+               ~exists().where(running.user_id == cand.user_id, running.status == "running"))
+        .order_by(cand.id)
+        .limit(1)
+        .scalar_subquery()
+    )
+    stmt = (
+        update(Job)
+        .where(Job.id == pick, Job.status == "queued")
+        .values(status="running", worker=worker, attempts=Job.attempts + 1, updated_at=_now(), message="Iniciando")
+        .returning(Job.id, Job.user_id, Job.kind, Job.params)
+        .execution_options(synchronize_session=False)
+    )
+    row = services.with_retry(db, lambda db: db.execute(stmt).first())
+    if row is None:
+        return None
+    return {"id": row.id, "user_id": row.user_id, "kind": row.kind, "params": json.loads(row.params or "{}")}
+
+def _finish(router, job_id: int, **values) -> None:
+    values.update(finished_at=_now(), updated_at=_now())
+    with router.session() as db:
+        services.with_retry(db, lambda db: db.execute(update(Job).where(Job.id == job_id).values(**values)))
+
+def run(router, job: Dict) -> None:
+    report = Progress(router, job["id"])
+    try:
+        with router.session(job["user_id"]) as db:
+            out = HANDLERS[job["kind"]](db, job["user_id"], job["params"], job["id"], report)
+    except Exception as e:
+        if not isinstance(e, ValueError):  # ValueError = regra de negócio, a mensagem basta
+            traceback.print_exc()
+        _finish(router, job["id"], status="failed", message="Falhou", error=str(e) or type(e).__name__)
+        return
+    _finish(router, job["id"], status="done", progress=1.0, message=out.get("message", "Concluído"),
+            result_path=out.get("result_path"), result_name=out.get("result_name"))
+
+def requeue_stale(db: Session) -> int:
+    # Worker que morreu no meio: volta para a fila; quem já esgotou as tentativas falha de vez
+    cutoff = _now() - timedelta(seconds=STALE_SECONDS)
+    stale = (Job.status == "running", Job.updated_at < cutoff)
+
+    def op(db: Session):
+        failed = db.execute(
+            update(Job).where(*stale, Job.attempts >= MAX_ATTEMPTS)
+            .values(status="failed", message="Falhou", error="Worker interrompido", finished_at=_now())
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        return failed + db.execute(
+            update(Job).where(*stale).values(status="queued", message="Na fila (reiniciado)")
+            .execution_options(synchronize_session=False)
+        ).rowcount
+
+    return services.with_retry(db, op)
+
+def purge(db: Session, keep_days: int = KEEP_DAYS) -> int:
+    # Jobs terminados há mais de keep_days, arquivos sem job (ex.: usuário apagado, cascata no banco)
+    # e extratos enviados que nenhum job consumiu
+    cutoff = _now() - timedelta(days=keep_days)
+    n = services.with_retry(db, lambda db: db.execute(
+        delete(Job).where(Job.status.in_(("done", "failed")), Job.finished_at < cutoff)
+        .execution_options(synchronize_session=False)
+    ).rowcount)
+    if os.path.isdir(JOBS_DIR):
+        # Lista antes de consultar: um arquivo listado é de job que já rodava, e o _export só tem o
+        # result_path gravado depois do os.replace; enquanto o job está na fila/rodando, nada dele é apagado
+        names = os.listdir(JOBS_DIR)
+        known = {p for (p,) in db.execute(select(Job.result_path).where(Job.result_path.is_not(None)))}
+        active = {f"job_{i}" for (i,) in db.execute(select(Job.id).where(Job.status.in_(ACTIVE)))}
+        for name in names:
+            path = os.path.join(JOBS_DIR, name)
+            try:
+                if name.startswith("job_") and path not in known and name.split(".", 1)[0] not in active:
+                    os.remove(path)
+                elif name.startswith("upload_") and os.path.getmtime(path) < time.time() - keep_days * 86400:
+                    os.remove(path)
+            except FileNotFoundError:  # .part já renomeado / extrato já consumido depois da listagem
+                pass
+    return n
+
+def _worker_main(parent: int, index: int) -> None:
+    # Processo filho (spawn): engines próprias, nada herdado do pai; sai quando o pai some
+    from db import router
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    while os.getppid() == parent:
+        with router.session() as db:
+            job = claim(db, worker)
+        if job is None:
+            time.sleep(POLL_SECONDS)
+            continue
+        run(router, job)
+    router.dispose()
+
+def serve(processes: int = JOBS_WORKERS, parent: Optional[int] = None) -> None:
+    # Supervisor: mantém o pool vivo, faz a limpeza periódica e termina junto com "parent" (o app)
+    from db import router
+    import migrations
+    migrations.upgrade(router.catalog)
+    ctx = multiprocessing.get_context("spawn")
+    me = os.getpid()
+    pool: List = [None] * max(1, processes)
+    next_housekeeping = 0.0
+    try:
+        while parent is None or os.getppid() == parent:
+            for i, p in enumerate(pool):
+                if p is None or not p.is_alive():
+                    pool[i] = ctx.Process(target=_worker_main, args=(me, i), daemon=True)
+                    pool[i].start()
+            if time.monotonic() >= next_housekeeping:
+                with router.session() as db:
+                    requeue_stale(db)
+                    purge(db)
+                next_housekeeping = time.monotonic() + HOUSEKEEPING_EVERY
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for p in pool:
+            if p is not None and p.is_alive():
+                p.terminate()
+        for p in pool:
+            if p is not None:
+                p.join(5)
+        router.dispose()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Fila de tarefas em segundo plano (exportações, importações, recálculos).")
+    sub = parser.add_subparsers(dest="command", required=True)
+    w = sub.add_parser("worker", help="Sobe o pool de workers")
+    w.add_argument("--processes", type=int, default=max(1, JOBS_WORKERS))
+    w.add_argument("--parent", type=int, default=None, help="PID do processo que subiu o worker (sai quando ele morrer)")
+    sub.add_parser("purge", help="Apaga jobs terminados antigos e arquivos órfãos")
+    args = parser.parse_args()
+
+    if args.command == "worker":
+        serve(args.processes, args.parent)
+    else:
+        from db import router
+        import migrations
+        migrations.upgrade(router.catalog)
+        with router.session() as db:
+            requeue_stale(db)
+            print(f"jobs apagados: {purge(db)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+from datetime import date
+from typing import Dict, List, Optional, Sequence, Tuple
+from sqlalchemy import select, tuple_
+from sqlalchemy.orm import Session
+from models import Bucket, Movement
+
+PAGE_SIZE = 100
+
+# Cursor de página: (data, id) da última linha exibida
+Cursor = Tuple[date, int]
+
+def ledger_query(user_id: int, date_from: Optional[date] = None, date_to: Optional[date] = None,
+                 kinds: Optional[Sequence[str]] = None, bucket_id: Optional[int] = None):
+    # Livro caixa com o nome do balde (outer join: movimentações sem balde continuam visíveis)
+    stmt = (
+        select(Movement.id, Movement.date, Movement.kind, Movement.bucket_id,
+               Bucket.name.label("bucket_name"), Movement.amount, Movement.description)
+        .outerjoin(Bucket, Bucket.id == Movement.bucket_id)
+        .where(Movement.user_id == user_id)
+    )
+    if date_from is not None:
+        stmt = stmt.where(Movement.date >= date_from)
+    if date_to is not None:
+        stmt = stmt.where(Movement.date <= date_to)
+    if kinds:
+        stmt = stmt.where(Movement.kind.in_(list(kinds)))
+    if bucket_id is not None:
+        stmt = stmt.where(Movement.bucket_id == bucket_id)
+    return stmt.order_by(Movement.date.desc(), Movement.id.desc())
+
+def fetch_page(db: Session, user_id: int, after: Optional[Cursor] = None, limit: int = PAGE_SIZE,
+               **filters) -> Tuple[List[Dict], bool]:
+    # Paginação por chave (date, id): o custo de uma página não depende do tamanho do livro
+    stmt = ledger_query(user_id, **filters)
+    if after is not None:
+        stmt = stmt.where(tuple_(Movement.date, Movement.id) < tuple_(after[0], after[1]))
+    rows = [dict(r._mapping) for r in db.execute(stmt.limit(limit + 1))]
+    has_more = len(rows) > limit
+    return rows[:limit], has_more
+
+def cursor_of(row: Dict) -> Cursor:
+    return (row["date"], row["id"])
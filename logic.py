@@ -1,6 +1,12 @@
-from typing import List, Dict
+from typing import TYPE_CHECKING, List, Dict
 from models import Bucket, Giant
 from math import isclose
+from money import to_cents, from_cents, percent_weights, split_cents
+
+if TYPE_CHECKING:
+    # NumPy/pandas só nas versões em lote (importados nelas: o app não paga na partida)
+    import numpy as np
+    import pandas as pd
 
 def normalize_percents(buckets: List[Bucket]) -> List[float]:
     total = sum(b.percent for b in buckets)
@@ -12,22 +18,89 @@ def normalize_percents(buckets: List[Bucket]) -> List[float]:
         norm = 1.0
     return [round(b.percent * norm, 2) for b in buckets]
 
-def compute_bucket_splits(buckets: List[Bucket], total_income: float) -> List[Dict]:
+def compute_bucket_splits(buckets: List[Bucket], total_income) -> List[Dict]:
+    # Divisão em centavos inteiros pelos maiores restos: as partes somam exatamente a entrada
     percents = normalize_percents(buckets)
+    parts = split_cents(to_cents(total_income), percent_weights([b.percent for b in buckets]))
     out = []
-    for b, p in zip(buckets, percents):
-        value = round(total_income * (p / 100.0), 2)
+    for b, p, cents in zip(buckets, percents, parts):
         out.append({
             "bucket_id": b.id,
             "name": b.name,
             "percent_effective": p,
-            "value": value
+            "value": from_cents(cents)
         })
     return out
 
-def payoff_efficiency(giant: Giant, monthly_input: float) -> Dict:
-    if monthly_input <= 0:
+def payoff_efficiency(giant: Giant, monthly_input) -> Dict:
+    mi = to_cents(monthly_input)
+    if mi <= 0:
         return {"r_per_1k": 0.0, "months_to_victory": None}
-    eff = round(1000.0 / monthly_input, 2)
-    months = int((giant.total_to_pay + (monthly_input - 1)) // monthly_input)
+    eff = round(100000.0 / mi, 2)
+    months = -(-to_cents(giant.total_to_pay) // mi)
     return {"r_per_1k": eff, "months_to_victory": months}
+
+# ---- Versões em lote (NumPy) ----
+# Devem bater exatamente com as funções escalares acima. Valores em centavos inteiros.
+
+def _round2(x: "np.ndarray") -> "np.ndarray":
+    # round(v, 2) do Python arredonda o decimal exato de v; np.round passa por v*100,
+    # que pode errar justo nos empates. Esses poucos casos vão para o round escalar.
+    import numpy as np
+    y = x * 100.0
+    out = np.rint(y) / 100.0
+    frac = np.abs(y - np.floor(y))
+    tie = np.abs(frac - 0.5) <= 1e-9 * np.maximum(1.0, np.abs(y))
+    if tie.any():
+        out[tie] = [round(float(v), 2) for v in x[tie]]
+    return out
+
+def split_cents_batch(totals_cents, weights) -> "np.ndarray":
+    # Maiores restos vetorizado: linha i = totals_cents[i], coluna j = weights[j]
+    import numpy as np
+    t = np.asarray(totals_cents, dtype="int64")
+    w = np.asarray(weights, dtype="int64")
+    total_w = int(w.sum())
+    out = np.zeros((t.shape[0], w.shape[0]), dtype="int64")
+    if total_w <= 0 or t.size == 0:
+        return out
+    if int(np.abs(t).max()) * int(w.max()) >= 2**63:
+        # t*w estouraria o int64 (entradas gigantes): cai para o escalar, com inteiros do Python
+        return np.array([split_cents(int(v), w.tolist()) for v in t], dtype="int64")
+    sign = np.where(t < 0, -1, 1)
+    t = np.abs(t)
+    prod = t[:, None] * w[None, :]
+    base = prod // total_w
+    rem = prod % total_w
+    left = t - base.sum(axis=1)
+    # Posição de cada balde na ordem (-resto, índice); recebe +1 se posição < sobra
+    order = np.argsort(-rem, axis=1, kind="stable")
+    rank = np.empty_like(order)
+    np.put_along_axis(rank, order, np.broadcast_to(np.arange(w.shape[0]), order.shape), axis=1)
+    return (base + (rank < left[:, None])) * sign[:, None]
+
+def compute_bucket_splits_batch(buckets: List[Bucket], incomes_cents) -> "np.ndarray":
+    # Linha i = incomes_cents[i], coluna j = buckets[j] (mesma ordem de compute_bucket_splits)
+    return split_cents_batch(incomes_cents, percent_weights([b.percent for b in buckets]))
+
+def compute_bucket_splits_frame(buckets: List[Bucket], incomes_cents) -> "pd.DataFrame":
+    import pandas as pd
+    values = compute_bucket_splits_batch(buckets, incomes_cents)
+    return pd.DataFrame(values, columns=[b.id for b in buckets])
+
+def payoff_efficiency_batch(total_to_pay_cents, monthly_input_cents) -> "pd.DataFrame":
+    # Arrays broadcastáveis em centavos (ex.: vários gigantes x vários aportes)
+    import numpy as np
+    import pandas as pd
+    total, mi = np.broadcast_arrays(np.asarray(total_to_pay_cents, dtype="int64"), np.asarray(monthly_input_cents, dtype="int64"))
+    total, mi = total.ravel(), mi.ravel()
+    ok = mi > 0
+    safe = np.where(ok, mi, 1)
+    eff = np.where(ok, _round2(100000.0 / safe.astype(float)), 0.0)
+    months = -(-total // safe)
+    return pd.DataFrame({
+        "total_to_pay": total,
+        "monthly_input": mi,
+        "r_per_1k": eff,
+        "months_to_victory": pd.arrays.IntegerArray(np.where(ok, months, 0).astype("int64"), ~ok),
+    })
@@ -0,0 +1,250 @@
+import argparse
+import os
+from sqlalchemy import MetaData, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import CreateTable, CreateIndex
+from db import Base
+import models  # noqa: F401 (registra as tabelas no Base.metadata)
+from money import to_cents
+
+# Versão do esquema guardada em PRAGMA user_version (SQLite).
+# Bancos novos são criados direto na última versão; bancos antigos aplicam só os passos pendentes.
+# Banco já na última versão: só lê o user_version (sem inspect/create_all), então tabela ou índice novo
+# sempre entra com um passo aqui.
+
+# Colunas que deixaram de ser Float (reais) e passaram a centavos inteiros
+MONEY_COLUMNS = {
+    "buckets": ["balance"],
+    "giants": ["total_to_pay"],
+    "movements": ["amount"],
+    "bills": ["amount"],
+    "movement_rollups": ["total"],
+}
+
+def _sql_to_cents(v):
+    return None if v is None else to_cents(v)
+
+def _rebuild_table(cur, dialect, name: str, convert: dict) -> None:
+    # Procedimento recomendado pelo SQLite para mudar o tipo de coluna:
+    # cria a tabela nova, copia, apaga a antiga e renomeia (FKs desligadas pelo chamador)
+    table = Base.metadata.tables[name]
+    md = MetaData()
+    for t in Base.metadata.sorted_tables:
+        t.to_metadata(md)  # as FKs da cópia precisam achar as tabelas referenciadas
+    tmp = table.to_metadata(md, name=f"_new_{name}")
+    cur.execute(str(CreateTable(tmp).compile(dialect=dialect)))
+    old_cols = {r[1] for r in cur.execute(f'PRAGMA table_info("{name}")').fetchall()}
+    cols = [c.name for c in table.columns if c.name in old_cols]
+    select_cols = [f'{convert[c]}("{c}")' if c in convert else f'"{c}"' for c in cols]
+    col_list = ", ".join(f'"{c}"' for c in cols)
+    cur.execute(f'INSERT INTO "_new_{name}" ({col_list}) SELECT {", ".join(select_cols)} FROM "{name}"')
+    cur.execute(f'DROP TABLE "{name}"')
+    cur.execute(f'ALTER TABLE "_new_{name}" RENAME TO "{name}"')
+
+def _money_to_cents(cur, dialect, tables) -> None:
+    for name, cols in MONEY_COLUMNS.items():
+        if name not in tables:
+            continue
+        # Só converte colunas ainda declaradas como ponto flutuante (evita multiplicar por 100 duas vezes)
+        declared = {r[1]: (r[2] or "").upper() for r in cur.execute(f'PRAGMA table_info("{name}")').fetchall()}
+        convert = {c: "to_cents" for c in cols if declared.get(c) in ("FLOAT", "REAL", "DOUBLE", "NUMERIC")}
+        if convert:
+            _rebuild_table(cur, dialect, name, convert)
+
+def _add_column(cur, tables, table: str, column: str, ddl: str) -> None:
+    if table not in tables:
+        return
+    cols = {r[1] for r in cur.execute(f'PRAGMA table_info("{table}")').fetchall()}
+    if column not in cols:
+        cur.execute(f'ALTER TABLE "{table}" ADD COLUMN {column} {ddl}')
+
+def _add_movement_fingerprint(cur, dialect, tables) -> None:
+    _add_column(cur, tables, "movements", "fingerprint", "VARCHAR")
+
+def _add_giant_interest_rate(cur, dialect, tables) -> None:
+    _add_column(cur, tables, "giants", "interest_rate", "FLOAT DEFAULT 0")
+
+def _add_bill_bucket(cur, dialect, tables) -> None:
+    _add_column(cur, tables, "bills", "bucket_id", "INTEGER REFERENCES buckets(id) ON DELETE SET NULL")
+
+def _add_user_revision(cur, dialect, tables) -> None:
+    _add_column(cur, tables, "users", "revision", "INTEGER NOT NULL DEFAULT 0")
+
+def _add_balance_events(cur, dialect, tables) -> None:
+    # Log de eventos de saldo: cria a tabela e preenche com o histórico de movements (deltas com sinal).
+    # Saldos sem movimentações correspondentes entram como um evento "opening". Os snapshots começam vazios.
+    if "balance_events" in tables:
+        return
+    cur.execute(str(CreateTable(Base.metadata.tables["balance_events"]).compile(dialect=dialect)))
+    if "movements" not in tables:
+        return
+    cur.execute(
+        "INSERT INTO balance_events (user_id, bucket_id, kind, delta, description, date, created_at) "
+        "SELECT user_id, bucket_id, kind, CASE WHEN kind = 'income' THEN amount ELSE -amount END, description, date, "
+        "CURRENT_TIMESTAMP FROM movements WHERE bucket_id IS NOT NULL ORDER BY date, id"
+    )
+    cur.execute(
+        "INSERT INTO balance_events (user_id, bucket_id, kind, delta, description, date, created_at) "
+        "SELECT b.user_id, b.id, 'opening', COALESCE(b.balance, 0) - COALESCE(e.total, 0), "
+        "'Saldo sem lançamentos correspondentes', COALESCE(e.first, date('now')), CURRENT_TIMESTAMP "
+        "FROM buckets b LEFT JOIN (SELECT bucket_id, SUM(delta) AS total, MIN(date) AS first FROM balance_events "
+        "GROUP BY bucket_id) e ON e.bucket_id = b.id WHERE COALESCE(b.balance, 0) <> COALESCE(e.total, 0)"
+    )
+
+def _add_categories(cur, dialect, tables) -> None:
+    # Categorias começam vazias: tudo fica "sem categoria" até o usuário criar regras (categories.recategorize).
+    # Os rollups por categoria já nascem preenchidos a partir de movements.
+    for name in ("categories", "category_rollups"):
+        if name not in tables:
+            cur.execute(str(CreateTable(Base.metadata.tables[name]).compile(dialect=dialect)))
+    if "movements" not in tables:
+        return
+    _add_column(cur, tables, "movements", "category_id", "INTEGER REFERENCES categories(id) ON DELETE SET NULL")
+    if "category_rollups" not in tables:
+        cur.execute(
+            "INSERT INTO category_rollups (user_id, year, month, category_id, bucket_id, kind, total, count) "
+            "SELECT user_id, CAST(strftime('%Y', date) AS INTEGER), CAST(strftime('%m', date) AS INTEGER), "
+            "COALESCE(category_id, 0), COALESCE(bucket_id, 0), kind, SUM(amount), COUNT(*) FROM movements "
+            "GROUP BY 1, 2, 3, 4, 5, 6"
+        )
+
+def _add_jobs(cur, dialect, tables) -> None:
+    # A fila do jobs.py entrou sem passo próprio (create_all criava); agora o upgrade em dia não roda create_all
+    if "jobs" not in tables:
+        cur.execute(str(CreateTable(Base.metadata.tables["jobs"]).compile(dialect=dialect)))
+        for ix in Base.metadata.tables["jobs"].indexes:
+            cur.execute(str(CreateIndex(ix).compile(dialect=dialect)))
+
+def _add_transfer_in(cur, dialect, tables) -> None:
+    # Perna de entrada das transferências marcada na própria linha (antes só dava para reconhecer pelo texto).
+    # Histórico: só conta como transferência a entrada "X (entrada)" com a saída "X (saída)" correspondente
+    # (mesmo usuário, dia e valor); uma receita que por acaso termine em " (entrada)" continua receita.
+    if "movements" not in tables:
+        return
+    _add_column(cur, tables, "movements", "transfer_in", "BOOLEAN NOT NULL DEFAULT 0")
+    cur.execute(
+        "UPDATE movements SET transfer_in = 1 WHERE kind = 'income' AND description LIKE '% (entrada)' AND EXISTS ("
+        "SELECT 1 FROM movements o WHERE o.user_id = movements.user_id AND o.kind = 'transfer' "
+        "AND o.date = movements.date AND o.amount = movements.amount "
+        "AND o.description = substr(movements.description, 1, length(movements.description) - 10) || ' (saída)')"
+    )
+
+def _backfill_movement_rollups(cur, dialect, tables) -> None:
+    # Bancos antigos podiam ter movement_rollups vazia (ou incompleta) com movimentações já lançadas;
+    # antes o app preenchia na primeira leitura de cada usuário. Recalcula tudo a partir de movements.
+    if "movement_rollups" not in tables:
+        cur.execute(str(CreateTable(Base.metadata.tables["movement_rollups"]).compile(dialect=dialect)))
+    if "movements" not in tables:
+        return
+    cur.execute("DELETE FROM movement_rollups")
+    cur.execute(
+        "INSERT INTO movement_rollups (user_id, bucket_id, kind, year, month, total, count) "
+        "SELECT user_id, bucket_id, kind, CAST(strftime('%Y', date) AS INTEGER), CAST(strftime('%m', date) AS INTEGER), "
+        "SUM(amount), COUNT(*) FROM movements GROUP BY 1, 2, 3, 4, 5"
+    )
+
+MIGRATIONS = [
+    (1, _money_to_cents),
+    (2, _add_movement_fingerprint),
+    (3, _add_giant_interest_rate),
+    (4, _add_bill_bucket),
+    (5, _add_user_revision),
+    (6, _add_balance_events),
+    (7, _add_categories),
+    (8, _add_jobs),
+    (9, _add_transfer_in),
+    (10, _backfill_movement_rollups),
+]
+LATEST = MIGRATIONS[-1][0]
+
+def ensure_indexes(engine: Engine) -> None:
+    # create_all não cria índices novos em tabelas já existentes
+    for table in Base.metadata.sorted_tables:
+        for ix in table.indexes:
+            ix.create(bind=engine, checkfirst=True)
+
+def upgrade(engine: Engine) -> int:
+    if engine.dialect.name != "sqlite":
+        Base.metadata.create_all(bind=engine)
+        return LATEST
+
+    raw = engine.raw_connection()
+    try:
+        con = raw.driver_connection
+        version = con.execute("PRAGMA user_version").fetchone()[0]
+        if version == LATEST:
+            return LATEST
+        tables = {r[0] for r in con.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        is_new = not (tables & set(Base.metadata.tables))
+        pending = [] if is_new else [(v, fn) for v, fn in MIGRATIONS if v > version]
+        if pending:
+            con.create_function("to_cents", 1, _sql_to_cents, deterministic=True)
+            prev_isolation = con.isolation_level
+            con.isolation_level = None  # controle manual da transação (DDL incluso)
+            cur = con.cursor()
+            cur.execute("PRAGMA foreign_keys=OFF")
+            try:
+                cur.execute("BEGIN")
+                for v, fn in pending:
+                    fn(cur, engine.dialect, tables)
+                    cur.execute(f"PRAGMA user_version={v}")
+                problems = cur.execute("PRAGMA foreign_key_check").fetchall()
+                if problems:
+                    raise RuntimeError(f"Migração quebrou chaves estrangeiras: {problems[:5]}")
+                cur.execute("COMMIT")
+            except Exception:
+                cur.execute("ROLLBACK")
+                raise
+            finally:
+                cur.execute("PRAGMA foreign_keys=ON")
+                con.isolation_level = prev_isolation
+    finally:
+        raw.close()
+
+    Base.metadata.create_all(bind=engine)
+    ensure_indexes(engine)
+    if is_new:
+        # Versão gravada só com o esquema pronto: outro processo que já a veja pode pular o upgrade
+        with engine.begin() as conn:
+            conn.exec_driver_sql(f"PRAGMA user_version={LATEST}")
+    return LATEST
+
+def split_into_shards(router) -> dict:
+    # Copia os dados de cada usuário do banco principal para o shard dele (ids preservados).
+    # Shards que já existem ficam como estão; o banco principal não é alterado.
+    copied = {}
+    for uid in router.user_ids():
+        if os.path.exists(router.path(uid)):
+            continue
+        shard = router.engine_for(uid)
+        n = 0
+        with router.catalog.connect() as src, shard.begin() as dst:
+            for table in Base.metadata.sorted_tables:
+                if table.name == "users" or "user_id" not in table.c:
+                    continue
+                rows = src.execute(select(table).where(table.c.user_id == uid)).mappings().all()
+                if rows:
+                    dst.execute(table.insert(), [dict(r) for r in rows])
+                    n += len(rows)
+        copied[uid] = n
+    return copied
+
+def main() -> None:
+    from db import ShardRouter, engine, SHARD_DIR
+
+    parser = argparse.ArgumentParser(description="Migrações do esquema.")
+    parser.add_argument("command", choices=["upgrade", "shard"],
+                        help="shard: divide o banco único (DATABASE_URL) em um SQLite por usuário")
+    parser.add_argument("--shard-dir", default=SHARD_DIR)
+    args = parser.parse_args()
+
+    print(f"Esquema na versão {upgrade(engine)}.")
+    if args.command == "shard":
+        router = ShardRouter(engine, "sharded", args.shard_dir)
+        for uid, n in split_into_shards(router).items():
+            print(f"usuário {uid}: {n} linhas copiadas para {router.path(uid)}")
+        router.dispose()
+        print("Pronto. Rode o app com STORAGE_MODE=sharded SHARD_DIR=" + args.shard_dir)
+
+if __name__ == "__main__":
+    main()
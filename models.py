@@ -1,11 +1,26 @@
-from sqlalchemy import Column, Integer, String, Float, Date, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, ForeignKey, Boolean, Index, UniqueConstraint, func, false
 from sqlalchemy.orm import relationship
+from sqlalchemy.types import TypeDecorator
 from db import Base
+from money import to_cents, from_cents
+
+class Money(TypeDecorator):
+    # Decimal (reais) no Python, centavos inteiros no banco: somas exatas, sem deriva de float
+    impl = Integer
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return None if value is None else to_cents(value)
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else from_cents(value)
 
 class User(Base):
     __tablename__ = "users"
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False, unique=True)
+    # Incrementada a cada escrita via services: outros processos (app/API) percebem a mudança
+    revision = Column(Integer, nullable=False, default=0, server_default="0")
     buckets = relationship("Bucket", back_populates="user", cascade="all, delete-orphan")
     giants = relationship("Giant", back_populates="user", cascade="all, delete-orphan")
 
@@ -17,7 +32,7 @@ class Bucket(Base):
     description = Column(String, default="")
     percent = Column(Float, nullable=False)  # 0..100
     type = Column(String, default="generic")
-    balance = Column(Float, default=0.0)
+    balance = Column(Money, default=0)
     user = relationship("User", back_populates="buckets")
 
 class Giant(Base):
@@ -25,10 +40,11 @@ class Giant(Base):
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     name = Column(String, nullable=False)
-    total_to_pay = Column(Float, nullable=False)
+    total_to_pay = Column(Money, nullable=False)
     parcels = Column(Integer, default=0)
     months_left = Column(Integer, default=0)
     priority = Column(Integer, default=1)  # 1 = maior prioridade
+    interest_rate = Column(Float, default=0.0)  # juros % ao mês
     status = Column(String, default="active")  # active | defeated
     user = relationship("User", back_populates="giants")
 
@@ -38,16 +54,145 @@ class Movement(Base):
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     bucket_id = Column(Integer, ForeignKey("buckets.id", ondelete="SET NULL"), nullable=True)
     kind = Column(String, nullable=False)  # income | expense | transfer
-    amount = Column(Float, nullable=False)
+    amount = Column(Money, nullable=False)
     description = Column(String, default="")
     date = Column(Date, nullable=False)
+    fingerprint = Column(String, nullable=True)  # hash do conteúdo (importação de extratos)
+    category_id = Column(Integer, ForeignKey("categories.id", ondelete="SET NULL"), nullable=True)  # regras de categories.py
+    transfer_in = Column(Boolean, nullable=False, default=False, server_default=false())  # perna de entrada de services.transfer (não é receita)
+
+    __table_args__ = (
+        # Agregações do Dashboard: filtra por usuário/período e agrupa por tipo.
+        # "amount" no fim deixa o índice cobrindo a consulta (sem ler a tabela).
+        Index("ix_movements_user_date_kind", "user_id", "date", "kind", "amount"),
+        # Paginação por chave do Livro Caixa: (date, id) já sai ordenado (id = rowid no SQLite)
+        Index("ix_movements_user_date_id", "user_id", "date", "id"),
+        # Deduplicação de extratos importados (NULLs não colidem)
+        Index("ux_movements_user_fingerprint", "user_id", "fingerprint", unique=True),
+    )
+
+class Category(Base):
+    # Categoria de gasto por usuário; a descrição da movimentação casa com um dos padrões
+    # (separados por ";", /.../ = regex). Menor prioridade ganha.
+    __tablename__ = "categories"
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    name = Column(String, nullable=False)
+    patterns = Column(String, nullable=False, default="")
+    priority = Column(Integer, nullable=False, default=100)
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "name", name="uq_categories_user_name"),
+    )
+
+class CategoryRollup(Base):
+    # Totais mensais por (categoria, balde, tipo), mantidos junto com cada Movement (índice da página Análises).
+    # 0 = sem categoria / sem balde (sem NULL na chave: o upsert em lote funciona para todas as linhas)
+    __tablename__ = "category_rollups"
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    year = Column(Integer, nullable=False)
+    month = Column(Integer, nullable=False)
+    category_id = Column(Integer, nullable=False, default=0)
+    bucket_id = Column(Integer, nullable=False, default=0)
+    kind = Column(String, nullable=False)
+    total = Column(Money, nullable=False, default=0)
+    count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        # Período primeiro: as consultas da página filtram por usuário e intervalo de meses
+        UniqueConstraint("user_id", "year", "month", "category_id", "bucket_id", "kind", name="uq_category_rollups_key"),
+    )
 
 class Bill(Base):
     __tablename__ = "bills"
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     title = Column(String, nullable=False)
-    amount = Column(Float, nullable=False)
+    amount = Column(Money, nullable=False)
     due_date = Column(Date, nullable=False)
     is_critical = Column(Boolean, default=False)
     paid = Column(Boolean, default=False)
+    # Balde que paga a conta (opcional; sem ele a previsão deduz pelo título)
+    bucket_id = Column(Integer, ForeignKey("buckets.id", ondelete="SET NULL"), nullable=True)
+
+    __table_args__ = (
+        # Contas em aberto por vencimento (Atrasos & Riscos e previsão de caixa)
+        Index("ix_bills_user_paid_due", "user_id", "paid", "due_date"),
+    )
+
+class MovementRollup(Base):
+    # Totais mensais por (usuário, balde, tipo), mantidos junto com cada Movement
+    __tablename__ = "movement_rollups"
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    bucket_id = Column(Integer, ForeignKey("buckets.id", ondelete="SET NULL"), nullable=True)
+    kind = Column(String, nullable=False)
+    year = Column(Integer, nullable=False)
+    month = Column(Integer, nullable=False)
+    total = Column(Money, nullable=False, default=0)
+    count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "bucket_id", "kind", "year", "month", name="uq_movement_rollups_key"),
+    )
+
+class BalanceEvent(Base):
+    # Log só de inserção de tudo que mexe num balde: delta do saldo (com sinal) ou mudança de percentual.
+    # O saldo numa data = último snapshot até ela + soma dos eventos depois dele.
+    __tablename__ = "balance_events"
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    bucket_id = Column(Integer, ForeignKey("buckets.id", ondelete="CASCADE"), nullable=False)
+    kind = Column(String, nullable=False)  # income | expense | transfer | opening | percent
+    delta = Column(Money, nullable=False, default=0)
+    percent = Column(Float, nullable=True)  # novo percentual (eventos "percent")
+    description = Column(String, default="")
+    date = Column(Date, nullable=False)  # data de efeito (a do lançamento)
+    created_at = Column(DateTime, nullable=False, server_default=func.current_timestamp())
+
+    __table_args__ = (
+        # Cauda depois do snapshot: filtra por balde/data e soma o delta sem ler a tabela
+        Index("ix_balance_events_bucket_date", "bucket_id", "date", "delta"),
+        Index("ix_balance_events_user_date", "user_id", "date"),
+    )
+
+class BalanceSnapshot(Base):
+    # Saldo do balde consolidado no fim de um dia (eventos com date <= as_of), gravado pela compactação
+    __tablename__ = "balance_snapshots"
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    bucket_id = Column(Integer, ForeignKey("buckets.id", ondelete="CASCADE"), nullable=False)
+    as_of = Column(Date, nullable=False)
+    balance = Column(Money, nullable=False)
+    events = Column(Integer, nullable=False, default=0)  # eventos consolidados desde o snapshot anterior
+
+    __table_args__ = (
+        UniqueConstraint("bucket_id", "as_of", name="uq_balance_snapshots_bucket_as_of"),
+        Index("ix_balance_snapshots_user_as_of", "user_id", "as_of"),
+    )
+
+class Job(Base):
+    # Fila de tarefas pesadas (jobs.py): o app só enfileira e acompanha; um pool de processos executa.
+    # Fica no banco principal (com shards, no cadastro), junto com os usuários.
+    __tablename__ = "jobs"
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    kind = Column(String, nullable=False)  # chave de jobs.HANDLERS
+    params = Column(String, default="{}")  # JSON
+    status = Column(String, nullable=False, default="queued")  # queued | running | done | failed
+    progress = Column(Float, nullable=False, default=0.0)  # 0..1
+    message = Column(String, default="")
+    result_path = Column(String, nullable=True)  # arquivo para download (exportações)
+    result_name = Column(String, nullable=True)
+    error = Column(String, nullable=True)
+    worker = Column(String, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, nullable=False, server_default=func.current_timestamp())
+    updated_at = Column(DateTime, nullable=True)  # batimento do worker enquanto roda
+    finished_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_jobs_status_id", "status", "id"),
+        Index("ix_jobs_user_id", "user_id", "id"),
+    )
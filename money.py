@@ -0,0 +1,50 @@
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from typing import List, Sequence
+
+# Dinheiro no Python: Decimal com 2 casas. No banco: centavos inteiros.
+CENT = Decimal("0.01")
+ZERO = Decimal("0.00")
+
+# Percentuais viram pesos inteiros com resolução de 0,0001%
+PERCENT_SCALE = 10_000
+
+def to_cents(v) -> int:
+    if v is None:
+        return 0
+    if isinstance(v, int):
+        return v * 100
+    d = v if isinstance(v, Decimal) else Decimal(str(v))
+    return int((d * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+def from_cents(c: int) -> Decimal:
+    return Decimal(int(c)).scaleb(-2)
+
+def to_money(v) -> Decimal:
+    return from_cents(to_cents(v))
+
+def parse_decimal(s: str) -> Decimal:
+    try:
+        return to_money(Decimal(s))
+    except (InvalidOperation, ValueError):
+        return ZERO
+
+def percent_weights(percents: Sequence[float]) -> List[int]:
+    weights = [int((Decimal(str(p)) * PERCENT_SCALE).quantize(Decimal(1), rounding=ROUND_HALF_UP)) for p in percents]
+    if any(w < 0 for w in weights):
+        raise ValueError("Percentuais negativos não podem ser divididos.")
+    return weights
+
+def split_cents(total: int, weights: Sequence[int]) -> List[int]:
+    # Maiores restos: cada parte recebe o piso da sua cota e os centavos que
+    # sobram vão para os maiores restos (empate: ordem original). Soma == total.
+    total_w = sum(weights)
+    if total_w <= 0 or total == 0:
+        return [0 for _ in weights]
+    sign = -1 if total < 0 else 1
+    t = abs(total)
+    base = [t * w // total_w for w in weights]
+    rem = [t * w % total_w for w in weights]
+    left = t - sum(base)
+    for i in sorted(range(len(weights)), key=lambda i: (-rem[i], i))[:left]:
+        base[i] += 1
+    return [sign * b for b in base]
@@ -0,0 +1,169 @@
+import argparse
+from datetime import date
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional
+from sqlalchemy import select, update, delete, insert, func, extract
+from sqlalchemy.orm import Session
+from models import Bucket, Movement, MovementRollup
+from money import ZERO
+
+# Sinal de cada tipo no saldo do balde (mesma regra usada em app.py)
+BALANCE_SIGN = {"income": 1, "expense": -1, "transfer": -1}
+
+def _key_filter(user_id: int, bucket_id: Optional[int], kind: str, year: int, month: int):
+    bucket_cond = MovementRollup.bucket_id.is_(None) if bucket_id is None else MovementRollup.bucket_id == bucket_id
+    return (
+        MovementRollup.user_id == user_id,
+        bucket_cond,
+        MovementRollup.kind == kind,
+        MovementRollup.year == year,
+        MovementRollup.month == month,
+    )
+
+def bump(db: Session, user_id: int, bucket_id: Optional[int], kind: str, d: date,
+         amount: Decimal, count: int = 1) -> None:
+    # Roda na mesma transação da inserção do Movement: commit/rollback valem para os dois
+    res = db.execute(
+        update(MovementRollup)
+        .where(*_key_filter(user_id, bucket_id, kind, d.year, d.month))
+        .values(total=MovementRollup.total + amount, count=MovementRollup.count + count)
+        .execution_options(synchronize_session=False)
+    )
+    if res.rowcount == 0:
+        db.execute(insert(MovementRollup).values(
+            user_id=user_id, bucket_id=bucket_id, kind=kind,
+            year=d.year, month=d.month, total=amount, count=count,
+        ))
+
+def record_movement(db: Session, m: Movement) -> None:
+    bump(db, m.user_id, m.bucket_id, m.kind, m.date, m.amount)
+
+def record_rows(db: Session, user_id: int, rows: Iterable[Dict]) -> None:
+    # Para inserções em lote (dicts de Movement): agrega por (balde, tipo, mês) antes de gravar
+    acc: Dict[tuple, list] = {}
+    for r in rows:
+        key = (r["bucket_id"], r["kind"], r["date"].year, r["date"].month)
+        a = acc.setdefault(key, [ZERO, 0, r["date"]])
+        a[0] += r["amount"]
+        a[1] += 1
+    upsert = upsert_insert(db)
+    keyed = []
+    for (bucket_id, kind, year, month), (total, count, d) in acc.items():
+        if upsert is None or bucket_id is None:  # NULL não conflita na chave única: vai pelo bump
+            bump(db, user_id, bucket_id, kind, d, total, count)
+        else:
+            keyed.append({"user_id": user_id, "bucket_id": bucket_id, "kind": kind,
+                          "year": year, "month": month, "total": total, "count": count})
+    if keyed:
+        # Um único INSERT ... ON CONFLICT DO UPDATE (executemany) em vez de um UPDATE por chave
+        stmt = upsert(MovementRollup)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["user_id", "bucket_id", "kind", "year", "month"],
+            set_={"total": MovementRollup.total + stmt.excluded.total, "count": MovementRollup.count + stmt.excluded.count},
+        )
+        db.connection().execute(stmt, keyed)
+
+def upsert_insert(db: Session):
+    name = db.get_bind().dialect.name
+    if name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as upsert
+    elif name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as upsert
+    else:
+        return None
+    return upsert
+
+def _raw_totals_stmt(user_id: Optional[int]):
+    year = extract("year", Movement.date).label("year")
+    month = extract("month", Movement.date).label("month")
+    stmt = select(
+        Movement.user_id, Movement.bucket_id, Movement.kind, year, month,
+        func.sum(Movement.amount).label("total"), func.count().label("count"),
+    ).group_by(Movement.user_id, Movement.bucket_id, Movement.kind, year, month)
+    if user_id is not None:
+        stmt = stmt.where(Movement.user_id == user_id)
+    return stmt
+
+def rebuild(db: Session, user_id: Optional[int] = None) -> int:
+    # Recalcula a partir da tabela movements (varredura completa: uso administrativo)
+    stmt = delete(MovementRollup)
+    if user_id is not None:
+        stmt = stmt.where(MovementRollup.user_id == user_id)
+    db.execute(stmt)
+    rows = [dict(r._mapping) for r in db.execute(_raw_totals_stmt(user_id))]
+    if rows:
+        db.execute(insert(MovementRollup), rows)
+    db.commit()
+    return len(rows)
+
+def verify(db: Session, user_id: Optional[int] = None) -> List[Dict]:
+    drift = []
+
+    stored = {}
+    stmt = select(MovementRollup)
+    if user_id is not None:
+        stmt = stmt.where(MovementRollup.user_id == user_id)
+    for r in db.execute(stmt).scalars():
+        stored[(r.user_id, r.bucket_id, r.kind, r.year, r.month)] = (r.total, r.count)
+
+    computed = {}
+    for r in db.execute(_raw_totals_stmt(user_id)):
+        computed[(r.user_id, r.bucket_id, r.kind, r.year, r.month)] = (r.total, r.count)
+
+    for key in sorted(set(stored) | set(computed), key=lambda k: tuple(-1 if v is None else v for v in k)):
+        s_total, s_count = stored.get(key, (ZERO, 0))
+        c_total, c_count = computed.get(key, (ZERO, 0))
+        if s_total != c_total or s_count != c_count:
+            drift.append({
+                "table": "movement_rollups",
+                "key": dict(zip(("user_id", "bucket_id", "kind", "year", "month"), key)),
+                "stored": s_total, "expected": c_total,
+            })
+
+    # Bucket.balance é um contador desnormalizado: compara com o saldo das movimentações
+    expected_balance = {}
+    for (uid, bid, kind, _, _), (total, _) in computed.items():
+        if bid is not None:
+            expected_balance[bid] = expected_balance.get(bid, ZERO) + BALANCE_SIGN.get(kind, 0) * total
+    stmt = select(Bucket)
+    if user_id is not None:
+        stmt = stmt.where(Bucket.user_id == user_id)
+    for b in db.execute(stmt).scalars():
+        expected = expected_balance.get(b.id, ZERO)
+        if (b.balance or ZERO) != expected:
+            drift.append({
+                "table": "buckets",
+                "key": {"user_id": b.user_id, "bucket_id": b.id},
+                "stored": b.balance, "expected": expected,
+            })
+    return drift
+
+def main() -> None:
+    from db import router
+    import migrations
+
+    parser = argparse.ArgumentParser(description="Recalcula/verifica os totais mensais de movimentações.")
+    parser.add_argument("command", choices=["rebuild", "verify"])
+    parser.add_argument("--user", type=int, default=None, help="ID do usuário (padrão: todos)")
+    args = parser.parse_args()
+
+    migrations.upgrade(router.catalog)
+    # Banco único: uma passada para todos; com shards: um usuário (arquivo) por vez
+    scopes = router.user_ids() if router.sharded and args.user is None else [args.user]
+    n, drift = 0, []
+    for uid in scopes:
+        with router.session(uid) as db:
+            if args.command == "rebuild":
+                n += rebuild(db, uid)
+            else:
+                drift += verify(db, uid)
+    if args.command == "rebuild":
+        print(f"{n} linhas de rollup recalculadas.")
+    else:
+        for d in drift:
+            print(f"[{d['table']}] {d['key']}: armazenado={d['stored']} esperado={d['expected']}")
+        print("OK, sem divergências." if not drift else f"{len(drift)} divergência(s) encontrada(s).")
+        raise SystemExit(1 if drift else 0)
+
+if __name__ == "__main__":
+    main()
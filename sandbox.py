@@ -0,0 +1,203 @@
+import argparse
+import time
+from dataclasses import dataclass, replace
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import select, func
+from sqlalchemy.orm import Session
+from aggregates import DEBT_BUCKET_TYPES
+from cache import BucketView, GiantView, BillView, load_buckets, load_giants, load_bills
+from events import balances_at
+from logic import split_cents_batch
+from models import Movement
+from money import to_cents, from_cents, percent_weights
+from rollups import BALANCE_SIGN
+import simulator
+from forecast import bill_bucket
+
+# Sandbox de planos de percentuais: "e se eu tivesse dividido as entradas assim?"
+# O snapshot copia uma vez (read models congelados + arrays só-leitura) o que a simulação precisa;
+# cada plano é cópia-na-escrita dos baldes (só os que mudam de % ganham um objeto novo) e nada volta ao banco.
+# O replay redivide as entradas de cada dia da janela (exceto transferências) de todos os planos de uma vez.
+
+BILL_HORIZON_DAYS = 30
+
+@dataclass(frozen=True)
+class Snapshot:
+    user_id: int
+    start: date
+    end: date
+    months: int
+    buckets: Tuple[BucketView, ...]
+    giants: Tuple[GiantView, ...]
+    bills: Tuple[BillView, ...]
+    opening: np.ndarray  # (B,) saldo de cada balde na véspera de start, em centavos
+    income: np.ndarray   # (D,) entrada bruta do dia (soma das partes), em centavos
+    actual: np.ndarray   # (D, B) como essas entradas foram divididas de fato
+    other: np.ndarray    # (D, B) demais variações (saídas, transferências), iguais em todo plano
+
+@dataclass(frozen=True)
+class Plan:
+    name: str
+    buckets: Tuple[BucketView, ...]
+
+def _frozen(arr: np.ndarray) -> np.ndarray:
+    arr.setflags(write=False)
+    return arr
+
+def take(db: Session, user_id: int, months: int = 24, today: Optional[date] = None) -> Snapshot:
+    today = today or date.today()
+    start = today - relativedelta(months=months) + timedelta(days=1)
+    buckets = tuple(sorted(load_buckets(db, user_id), key=lambda b: b.id))
+    col = {b.id: j for j, b in enumerate(buckets)}
+    days = (today - start).days + 1
+    actual = np.zeros((days, len(buckets)), dtype="int64")
+    other = np.zeros((days, len(buckets)), dtype="int64")
+
+    stmt = (
+        select(Movement.date, Movement.bucket_id, Movement.kind, Movement.transfer_in, func.sum(Movement.amount))
+        .where(Movement.user_id == user_id, Movement.bucket_id.is_not(None), Movement.date.between(start, today))
+        .group_by(Movement.date, Movement.bucket_id, Movement.kind, Movement.transfer_in)
+    )
+    for d, bucket_id, kind, transfer, total in db.execute(stmt):
+        j = col.get(bucket_id)
+        if j is None or kind not in BALANCE_SIGN:
+            continue
+        cents = BALANCE_SIGN[kind] * to_cents(total)
+        if kind == "income" and not transfer:
+            actual[(d - start).days, j] += cents
+        else:
+            other[(d - start).days, j] += cents
+
+    opening_map = balances_at(db, user_id, start - timedelta(days=1))
+    opening = np.array([to_cents(opening_map.get(b.id, 0)) for b in buckets], dtype="int64")
+    return Snapshot(
+        user_id=user_id, start=start, end=today, months=months, buckets=buckets,
+        giants=tuple(load_giants(db, user_id)), bills=tuple(load_bills(db, user_id)),
+        opening=_frozen(opening), income=_frozen(actual.sum(axis=1)), actual=_frozen(actual), other=_frozen(other),
+    )
+
+def plan(snapshot: Snapshot, name: str, percents: Dict[int, float]) -> Plan:
+    # Baldes fora de "percents" (ou com o mesmo %) são os próprios objetos do snapshot
+    return Plan(name, tuple(
+        replace(b, percent=float(percents[b.id])) if b.id in percents and float(percents[b.id]) != b.percent else b
+        for b in snapshot.buckets
+    ))
+
+def current(snapshot: Snapshot, name: str = "Atual") -> Plan:
+    return Plan(name, snapshot.buckets)
+
+def _allocations(snapshot: Snapshot, plans: Sequence[Plan]) -> np.ndarray:
+    # (P, D, B): uma divisão vetorizada por plano sobre todos os dias (mesmo arredondamento de compute_bucket_splits)
+    out = np.zeros((len(plans),) + snapshot.actual.shape, dtype="int64")
+    for p, pl in enumerate(plans):
+        out[p] = split_cents_batch(snapshot.income, percent_weights([b.percent for b in pl.buckets]))
+    return out
+
+def replay(snapshot: Snapshot, plans: Sequence[Plan], strategy: str = "avalanche", with_history: bool = True) -> Dict:
+    # Saldos ao longo da janela e quitação dos gigantes para cada plano; com with_history,
+    # a linha 0 é o que aconteceu de fato (entradas divididas como foram lançadas)
+    names = [pl.name for pl in plans]
+    alloc = _allocations(snapshot, plans)
+    if with_history:
+        names = ["Histórico real"] + names
+        alloc = np.concatenate([snapshot.actual[None], alloc])
+    path = snapshot.opening[None, None, :] + np.cumsum(snapshot.other[None] + alloc, axis=1)  # (P, D, B)
+    negative = path < 0
+    first_negative = [
+        [snapshot.start + timedelta(days=int(i)) if hit else None for i, hit in zip(idx, any_)]
+        for idx, any_ in zip(negative.argmax(axis=1), negative.any(axis=1))
+    ]
+
+    # Orçamento para dívidas: média mensal do que o plano manda para baldes de dívida na janela
+    debt = np.array([b.type in DEBT_BUCKET_TYPES for b in snapshot.buckets], dtype=bool)
+    totals = alloc.sum(axis=1)  # (P, B)
+    budgets = [(from_cents(int(c)) / snapshot.months).quantize(Decimal("0.01")) for c in totals[:, debt].sum(axis=1)]
+    sim = simulator.simulate(snapshot.giants, budgets, strategies=(strategy,))
+    first_month = snapshot.end.replace(day=1)
+    payoff = [
+        [first_month + relativedelta(months=int(m)) if m >= 0 else None for m in row]
+        for row in sim["payoff_month"][0]
+    ]
+    freedom = [int(m) for m in sim["months_to_freedom"][0]]
+
+    final = path[:, -1, :]  # a janela tem ao menos um dia (hoje)
+    return {
+        "plans": names,
+        "buckets": [b.name for b in snapshot.buckets],
+        "percents": ([None] if with_history else []) + [[b.percent for b in pl.buckets] for pl in plans],
+        "allocated": totals,
+        "final": final,
+        "low": path.min(axis=1),
+        "first_negative": first_negative,
+        "debt_budget": budgets,
+        "strategy": strategy,
+        "giant_names": sim.get("giant_names", []),
+        "payoff": payoff,
+        "months_to_freedom": freedom,
+        "bills_short": _bills_short(snapshot, final),
+    }
+
+def _bills_short(snapshot: Snapshot, final: np.ndarray) -> np.ndarray:
+    # Quanto faltaria (centavos) para as contas críticas em aberto dos próximos dias, balde a balde
+    until = snapshot.end + timedelta(days=BILL_HORIZON_DAYS)
+    due = np.zeros(len(snapshot.buckets), dtype="int64")
+    for bill in snapshot.bills:
+        if bill.paid or not bill.is_critical or bill.due_date > until:
+            continue
+        j = bill_bucket(bill, snapshot.buckets)
+        if j is not None:
+            due[j] += to_cents(bill.amount)
+    return np.maximum(due[None, :] - final, 0).sum(axis=1)
+
+def summary_rows(result: Dict) -> List[Dict]:
+    # Uma linha por plano, valores em reais (Decimal) e datas
+    rows = []
+    for p, name in enumerate(result["plans"]):
+        negative = [(result["buckets"][j], d) for j, d in enumerate(result["first_negative"][p]) if d is not None]
+        freedom = result["months_to_freedom"][p] if result["months_to_freedom"] else 0
+        payoff = result["payoff"][p] if result["payoff"] else []
+        rows.append({
+            "plan": name,
+            "final_total": from_cents(int(result["final"][p].sum())),
+            **{f"final:{b}": from_cents(int(result["final"][p, j])) for j, b in enumerate(result["buckets"])},
+            "debt_budget": result["debt_budget"][p],
+            "months_to_freedom": freedom,
+            "freedom_date": max(payoff) if payoff and all(payoff) else None,
+            "first_negative": min(negative, key=lambda x: x[1]) if negative else None,
+            "bills_short": from_cents(int(result["bills_short"][p])),
+        })
+    return rows
+
+def main() -> None:
+    from db import router
+    import migrations
+
+    parser = argparse.ArgumentParser(description="Compara planos de percentuais sobre o histórico de entradas (nada é gravado).")
+    parser.add_argument("--user", type=int, required=True)
+    parser.add_argument("--months", type=int, default=24)
+    parser.add_argument("--plans", type=int, default=20, help="Planos sintéticos (variações do atual)")
+    args = parser.parse_args()
+
+    migrations.upgrade(router.catalog)
+    with router.session(args.user) as db:
+        t0 = time.perf_counter()
+        snap = take(db, args.user, args.months)
+        t1 = time.perf_counter()
+    rng = np.random.default_rng(0)
+    plans = [current(snap)] + [
+        plan(snap, f"Plano {i}", {b.id: max(0.0, b.percent * f) for b, f in zip(snap.buckets, rng.uniform(0.5, 1.5, len(snap.buckets)))})
+        for i in range(1, args.plans)
+    ]
+    result = replay(snap, plans)
+    t2 = time.perf_counter()
+    for r in summary_rows(result):
+        print(f"{r['plan']:>16}: saldo final {r['final_total']}, dívidas/mês {r['debt_budget']:.2f}, "
+              f"liberdade em {r['months_to_freedom']} meses")
+    print(f"snapshot: {t1 - t0:.3f}s ({len(snap.income)} dias), replay de {len(plans)} planos: {t2 - t1:.3f}s")
+
+if __name__ == "__main__":
+    main()
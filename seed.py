@@ -1,10 +1,11 @@
 from datetime import date, timedelta
 from sqlalchemy.orm import Session
-from db import engine, SessionLocal, Base
+from db import engine, SessionLocal
 from models import User, Bucket, Giant, Bill
+import migrations
 
 print("Criando tabelas...")
-Base.metadata.create_all(bind=engine)
+migrations.upgrade(engine)
 db: Session = SessionLocal()
 
 # Limpa e popula
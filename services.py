@@ -0,0 +1,354 @@
+import random
+import re
+import time
+from datetime import date
+from decimal import Decimal
+from typing import Callable, Dict, List, Optional, Sequence, TypeVar
+from sqlalchemy import update, select, exists, insert, bindparam
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from models import User, Bucket, Giant, Bill, Movement, MovementRollup, BalanceEvent, BalanceSnapshot, Category, CategoryRollup
+from logic import compute_bucket_splits, compute_bucket_splits_batch
+from money import to_cents, from_cents
+import rollups
+import categories
+import events
+
+T = TypeVar("T")
+
+MAX_RETRIES = 8
+
+class InsufficientFunds(Exception):
+    def __init__(self, bucket_id: int):
+        super().__init__(f"Saldo insuficiente no balde {bucket_id}.")
+        self.bucket_id = bucket_id
+
+class BucketNotFound(Exception):
+    def __init__(self, bucket_id: int):
+        super().__init__(f"Balde {bucket_id} não encontrado.")
+        self.bucket_id = bucket_id
+
+class GiantNotFound(Exception):
+    def __init__(self, giant_id: int):
+        super().__init__(f"Gigante {giant_id} não encontrado.")
+        self.giant_id = giant_id
+
+class BillNotFound(Exception):
+    def __init__(self, bill_id: int):
+        super().__init__(f"Conta {bill_id} não encontrada.")
+        self.bill_id = bill_id
+
+def _is_busy(exc: OperationalError) -> bool:
+    msg = str(exc.orig).lower()
+    return "database is locked" in msg or "database is busy" in msg
+
+def with_retry(db: Session, fn: Callable[[Session], T], retries: int = MAX_RETRIES) -> T:
+    # Executa fn(db) e faz commit; em SQLITE_BUSY desfaz tudo e tenta de novo (backoff com jitter)
+    for attempt in range(retries + 1):
+        try:
+            out = fn(db)
+            db.commit()
+            return out
+        except OperationalError as e:
+            db.rollback()
+            if not _is_busy(e) or attempt == retries:
+                raise
+            time.sleep(min(0.5, 0.01 * 2 ** attempt) * (0.5 + random.random()))
+        except Exception:
+            db.rollback()
+            raise
+
+def apply_delta(db: Session, user_id: int, bucket_id: int, delta: Decimal, check_funds: bool = False) -> None:
+    # UPDATE único (sem ler-modificar-gravar no Python): o saldo é ajustado e, para saídas,
+    # a checagem de saldo é feita na mesma instrução, sob o lock de escrita do banco
+    stmt = (
+        update(Bucket)
+        .where(Bucket.id == bucket_id, Bucket.user_id == user_id)
+        .values(balance=Bucket.balance + delta)
+        .execution_options(synchronize_session=False)
+    )
+    if check_funds and delta < 0:
+        stmt = stmt.where(Bucket.balance >= -delta)
+    if db.execute(stmt).rowcount == 1:
+        return
+    found = db.execute(select(exists().where(Bucket.id == bucket_id, Bucket.user_id == user_id))).scalar()
+    raise InsufficientFunds(bucket_id) if found else BucketNotFound(bucket_id)
+
+def touch_user(db: Session, user_id: int) -> None:
+    # Marca que os dados do usuário mudaram (caches de outros processos comparam a revisão)
+    db.execute(
+        update(User).where(User.id == user_id).values(revision=User.revision + 1)
+        .execution_options(synchronize_session=False)
+    )
+
+def user_revision(db: Session, user_id: int) -> int:
+    return db.execute(select(User.revision).where(User.id == user_id)).scalar() or 0
+
+def _owned(db: Session, model, obj_id: int, user_id: int, not_found):
+    obj = db.get(model, obj_id)
+    if obj is None or obj.user_id != user_id:
+        raise not_found(obj_id)
+    return obj
+
+def _add_movement(db: Session, user_id: int, bucket_id: int, kind: str, amount: Decimal,
+                  description: str, d: date, transfer_in: bool = False) -> Movement:
+    m = Movement(user_id=user_id, bucket_id=bucket_id, kind=kind, amount=amount, description=description, date=d,
+                 transfer_in=transfer_in)
+    db.add(m)
+    rollups.record_movement(db, m)
+    categories.record_movement(db, m)
+    events.record_movement(db, m)
+    return m
+
+# ---- Operações ----
+
+def post_income_split(db: Session, user_id: int, buckets: Sequence, total: Decimal, d: date,
+                      description: str = "Entrada diária") -> List[Dict]:
+    splits = compute_bucket_splits(buckets, total)
+
+    def op(db: Session):
+        for s in splits:
+            apply_delta(db, user_id, s["bucket_id"], s["value"])
+            _add_movement(db, user_id, s["bucket_id"], "income", s["value"], description, d)
+        touch_user(db, user_id)
+        return splits
+
+    return with_retry(db, op)
+
+def transfer(db: Session, user_id: int, orig: int, dest: int, amount: Decimal, d: date,
+             description: str = "Transferência entre baldes", allow_negative: bool = False) -> None:
+    if amount <= 0 or orig == dest:
+        raise ValueError("Informe um valor > 0 e selecione baldes diferentes.")
+
+    def op(db: Session):
+        apply_delta(db, user_id, orig, -amount, check_funds=not allow_negative)
+        apply_delta(db, user_id, dest, amount)
+        _add_movement(db, user_id, orig, "transfer", amount, description + " (saída)", d)
+        _add_movement(db, user_id, dest, "income", amount, description + " (entrada)", d, transfer_in=True)
+        touch_user(db, user_id)
+
+    with_retry(db, op)
+
+def post_movement(db: Session, user_id: int, bucket_id: int, kind: str, amount: Decimal, d: date,
+                  description: str = "", allow_negative: bool = False) -> None:
+    if amount <= 0:
+        raise ValueError("Informe um valor > 0.")
+    if kind not in rollups.BALANCE_SIGN:
+        raise ValueError(f"Tipo inválido: {kind}")
+
+    def op(db: Session):
+        delta = amount * rollups.BALANCE_SIGN[kind]
+        apply_delta(db, user_id, bucket_id, delta, check_funds=not allow_negative)
+        _add_movement(db, user_id, bucket_id, kind, amount, description, d)
+        touch_user(db, user_id)
+
+    with_retry(db, op)
+
+def post_incomes(db: Session, user_id: int, buckets: Sequence, incomes: Sequence[Dict]) -> Dict:
+    # Várias entradas numa transação só (webhooks): divisão vetorizada, um INSERT em lote,
+    # um UPDATE de saldo por balde. "ref" opcional torna o envio idempotente (reenvio = duplicata).
+    if not buckets:
+        raise ValueError("Crie baldes primeiro.")
+    cents = [to_cents(i["total"]) for i in incomes]
+    if any(c <= 0 for c in cents):
+        raise ValueError("Informe valores > 0.")
+    splits = compute_bucket_splits_batch(buckets, cents)
+
+    def op(db: Session):
+        refs = {f"api:{i['ref']}:0" for i in incomes if i.get("ref")}
+        seen = set(db.execute(
+            select(Movement.fingerprint).where(Movement.user_id == user_id, Movement.fingerprint.in_(refs))
+        ).scalars()) if refs else set()
+        rows, posted, duplicates = [], 0, 0
+        deltas = [0] * len(buckets)
+        for n, inc in enumerate(incomes):
+            ref = inc.get("ref")
+            if ref and f"api:{ref}:0" in seen:
+                duplicates += 1
+                continue
+            if ref:
+                seen.add(f"api:{ref}:0")
+            posted += 1
+            for j, b in enumerate(buckets):
+                v = int(splits[n, j])
+                deltas[j] += v
+                rows.append({
+                    "user_id": user_id, "bucket_id": b.id, "kind": "income", "amount": from_cents(v),
+                    "description": inc.get("description") or "Entrada diária", "date": inc["date"],
+                    "fingerprint": f"api:{ref}:{j}" if ref else None,
+                })
+        if rows:
+            categories.tag_rows(db, user_id, rows)
+            db.execute(insert(Movement), rows)
+            # Entradas só somam: um UPDATE em lote (executemany) para todos os baldes
+            db.connection().execute(
+                update(Bucket.__table__)
+                .where(Bucket.id == bindparam("b_id"), Bucket.user_id == user_id)
+                .values(balance=Bucket.balance + bindparam("delta", type_=Bucket.balance.type)),
+                [{"b_id": b.id, "delta": from_cents(v)} for b, v in zip(buckets, deltas) if v],
+            )
+            rollups.record_rows(db, user_id, rows)
+            categories.record_rows(db, user_id, rows)
+            events.record_rows(db, user_id, rows)
+            touch_user(db, user_id)
+        return {"posted": posted, "duplicates": duplicates, "movements": len(rows)}
+
+    return with_retry(db, op)
+
+# ---- Cadastros (baldes, gigantes, contas) ----
+
+def create_bucket(db: Session, user_id: int, name: str, percent: float, description: str = "",
+                  type: str = "generic") -> Bucket:
+    if not name.strip():
+        raise ValueError("Informe o nome do balde.")
+    if percent < 0:
+        raise ValueError("Percentual não pode ser negativo.")
+
+    def op(db: Session):
+        b = Bucket(user_id=user_id, name=name.strip(), description=description.strip(), percent=percent, type=type, balance=0)
+        db.add(b)
+        touch_user(db, user_id)
+        return b
+
+    return with_retry(db, op)
+
+def update_bucket(db: Session, user_id: int, bucket_id: int, **fields) -> Bucket:
+    if fields.get("percent", 0) < 0:
+        raise ValueError("Percentual não pode ser negativo.")
+
+    def op(db: Session):
+        b = _owned(db, Bucket, bucket_id, user_id, BucketNotFound)
+        changed = "percent" in fields and fields["percent"] != b.percent
+        for k in ("name", "description", "percent", "type"):
+            if k in fields:
+                setattr(b, k, fields[k])
+        if changed:
+            events.record_percents(db, user_id, [b], "Percentual alterado")
+        touch_user(db, user_id)
+        return b
+
+    return with_retry(db, op)
+
+def normalize_buckets(db: Session, user_id: int) -> List[float]:
+    def op(db: Session):
+        buckets = list(db.execute(select(Bucket).where(Bucket.user_id == user_id)).scalars())
+        total = sum(b.percent for b in buckets)
+        if total <= 0:
+            raise ValueError("Não é possível normalizar: soma é 0%.")
+        factor = 100.0 / total
+        for b in buckets:
+            b.percent = round(b.percent * factor, 2)
+        events.record_percents(db, user_id, buckets, "Normalização dos percentuais")
+        touch_user(db, user_id)
+        return [b.percent for b in buckets]
+
+    return with_retry(db, op)
+
+def create_giant(db: Session, user_id: int, name: str, total_to_pay: Decimal, parcels: int = 0,
+                 months_left: int = 0, priority: int = 1, interest_rate: float = 0.0) -> Giant:
+    if not name.strip():
+        raise ValueError("Informe o nome do gigante.")
+
+    def op(db: Session):
+        g = Giant(user_id=user_id, name=name.strip(), total_to_pay=total_to_pay, parcels=parcels,
+                  months_left=months_left, priority=priority, interest_rate=interest_rate, status="active")
+        db.add(g)
+        touch_user(db, user_id)
+        return g
+
+    return with_retry(db, op)
+
+def defeat_giant(db: Session, user_id: int, giant_id: int) -> Giant:
+    def op(db: Session):
+        g = _owned(db, Giant, giant_id, user_id, GiantNotFound)
+        g.status = "defeated"
+        touch_user(db, user_id)
+        return g
+
+    return with_retry(db, op)
+
+def create_bill(db: Session, user_id: int, title: str, amount: Decimal, due_date: date,
+                is_critical: bool = False, bucket_id: Optional[int] = None) -> Bill:
+    if not title.strip():
+        raise ValueError("Informe o título da conta.")
+
+    def op(db: Session):
+        if bucket_id is not None:
+            _owned(db, Bucket, bucket_id, user_id, BucketNotFound)
+        b = Bill(user_id=user_id, title=title.strip(), amount=amount, due_date=due_date,
+                 is_critical=is_critical, paid=False, bucket_id=bucket_id)
+        db.add(b)
+        touch_user(db, user_id)
+        return b
+
+    return with_retry(db, op)
+
+def update_bill(db: Session, user_id: int, bill_id: int, **fields) -> Bill:
+    def op(db: Session):
+        b = _owned(db, Bill, bill_id, user_id, BillNotFound)
+        if fields.get("bucket_id") is not None:
+            _owned(db, Bucket, fields["bucket_id"], user_id, BucketNotFound)
+        for k in ("title", "amount", "due_date", "is_critical", "paid", "bucket_id"):
+            if k in fields:
+                setattr(b, k, fields[k])
+        touch_user(db, user_id)
+        return b
+
+    return with_retry(db, op)
+
+def save_categories(db: Session, user_id: int, rows: Sequence[Dict]) -> int:
+    # Grava a lista completa editada na página Análises: {"id" (None = nova), "name", "patterns"}; a ordem vira a
+    # prioridade e o que não veio é apagado. As movimentações só mudam com categories.recategorize (job).
+    names = [(r.get("name") or "").strip() for r in rows]
+    if any(not n for n in names):
+        raise ValueError("Toda categoria precisa de um nome.")
+    if len({n.lower() for n in names}) != len(names):
+        raise ValueError("Há categorias com o mesmo nome.")
+    for r in rows:
+        for p in categories.split_patterns(r.get("patterns")):
+            if len(p) > 2 and p.startswith("/") and p.endswith("/"):
+                try:
+                    re.compile(p[1:-1])
+                except re.error as e:
+                    raise ValueError(f"Regex inválida em {r['name']!r}: {p} ({e})")
+
+    def op(db: Session):
+        existing = {c.id: c for c in categories.load(db, user_id)}
+        keep = set()
+        # Nome é único por usuário: renomeia tudo provisoriamente para permitir trocar nomes entre categorias
+        for c in existing.values():
+            c.name = f"__{c.id}"
+        db.flush()
+        for priority, (r, name) in enumerate(zip(rows, names)):
+            c = existing.get(r.get("id"))
+            if c is None:
+                c = Category(user_id=user_id)
+                db.add(c)
+            c.name, c.patterns, c.priority = name, (r.get("patterns") or "").strip(), priority
+            keep.add(c.id)
+        for cid, c in existing.items():
+            if cid not in keep:
+                db.delete(c)
+        categories.forget(db, user_id)
+        touch_user(db, user_id)
+        return len(rows)
+
+    return with_retry(db, op)
+
+# ---- Reset ----
+
+# Ordem de remoção: dependentes antes de buckets/users
+USER_TABLES = (Bill, MovementRollup, CategoryRollup, Movement, Category, BalanceSnapshot, BalanceEvent, Giant, Bucket)
+
+def reset_user(router, user_id: int) -> None:
+    # Apaga os dados e o cadastro de um usuário só. Com shards é remover o arquivo dele; no banco
+    # único (SQLite/Postgres) são DELETEs filtrados por user_id (pelos índices), numa transação só.
+    tables = () if router.drop(user_id) else USER_TABLES
+
+    def op(db: Session):
+        for model in tables:
+            db.query(model).filter(model.user_id == user_id).delete(synchronize_session=False)
+        db.query(User).filter(User.id == user_id).delete(synchronize_session=False)
+
+    with router.session() as db:
+        with_retry(db, op)
@@ -0,0 +1,147 @@
+from datetime import date
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+from money import to_cents
+
+# Estratégias de quitação. Todas pagam primeiro as parcelas mínimas; o que sobra do orçamento
+# vai inteiro para o primeiro gigante ativo na ordem da estratégia (e transborda para o próximo).
+# Gigantes quitados liberam a parcela deles para os demais (rollover), pois o orçamento é fixo.
+STRATEGIES = ("avalanche", "snowball", "priority")
+STRATEGY_LABELS = {"avalanche": "Avalanche (maior juro)", "snowball": "Bola de neve (menor saldo)", "priority": "Prioridade"}
+
+MAX_MONTHS = 600
+EPS = 0.5  # meio centavo
+
+def _order(giants: Sequence, strategy: str) -> List[int]:
+    idx = range(len(giants))
+    if strategy == "avalanche":
+        return sorted(idx, key=lambda i: (-(giants[i].interest_rate or 0.0), to_cents(giants[i].total_to_pay), i))
+    if strategy == "snowball":
+        return sorted(idx, key=lambda i: (to_cents(giants[i].total_to_pay), -(giants[i].interest_rate or 0.0), i))
+    if strategy == "priority":
+        return sorted(idx, key=lambda i: (giants[i].priority, -to_cents(giants[i].total_to_pay), i))
+    raise ValueError(f"Estratégia desconhecida: {strategy}")
+
+def _allocate(avail: np.ndarray, need: np.ndarray) -> np.ndarray:
+    # Distribui "avail" (S,B) sobre "need" (S,B,G) na ordem do último eixo, sem laço em Python
+    before = np.cumsum(need, axis=-1) - need
+    return np.clip(avail[..., None] - before, 0.0, need)
+
+def simulate(giants: Sequence, budgets, strategies: Sequence[str] = STRATEGIES,
+             max_months: int = MAX_MONTHS, keep_schedule: bool = False) -> Dict:
+    # Vetorizado em (estratégia, orçamento, gigante); o laço é só sobre os meses.
+    # Valores em centavos (float). Orçamentos em reais (aceita Decimal/float).
+    # Usa de cada gigante: status, total_to_pay, interest_rate, months_left, priority, id e name
+    giants = [g for g in giants if g.status == "active"]
+    budgets_c = np.asarray([to_cents(b) for b in np.atleast_1d(budgets).tolist()], dtype=float)
+    S, B, G = len(strategies), len(budgets_c), len(giants)
+    out = {
+        "strategies": list(strategies),
+        "budgets": budgets_c / 100.0,
+        "giant_ids": [],
+        "payoff_month": np.full((S, B, 0), -1),
+        "months_to_freedom": np.zeros((S, B), dtype=int),
+        "total_interest": np.zeros((S, B)),
+        "total_paid": np.zeros((S, B)),
+        "schedule": None,
+    }
+    if G == 0:
+        return out
+
+    orders = np.array([_order(giants, s) for s in strategies])  # (S,G): posição -> índice do gigante
+    principal = np.array([to_cents(g.total_to_pay) for g in giants], dtype=float)
+    rate = np.array([(g.interest_rate or 0.0) / 100.0 for g in giants])
+    # Parcela mínima: saldo dividido pelos meses restantes (sem prazo = sem mínimo).
+    # Giant.parcels (nº original de parcelas) não entra: months_left já diz quanto falta
+    min_pay = np.array([principal[i] / g.months_left if (g.months_left or 0) > 0 else 0.0 for i, g in enumerate(giants)])
+
+    # Cenários achatados em linhas (S*B, G), já na ordem de cada estratégia
+    N = S * B
+    bal = np.repeat(principal[orders], B, axis=0)
+    r = np.repeat(rate[orders], B, axis=0)
+    mins = np.repeat(min_pay[orders], B, axis=0)
+    budget = np.tile(budgets_c, S)
+
+    payoff = np.full((N, G), -1)
+    interest = np.zeros(N)
+    paid = np.zeros(N)
+    # Sem quitação garantida: se menor_juro * saldo com juros > orçamento, esse saldo só cresce
+    r_min = rate[rate > 0].min() if (rate > 0).any() else 0.0
+    live = np.arange(N)
+    schedule = [] if keep_schedule else None
+
+    for month in range(1, max_months + 1):
+        # Só os cenários ainda em andamento entram na conta do mês
+        b, rr, lb = bal[live], r[live], budget[live]
+        active = b > EPS
+        accrued = b * rr
+        b += accrued
+        interest[live] += accrued.sum(axis=-1)
+
+        pay_min = _allocate(lb, np.minimum(mins[live], b) * active)
+        b -= pay_min
+        pay_extra = _allocate(lb - pay_min.sum(axis=-1), np.where(b > EPS, b, 0.0))
+        b -= pay_extra
+        pay = pay_min + pay_extra
+        paid[live] += pay.sum(axis=-1)
+
+        done = active & (b <= EPS)
+        b[b <= EPS] = 0.0
+        bal[live] = b
+        p = payoff[live]
+        p[done] = month
+        payoff[live] = p
+        if keep_schedule:
+            full = np.zeros((N, G))
+            full[live] = pay
+            schedule.append((full.reshape(S, B, G), bal.reshape(S, B, G).copy()))
+
+        keep = (b > EPS).any(axis=-1)
+        if r_min > 0:
+            keep &= (b * (rr > 0)).sum(axis=-1) * r_min <= lb
+        live = live[keep]
+        if live.size == 0:
+            break
+
+    payoff = payoff.reshape(S, B, G)
+    interest = interest.reshape(S, B)
+    paid = paid.reshape(S, B)
+
+    # Volta da ordem da estratégia para a ordem original dos gigantes
+    inv = np.argsort(orders, axis=1)
+    payoff_orig = np.take_along_axis(payoff, inv[:, None, :], axis=-1)
+    all_paid = (payoff_orig >= 0).all(axis=-1)
+    out.update({
+        "giant_ids": [g.id for g in giants],
+        "giant_names": [g.name for g in giants],
+        "payoff_month": payoff_orig,
+        "months_to_freedom": np.where(all_paid, payoff_orig.max(axis=-1), -1),
+        # Sem quitação no horizonte: juros/total pago não fazem sentido
+        "total_interest": np.where(all_paid, interest / 100.0, np.nan),
+        "total_paid": np.where(all_paid, paid / 100.0, np.nan),
+    })
+    if keep_schedule:
+        out["schedule"] = [
+            (np.take_along_axis(p, inv[:, None, :], axis=-1) / 100.0, np.take_along_axis(b, inv[:, None, :], axis=-1) / 100.0)
+            for p, b in schedule
+        ]
+    return out
+
+def schedule_rows(result: Dict, strategy: str, budget_index: int = 0, start: Optional[date] = None) -> List[Dict]:
+    # Cronograma mês a mês de uma estratégia/orçamento (requer keep_schedule=True)
+    from dateutil.relativedelta import relativedelta
+
+    s = result["strategies"].index(strategy)
+    start = start or date.today().replace(day=1)
+    rows = []
+    for m, (pay, bal) in enumerate(result["schedule"] or [], start=1):
+        for gi, name in enumerate(result["giant_names"]):
+            if pay[s, budget_index, gi] > 0 or bal[s, budget_index, gi] > 0:
+                rows.append({
+                    "month": m,
+                    "date": start + relativedelta(months=m),
+                    "giant": name,
+                    "payment": float(pay[s, budget_index, gi]),
+                    "balance": float(bal[s, budget_index, gi]),
+                })
+    return rows
@@ -0,0 +1,68 @@
+import threading
+from decimal import Decimal
+from sqlalchemy import select
+from sqlalchemy.orm import sessionmaker
+import migrations
+import services
+from db import make_engine
+from models import Bucket, User
+
+THREADS = 8
+OPS = 40
+
+def test_concurrent_apply_delta_keeps_balance(tmp_path):
+    engine = make_engine(f"sqlite:///{tmp_path / 'd.db'}")
+    migrations.upgrade(engine)
+    Session = sessionmaker(bind=engine)
+    with Session() as db:
+        user = User(name="teste")
+        db.add(user)
+        db.commit()
+        user_id = user.id
+        bucket_id = services.create_bucket(db, user_id, "Operacional", 100).id
+        services.with_retry(db, lambda db: services.apply_delta(db, user_id, bucket_id, Decimal("50.00")))
+
+    # Metade das threads deposita, metade saca (com check_funds) mais do que entra: parte dos saques é recusada
+    applied = [Decimal("0")] * THREADS
+    errors = []
+    done = threading.Event()
+    seen = []
+
+    def worker(n: int) -> None:
+        delta = Decimal("3.00") if n % 2 == 0 else Decimal("-7.00")
+        try:
+            with Session() as db:
+                for _ in range(OPS):
+                    try:
+                        services.with_retry(db, lambda db: services.apply_delta(db, user_id, bucket_id, delta, check_funds=True))
+                    except services.InsufficientFunds:
+                        continue
+                    applied[n] += delta
+        except Exception as e:  # falha de lock etc.: o teste não pode passar calado
+            errors.append(e)
+
+    def watch() -> None:
+        with Session() as db:
+            while not done.is_set():
+                seen.append(db.execute(select(Bucket.balance).where(Bucket.id == bucket_id)).scalar_one())
+                db.rollback()
+
+    watcher = threading.Thread(target=watch)
+    watcher.start()
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(THREADS)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    done.set()
+    watcher.join()
+
+    assert not errors
+    with Session() as db:
+        final = db.execute(select(Bucket.balance).where(Bucket.id == bucket_id)).scalar_one()
+    assert final == Decimal("50.00") + sum(applied)
+    assert final >= 0
+    assert seen and min(seen) >= 0
+    assert sum(a for a in applied if a < 0) < 0  # houve saques aceitos
+    assert sum(a for a in applied if a < 0) > -Decimal("7.00") * OPS * (THREADS // 2)  # e saques recusados
+    engine.dispose()
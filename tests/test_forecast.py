@@ -0,0 +1,28 @@
+from datetime import date, timedelta
+from decimal import Decimal
+from sqlalchemy.orm import sessionmaker
+import forecast
+import migrations
+import services
+from db import make_engine
+from models import User
+from money import to_cents
+
+def test_income_profile_ignores_transfers(tmp_path):
+    engine = make_engine(f"sqlite:///{tmp_path / 'f.db'}")
+    migrations.upgrade(engine)
+    with sessionmaker(bind=engine)() as db:
+        user = User(name="teste")
+        db.add(user)
+        db.commit()
+        a = services.create_bucket(db, user.id, "Operacional", 60)
+        b = services.create_bucket(db, user.id, "Ataque", 40)
+        today = date(2026, 3, 2)  # segunda-feira
+        monday = today - timedelta(days=7)
+        services.post_income_split(db, user.id, [a, b], Decimal("700.00"), monday)
+        services.transfer(db, user.id, a.id, b.id, Decimal("300.00"), monday)
+
+        profile = forecast.income_profile(db, user.id, today=today, days=7)
+        assert profile[monday.weekday()] == to_cents(Decimal("700.00"))
+        assert profile.sum() == to_cents(Decimal("700.00"))
+    engine.dispose()